@@ -1,29 +1,21 @@
 import os
 import logging
-from flask import Flask, render_template, redirect, url_for, flash, jsonify, session, request, make_response
-from flask_login import LoginManager, current_user, login_required, login_user, logout_user
+import threading
+import time
+from flask import Flask, render_template, jsonify, request, current_app
+from flask.cli import with_appcontext
+from flask_login import LoginManager, current_user, login_required
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import click
 from datetime import datetime, timedelta
 import urllib.parse
-import sqlalchemy as sa
 import gzip
 from io import BytesIO
-import functools
-from flask_session import Session
-# Import the caching extension
-from flask_caching import Cache  
-from flask_compress import Compress
-from flask_wtf.csrf import CSRFProtect
+from monitoring.metrics import InstrumentedCache, record_gzip_saving
+from monitoring.tracing import span
 from models.db import get_db, init_db
-from models.user import User, init_user_table
-from routes.auth import auth_bp
-from routes.quizzes import quizzes_bp
-from routes.analytics import analytics_bp
-from routes.admin import admin_bp
-from routes.api import api_bp
-from routes.kobayashi import kobayashi_bp
+from models.user import User
 
 # Load environment variables
 load_dotenv()
@@ -68,118 +60,204 @@ def clear_cache_by_pattern(cache, pattern):
     except Exception as e:
         logger.error(f"Error clearing cache by pattern: {e}")
 
-# Create and configure the app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
-app.config['DATABASE'] = {
-    'host': os.getenv('DBHOST', 'localhost'),
-    'port': int(os.getenv('DBPORT', 3306)),
-    'user': os.getenv('DBUSER', 'root'),
-    'password': os.getenv('DBPASSWORD', ''),
-    'database': os.getenv('DBNAME', 'badgey')
-}
-
-# Redis cache configuration
-redis_host = os.getenv('REDIS_HOST', 'localhost')
-redis_port = int(os.getenv('REDIS_PORT', 6379))
-redis_password = os.getenv('REDIS_PASSWORD', '')
-redis_db = int(os.getenv('REDIS_DB', 0))
-
-logger.info(f"Redis configuration: host={redis_host}, port={redis_port}, db={redis_db}, password={'set' if redis_password else 'not set'}")
-
-app.config['CACHE_TYPE'] = 'redis'
-app.config['CACHE_REDIS_HOST'] = redis_host
-app.config['CACHE_REDIS_PORT'] = redis_port
-app.config['CACHE_REDIS_PASSWORD'] = redis_password
-app.config['CACHE_REDIS_DB'] = redis_db
-app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes default
-app.config['CACHE_KEY_PREFIX'] = 'badgey_'  # Add prefix to avoid collisions
-app.config['CACHE_OPTIONS'] = {'socket_timeout': 5}  # Increase timeout
-
-# Initialize the Flask-Caching extension
-try:
-    cache = Cache(app)
-    logger.info("Flask-Caching extension initialized successfully")
-    
-    # Make cache available directly from app
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+
+def configure_app(app):
+    """Load configuration from the environment into app.config."""
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
+    app.config['DATABASE'] = {
+        'host': os.getenv('DBHOST', 'localhost'),
+        'port': int(os.getenv('DBPORT', 3306)),
+        'user': os.getenv('DBUSER', 'root'),
+        'password': os.getenv('DBPASSWORD', ''),
+        'database': os.getenv('DBNAME', 'badgey')
+    }
+
+    # Redis cache configuration
+    redis_host = os.getenv('REDIS_HOST', 'localhost')
+    redis_port = int(os.getenv('REDIS_PORT', 6379))
+    redis_password = os.getenv('REDIS_PASSWORD', '')
+    redis_db = int(os.getenv('REDIS_DB', 0))
+
+    logger.info(f"Redis configuration: host={redis_host}, port={redis_port}, db={redis_db}, password={'set' if redis_password else 'not set'}")
+
+    app.config['CACHE_TYPE'] = 'redis'
+    app.config['CACHE_REDIS_HOST'] = redis_host
+    app.config['CACHE_REDIS_PORT'] = redis_port
+    app.config['CACHE_REDIS_PASSWORD'] = redis_password
+    app.config['CACHE_REDIS_DB'] = redis_db
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes default
+    app.config['CACHE_KEY_PREFIX'] = 'badgey_'  # Add prefix to avoid collisions
+    app.config['CACHE_OPTIONS'] = {'socket_timeout': 5}  # Increase timeout
+
+    # Configure session settings
+    app.config['SESSION_COOKIE_NAME'] = 'session'
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+    app.config['SESSION_COOKIE_SECURE'] = os.getenv('FLASK_ENV') == 'production'
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+
+    # List of keys to exclude from session storage (to reduce size)
+    app.config['SESSION_EXCLUDE_KEYS'] = ['large_data', 'temp_data', '_csrf_token']
+
+    app.config['DISCORD_CLIENT_ID'] = os.getenv('DISCORD_CLIENT_ID')
+    app.config['DISCORD_CLIENT_SECRET'] = os.getenv('DISCORD_CLIENT_SECRET')
+    app.config['DISCORD_REDIRECT_URI'] = os.getenv('DISCORD_REDIRECT_URI')
+
+    # Requests issuing more queries or spending longer in the database than
+    # this are logged with their slowest statements
+    app.config['SQL_QUERY_COUNT_BUDGET'] = int(os.getenv('SQL_QUERY_COUNT_BUDGET', 30))
+    app.config['SQL_QUERY_TIME_BUDGET_MS'] = float(os.getenv('SQL_QUERY_TIME_BUDGET_MS', 500))
+
+    # Bearer token required to scrape /metrics (unset = open endpoint)
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN') or None
+
+    # Requests slower than this keep their span trace for /admin/traces
+    app.config['TRACE_SLOW_MS'] = float(os.getenv('TRACE_SLOW_MS', 250))
+
+    # Apply pending schema migrations on the first request of each worker.
+    # Disable when migrations are run out of band (flask init-db, release step).
+    app.config['MIGRATE_ON_FIRST_REQUEST'] = os.getenv('MIGRATE_ON_FIRST_REQUEST', '1') == '1'
+
+def init_cache(app):
+    """Attach the Flask-Caching extension to the app.
+
+    Creating the Redis-backed cache does not open a connection; the
+    connectivity probe runs later in run_startup_tasks.
+    """
+    try:
+        cache = InstrumentedCache(app)
+        logger.info("Flask-Caching extension initialized successfully")
+    except Exception as e:
+        logger.error(f"Error initializing cache: {e}", exc_info=True)
+        cache = _fallback_cache(app)
+
+    # DO NOT add cache to extensions dict - this causes problems with flask-caching internals
+    # Make cache available directly from app instead
     app.cache = cache
-    
-    # Test if cache is working
-    test_key = 'cache_test'
-    test_value = 'test_value'
-    cache.set(test_key, test_value, timeout=10)
-    retrieved = cache.get(test_key)
-    
-    if retrieved == test_value:
-        logger.info("Redis cache connection test successful")
-    else:
-        logger.warning(f"Redis cache test failed. Expected {test_value}, got {retrieved}")
-except Exception as e:
-    logger.error(f"Error initializing cache: {e}", exc_info=True)
-    # Fallback to simple cache if Redis fails
+    return cache
+
+def _fallback_cache(app):
+    """Replace the configured cache with an in-process SimpleCache."""
     app.config['CACHE_TYPE'] = 'SimpleCache'
-    cache = Cache(app)
-    # Make cache available directly from app
-    app.cache = cache
+    cache = InstrumentedCache(app)
     logger.info("Falling back to SimpleCache due to Redis initialization failure")
+    return cache
 
-# DO NOT add cache to extensions dict - this causes problems with flask-caching internals
-# Just leave it as a module-level variable that can be imported directly
-
-# Session configuration
-# You have two options:
-
-# Option 1: Use built-in cookie-based sessions (simpler, but doesn't use dashboard_sessions table)
-#app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-#app.config['SESSION_COOKIE_SECURE'] = os.getenv('FLASK_ENV') == 'production'
-#app.config['SESSION_COOKIE_HTTPONLY'] = True
-#app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-
-# Option 2: Use custom database sessions that work with your dashboard_sessions schema
-# Create SQLAlchemy engine for session storage
-username = urllib.parse.quote_plus(app.config['DATABASE']['user'])
-password = urllib.parse.quote_plus(app.config['DATABASE']['password'])
-host = app.config['DATABASE']['host']
-port = app.config['DATABASE']['port']
-database = app.config['DATABASE']['database']
-engine_url = f"mysql+pymysql://{username}:{password}@{host}:{port}/{database}"
-
-# Configure session settings
-app.config['SESSION_COOKIE_NAME'] = 'session'
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-app.config['SESSION_COOKIE_SECURE'] = os.getenv('FLASK_ENV') == 'production'
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-
-# List of keys to exclude from session storage (to reduce size)
-app.config['SESSION_EXCLUDE_KEYS'] = ['large_data', 'temp_data', '_csrf_token']
-
-# Create the database engine (without models, just for raw SQL)
-db = sa.create_engine(engine_url)
-
-# Import and use our custom session interface
-from custom_session import CustomSqlAlchemySessionInterface
-app.session_interface = CustomSqlAlchemySessionInterface(
-    db=db,
-    redis_host=app.config['CACHE_REDIS_HOST'],
-    redis_port=app.config['CACHE_REDIS_PORT'],
-    redis_password=app.config['CACHE_REDIS_PASSWORD'],
-    redis_db=app.config['CACHE_REDIS_DB']
-)
+def probe_cache(app):
+    """Round-trip a test key through the cache, falling back to SimpleCache on failure."""
+    test_key = 'cache_test'
+    test_value = 'test_value'
+    try:
+        app.cache.set(test_key, test_value, timeout=10)
+        retrieved = app.cache.get(test_key)
+        if retrieved == test_value:
+            logger.info("Redis cache connection test successful")
+        else:
+            logger.warning(f"Redis cache test failed. Expected {test_value}, got {retrieved}")
+    except Exception as e:
+        logger.error(f"Error probing cache: {e}")
+        app.cache = _fallback_cache(app)
+
+def init_session_interface(app):
+    """Install the database-backed session interface.
 
-app.config['DISCORD_CLIENT_ID'] = os.getenv('DISCORD_CLIENT_ID')
-app.config['DISCORD_CLIENT_SECRET'] = os.getenv('DISCORD_CLIENT_SECRET')
-app.config['DISCORD_REDIRECT_URI'] = os.getenv('DISCORD_REDIRECT_URI')
+    Uses custom database sessions that work with the dashboard_sessions schema.
+    SQLAlchemy engines connect lazily, so building one here is cheap.
+    """
+    import sqlalchemy as sa
+    from custom_session import CustomSqlAlchemySessionInterface
+    from monitoring.queries import install_engine_instrumentation
+    from monitoring.metrics import install_engine_pool_metrics
+
+    username = urllib.parse.quote_plus(app.config['DATABASE']['user'])
+    password = urllib.parse.quote_plus(app.config['DATABASE']['password'])
+    host = app.config['DATABASE']['host']
+    port = app.config['DATABASE']['port']
+    database = app.config['DATABASE']['database']
+    engine_url = f"mysql+pymysql://{username}:{password}@{host}:{port}/{database}"
+
+    # Create the database engine (without models, just for raw SQL)
+    app.db_engine = sa.create_engine(engine_url)
+    install_engine_instrumentation(app.db_engine)
+    install_engine_pool_metrics(app.db_engine)
+
+    app.session_interface = CustomSqlAlchemySessionInterface(
+        db=app.db_engine,
+        redis_host=app.config['CACHE_REDIS_HOST'],
+        redis_port=app.config['CACHE_REDIS_PORT'],
+        redis_password=app.config['CACHE_REDIS_PASSWORD'],
+        redis_db=app.config['CACHE_REDIS_DB']
+    )
 
-# For handling proxy headers
-app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+def reset_after_fork(app):
+    """Discard connections inherited from a preloading parent process.
+
+    Called from the gunicorn post_fork hook. The MySQL pool, the SQLAlchemy
+    engine and the Redis clients are all rebuilt lazily in the worker.
+    """
+    from models.db import reset_pool_after_fork
+    from redis_utils import reset_redis_after_fork
+    reset_pool_after_fork()
+    reset_redis_after_fork()
+
+    # close=False leaves the parent's sockets alone and just forgets them
+    app.db_engine.dispose(close=False)
+    app.session_interface.reset_after_fork()
+
+    backend = getattr(app.cache, 'cache', None)
+    for attr in ('_write_client', '_read_client'):
+        pool = getattr(getattr(backend, attr, None), 'connection_pool', None)
+        if pool is not None:
+            pool.reset()
+
+# Startup work that needs the network runs once per process, on first use
+_startup_lock = threading.Lock()
+STARTUP_RETRY_INTERVAL = 30  # seconds between attempts after a failed init_db()
+
+def run_startup_tasks(app):
+    """Probe the cache and apply pending migrations, once per process.
+
+    Returns:
+        bool: True once startup has completed. False while another request
+              is running it or while a failed attempt is backing off; the
+              caller should answer 503 rather than serve a half-migrated schema.
+    """
+    if getattr(app, '_startup_done', False):
+        return True
+    if time.time() < getattr(app, '_startup_retry_at', 0):
+        return False
+    # Never queue requests behind a slow attempt (e.g. a MySQL connect timeout)
+    if not _startup_lock.acquire(blocking=False):
+        return False
+    try:
+        if getattr(app, '_startup_done', False):
+            return True
+        if not getattr(app, '_cache_probed', False):
+            probe_cache(app)
+            app._cache_probed = True
+        if app.config.get('MIGRATE_ON_FIRST_REQUEST', True):
+            with app.app_context():
+                try:
+                    init_db()
+                    logger.info("Database initialized")
+                except Exception as e:
+                    app._startup_retry_at = time.time() + STARTUP_RETRY_INTERVAL
+                    logger.error(f"Deferred database initialization failed, retrying in {STARTUP_RETRY_INTERVAL}s: {e}")
+                    return False
+        app._startup_done = True
+        return True
+    finally:
+        _startup_lock.release()
 
-# Add Jinja filters
-@app.template_filter('datetime')
 def format_datetime(value, format='%Y-%m-%d %H:%M'):
     """Format a datetime object."""
     if value is None:
         return ""
+    if isinstance(value, (int, float)):
+        # Unix timestamps, as stored by the monitoring buffers
+        value = datetime.fromtimestamp(value)
     if isinstance(value, str):
         try:
             value = datetime.fromisoformat(value.replace('Z', '+00:00'))
@@ -187,9 +265,7 @@ def format_datetime(value, format='%Y-%m-%d %H:%M'):
             return value
     return value.strftime(format)
 
-# Apply decorators in correct order - cache headers first, then compression
 # Add browser caching headers for static content
-@app.after_request
 def add_cache_headers(response):
     # Only add cache headers if response has a status_code attribute
     if not hasattr(response, 'status_code'):
@@ -217,7 +293,6 @@ def add_cache_headers(response):
     return response
 
 # Apply gzip compression to all responses - but skip static files
-@app.after_request
 def apply_gzip_compression(response):
     # Skip compression for static files completely
     if request.path.startswith(('/static/', '/assets/')):
@@ -244,50 +319,33 @@ def apply_gzip_compression(response):
         
     try:
         # Compress the response
+        original_data = response.get_data()
         gzip_buffer = BytesIO()
-        with gzip.GzipFile(mode='wb', fileobj=gzip_buffer) as gzip_file:
-            gzip_file.write(response.get_data())
+        with span('gzip'), gzip.GzipFile(mode='wb', fileobj=gzip_buffer) as gzip_file:
+            gzip_file.write(original_data)
         
         # Update response with compressed data
         response.set_data(gzip_buffer.getvalue())
+        record_gzip_saving(len(original_data), len(gzip_buffer.getvalue()))
         response.headers['Content-Encoding'] = 'gzip'
         response.headers['Content-Length'] = len(response.get_data())
         response.headers['Vary'] = 'Accept-Encoding'
     except Exception as e:
         # If compression fails for any reason, log it and return the original response
-        app.logger.error(f"Error compressing response: {e}")
+        current_app.logger.error(f"Error compressing response: {e}")
     
     return response
 
-# Initialize login manager
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
-
-# Initialize database
-with app.app_context():
-    init_db()
-    logger.info("Database initialized")
-
-# Register blueprints
-app.register_blueprint(auth_bp)
-app.register_blueprint(quizzes_bp)
-app.register_blueprint(analytics_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(api_bp, url_prefix='/api')
-app.register_blueprint(kobayashi_bp)
-
 @login_manager.user_loader
 def load_user(user_id):
     """Load the user from the database."""
-    return User.get_by_id(int(user_id))
+    with span('load_user'):
+        return User.get_by_id(int(user_id))
 
-@app.route('/')
 def index():
     """Render the homepage."""
     return render_template('index.html')
 
-@app.route('/dashboard')
 @login_required
 def dashboard():
     """Render the dashboard page."""
@@ -398,30 +456,185 @@ def dashboard():
         user_quizzes=user_quizzes
     )
 
-@app.route('/health')
 def health_check():
     """Health check endpoint for Docker."""
     return jsonify(status="healthy"), 200
 
-@app.errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors."""
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
 def internal_server_error(e):
     """Handle 500 errors."""
     logger.error(f"Internal server error: {e}")
     return render_template('errors/500.html'), 500
 
-@app.cli.command('init-db')
+@click.command('init-db')
+@with_appcontext
 def init_db_command():
-    """Clear the existing data and create new tables."""
-    with app.app_context():
-        init_db()
+    """Apply pending schema migrations to create or upgrade the tables."""
+    from models.migrations import ensure_indexes
+    init_db()
+    for table, index_name, columns in ensure_indexes():
+        click.echo(f"Warning: index {table}.{index_name} ({', '.join(columns)}) is missing", err=True)
     click.echo('Initialized the database.')
 
+@click.command('refresh-transitions')
+@click.option('--rebuild', is_flag=True, help='Drop the matrix and rebuild it from all player choices.')
+@with_appcontext
+def refresh_transitions_command(rebuild):
+    """Fold new Kobayashi player choices into the choice transition matrix."""
+    from models.choice_transitions import rebuild_transitions, refresh_transitions
+    processed = rebuild_transitions() if rebuild else refresh_transitions()
+    if processed < 0:
+        click.echo('Another refresh is running.', err=True)
+    else:
+        click.echo(f'Folded {processed} player choices into the transition matrix.')
+
+@click.command('refresh-kobayashi-snapshot')
+@with_appcontext
+def refresh_kobayashi_snapshot_command():
+    """Rebuild the precomputed Kobayashi analytics snapshot."""
+    from models.kobayashi_snapshot import build_snapshot
+    snapshot = build_snapshot()
+    click.echo(f"Built the Kobayashi analytics snapshot at watermark {snapshot['watermark']}.")
+
+@click.command('refresh-distinct-counters')
+@click.option('--audit', is_flag=True, help='Compare each estimate with an exact COUNT(DISTINCT).')
+@with_appcontext
+def refresh_distinct_counters_command(audit):
+    """Ingest new rows into the distinct-user HyperLogLogs."""
+    from models.distinct_counters import SOURCES, distinct_users, refresh_counters
+    ingested = refresh_counters()
+    if ingested is None:
+        click.echo('Redis is unavailable or another ingestion is running.', err=True)
+    else:
+        for source_name, count in ingested.items():
+            if count is None:
+                click.echo(f'{source_name}: skipped or failed, see the log.', err=True)
+            else:
+                click.echo(f'{source_name}: ingested {count} rows.')
+    if audit:
+        for source_name in SOURCES:
+            estimate = distinct_users(source_name)
+            exact = distinct_users(source_name, exact=True)
+            error = abs(estimate - exact) / exact * 100 if exact else 0
+            click.echo(f'{source_name}: estimate {estimate}, exact {exact} ({error:.2f}% error)')
+
+@click.command('refresh-tribble-rollups')
+@click.option('--rebuild', is_flag=True, help='Recompute every bucket, including outcomes recorded late.')
+@with_appcontext
+def refresh_tribble_rollups_command(rebuild):
+    """Roll tribble drop outcomes up into hourly, daily and weekly buckets."""
+    from models.tribble_rollups import refresh_rollups
+    chunks = refresh_rollups(rebuild=rebuild)
+    if chunks < 0:
+        click.echo('Another refresh is running.', err=True)
+    else:
+        click.echo(f'Rolled up {chunks} span(s) of tribble drops.')
+
+@click.command('explore-story')
+@click.argument('story_id', type=int)
+@with_appcontext
+def explore_story_command(story_id):
+    """Explore every path of a Kobayashi story and cache the full report."""
+    from models.story_explorer import MAX_STATES, get_story_exploration
+    report = get_story_exploration(story_id, max_states=MAX_STATES, refresh=True)
+    click.echo(f"Explored story {story_id}: {report['state_count']} states, {report['total_paths']} paths, "
+               f"{len(report['endings'])} endings in {report['elapsed_ms']} ms"
+               f"{' (truncated)' if report['truncated'] else ''}.")
+
+def register_blueprints(app):
+    """Import and register the route blueprints."""
+    from routes.auth import auth_bp
+    from routes.quizzes import quizzes_bp
+    from routes.analytics import analytics_bp
+    from routes.admin import admin_bp
+    from routes.api import api_bp
+    from routes.kobayashi import kobayashi_bp
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(quizzes_bp)
+    app.register_blueprint(analytics_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(kobayashi_bp)
+
+def create_app():
+    """Create and configure the Flask application.
+
+    Building the app performs no network I/O. The Redis probe and schema
+    migrations are deferred to run_startup_tasks (first request) or to
+    `flask init-db`, so gunicorn workers boot quickly.
+    """
+    app = Flask(__name__)
+    configure_app(app)
+    init_cache(app)
+    init_session_interface(app)
+
+    # For handling proxy headers
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+
+    # Add Jinja filters
+    app.add_template_filter(format_datetime, 'datetime')
+
+    @app.before_request
+    def ensure_started():
+        # Health checks must answer even while the database is unreachable
+        if request.endpoint == 'health_check':
+            return None
+        if not run_startup_tasks(app):
+            return 'Service is starting, please retry shortly.', 503, {'Retry-After': str(STARTUP_RETRY_INTERVAL)}
+
+    # Apply decorators in correct order - cache headers first, then compression
+    app.after_request(add_cache_headers)
+    app.after_request(apply_gzip_compression)
+
+    # Each app context shares one pooled MySQL connection, returned at teardown
+    from models.db import init_app as init_db_pool
+    init_db_pool(app)
+
+    # Initialize login manager
+    login_manager.init_app(app)
+
+    # Per-request SQL counts and timings (Server-Timing header for admins)
+    from monitoring import queries, metrics
+    queries.init_app(app)
+
+    # Prometheus /metrics endpoint and request latency histograms
+    metrics.init_app(app)
+
+    # Rolling request log behind the admin performance report
+    from monitoring import report
+    report.init_app(app)
+
+    # Admin-only ?_profile=1 sampling profiler
+    from monitoring import profiler
+    profiler.init_app(app)
+
+    # Correlation ids and per-phase spans; registered last so the view span is tight
+    from monitoring import tracing
+    tracing.init_app(app)
+
+    register_blueprints(app)
+
+    app.add_url_rule('/', 'index', index)
+    app.add_url_rule('/dashboard', 'dashboard', dashboard)
+    app.add_url_rule('/health', 'health_check', health_check)
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(500, internal_server_error)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(refresh_transitions_command)
+    app.cli.add_command(explore_story_command)
+    app.cli.add_command(refresh_kobayashi_snapshot_command)
+    app.cli.add_command(refresh_distinct_counters_command)
+    app.cli.add_command(refresh_tribble_rollups_command)
+
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     # Use PORT environment variable if provided by hosting platform
     port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,175 @@
+"""
+EXPLAIN check for the hot analytics queries.
+
+Verifies that every index in models.migrations.ANALYTICS_INDEXES exists, then
+EXPLAINs the hot statements from routes/analytics.py, models/quiz.py,
+models/kobayashi_analytics.py and models/tribble_rollups.py and fails when any of them reads one of the
+large tables with a full table scan (EXPLAIN type ALL). Covering full index
+scans (type index) are accepted for whole-table aggregates.
+
+Run it against the benchmark stand-in after benchmarks/generate_data.py so
+the optimizer sees production-sized tables:
+
+    python benchmarks/explain_check.py
+
+Exits non-zero on a missing index or a full scan, so it can gate CI.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import seed  # noqa: E402
+from models.migrations import ANALYTICS_INDEXES, missing_indexes  # noqa: E402
+from models.tribble_rollups import BUCKET_SQL, COUNT_COLUMNS, OUTCOME_SQL  # noqa: E402
+
+# Tables large enough that a full scan is a regression
+GUARDED_TABLES = {table for table, _, _ in ANALYTICS_INDEXES}
+
+# (label, statement, parameter names); parameters are sampled from the data.
+# Guarded tables are written without aliases because EXPLAIN reports the alias.
+HOT_QUERIES = [
+    ('quiz.get_user_score',
+     "SELECT * FROM user_scores WHERE quiz_id = %s AND user_id = %s ORDER BY score DESC LIMIT 1",
+     ('quiz_id', 'user_id')),
+    ('quiz.attempt_count',
+     "SELECT COUNT(*) as count FROM user_scores WHERE quiz_id = %s",
+     ('quiz_id',)),
+    ('analytics.users_for_quiz',
+     "SELECT COUNT(DISTINCT user_id) as total FROM user_scores WHERE quiz_id = %s",
+     ('quiz_id',)),
+    ('analytics.attempts_today',
+     "SELECT COUNT(*) as count FROM user_scores WHERE completion_date >= CURDATE() "
+     "AND completion_date < CURDATE() + INTERVAL 1 DAY",
+     ()),
+    ('analytics.quiz_completions',
+     "SELECT DATE(completion_date) as date, COUNT(*) as count FROM user_scores "
+     "WHERE completion_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY) GROUP BY DATE(completion_date) ORDER BY date",
+     ()),
+    ('analytics.user_scores_by_user',
+     "SELECT quiz_id, score, completion_date FROM user_scores WHERE user_id = %s ORDER BY completion_date DESC",
+     ('user_id',)),
+    ('tribbles.event_drops',
+     "SELECT COUNT(*) as total FROM tribble_drops WHERE event_id = %s AND claimed_by IS NOT NULL",
+     ('event_id',)),
+    ('tribbles.top_hunters',
+     "SELECT claimed_by as user_id, COUNT(CASE WHEN is_escaped = 0 THEN message_id ELSE NULL END) as tribbles_caught, "
+     "SUM(CASE WHEN is_borg = 1 AND was_defeated = 1 THEN 1 ELSE 0 END) as borgs_defeated "
+     "FROM tribble_drops WHERE claimed_by IS NOT NULL GROUP BY claimed_by ORDER BY tribbles_caught DESC LIMIT 10",
+     ()),
+    ('tribbles.rollup_hours',
+     f"SELECT 'hour', {BUCKET_SQL['hour'].format(col='captured_at')}, COALESCE(event_id, 0), {OUTCOME_SQL} "
+     "FROM tribble_drops WHERE captured_at >= NOW() - INTERVAL 7 DAY AND captured_at < NOW() "
+     "GROUP BY 2, 3",
+     ()),
+    ('tribbles.rollup_activity',
+     f"SELECT bucket_start, {', '.join(f'SUM({column}) as `{column}`' for column in COUNT_COLUMNS)} "
+     "FROM dashboard_tribble_rollups WHERE resolution = 'hour' AND bucket_start >= NOW() - INTERVAL 48 HOUR "
+     "AND event_id = %s GROUP BY bucket_start ORDER BY bucket_start",
+     ('event_id',)),
+    ('kobayashi.user_common_choice',
+     "SELECT user_id, choice, node_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY COUNT(*) DESC) as choice_rank "
+     "FROM player_choices WHERE user_id IN (%s) GROUP BY user_id, choice, node_id",
+     ('user_id',)),
+    ('kobayashi.user_points',
+     "SELECT user_id, SUM(points) as total_points, COUNT(DISTINCT CASE WHEN points >= 10 THEN run_id END) as completed_runs "
+     "FROM user_points WHERE user_id IN (%s) GROUP BY user_id",
+     ('user_id',)),
+    ('kobayashi.node_choices',
+     "SELECT choice, COUNT(*) as choice_count FROM player_choices WHERE node_id = %s GROUP BY choice",
+     ('node_id',)),
+    ('kobayashi.run_choices',
+     "SELECT user_id, node_id FROM player_choices WHERE run_id = %s",
+     ('run_id',)),
+    ('kobayashi.total_runs',
+     "SELECT COUNT(DISTINCT run_id) FROM player_choices",
+     ()),
+    ('kobayashi.story_runs',
+     "SELECT story_code, COUNT(DISTINCT run_id) as total_runs, COUNT(DISTINCT user_id) as unique_users "
+     "FROM player_choices GROUP BY story_code",
+     ()),
+    ('kobayashi.story_completions',
+     "SELECT story_code, COUNT(DISTINCT CASE WHEN points >= 10 THEN run_id END) as completed_runs "
+     "FROM user_points GROUP BY story_code",
+     ()),
+    ('kobayashi.run_timeline',
+     "SELECT 'choice' as type, 0 as source_rank, id, user_id, node_id, choice, NULL as points, NULL as text, timestamp "
+     "FROM player_choices WHERE run_id = %s "
+     "UNION ALL SELECT 'custom_action', 1, id, user_id, node_id, NULL, NULL, text, submitted_at "
+     "FROM custom_actions WHERE run_id = %s "
+     "UNION ALL SELECT 'points', 2, id, user_id, NULL, NULL, points, NULL, timestamp "
+     "FROM user_points WHERE run_id = %s "
+     "ORDER BY timestamp, source_rank, id",
+     ('run_id', 'run_id', 'run_id')),
+    ('kobayashi.node_page',
+     "SELECT * FROM story_nodes WHERE story_id = %s AND id > %s ORDER BY id LIMIT 15",
+     ('story_id', 'node_id')),
+    ('admin.recent_logs',
+     "SELECT dashboard_logs.*, dashboard_users.username FROM dashboard_logs "
+     "LEFT JOIN dashboard_users ON dashboard_logs.user_id = dashboard_users.id "
+     "ORDER BY dashboard_logs.timestamp DESC LIMIT 100",
+     ()),
+]
+
+def sample_params(cursor):
+    """Pick parameter values from the data: the latest score row, event and run."""
+    params = {}
+    cursor.execute("SELECT quiz_id, user_id FROM user_scores ORDER BY id DESC LIMIT 1")
+    row = cursor.fetchone() or {}
+    params['quiz_id'] = row.get('quiz_id', 1)
+    params['user_id'] = row.get('user_id', '0')
+    cursor.execute("SELECT MAX(id) AS event_id FROM tribble_event")
+    params['event_id'] = (cursor.fetchone() or {}).get('event_id') or 1
+    cursor.execute("SELECT node_id, run_id FROM player_choices ORDER BY id DESC LIMIT 1")
+    row = cursor.fetchone() or {}
+    params['node_id'] = row.get('node_id', '')
+    params['run_id'] = row.get('run_id', '')
+    cursor.execute("SELECT story_id FROM story_nodes WHERE id = %s", (params['node_id'],))
+    params['story_id'] = (cursor.fetchone() or {}).get('story_id') or 1
+    return params
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skip-analyze', action='store_true', help='do not refresh table statistics first')
+    args = parser.parse_args(argv)
+
+    conn = seed.connect(seed.bench_db_config())
+    failures = []
+    try:
+        with conn.cursor() as cursor:
+            for table, index_name, columns in missing_indexes(cursor):
+                failures.append(f"missing index {table}.{index_name} ({', '.join(columns)})")
+
+            if not args.skip_analyze:
+                for table in sorted(GUARDED_TABLES):
+                    cursor.execute(f"ANALYZE TABLE {table}")
+                    cursor.fetchall()
+
+            params = sample_params(cursor)
+            for label, statement, names in HOT_QUERIES:
+                cursor.execute("EXPLAIN " + statement, tuple(params[n] for n in names))
+                plan = cursor.fetchall()
+                scans = [row for row in plan if row.get('table') in GUARDED_TABLES and row.get('type') == 'ALL']
+                status = 'FULL SCAN' if scans else 'ok'
+                print(f"{label:32} {status}")
+                for row in plan:
+                    print(f"    {row.get('table')}: type={row.get('type')} key={row.get('key')} "
+                          f"rows={row.get('rows')} extra={row.get('Extra') or ''}")
+                if scans:
+                    failures.append(f"{label} scans {', '.join(row['table'] for row in scans)}")
+    finally:
+        conn.close()
+
+    if failures:
+        print("FAIL:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""
+Scale-test data generator for the analytics tables.
+
+Fills user_scores, tribble_drops, tribble_scores, player_choices, user_points,
+custom_actions and dashboard_logs with millions of rows so the queries in
+routes/analytics.py and models/kobayashi_analytics.py can be measured at
+production size. Rows are generated as a stream and written in bounded
+chunks, so memory stays flat however many rows are requested.
+
+Distributions are skewed the way real activity is:
+  * users follow a Zipf-like curve (--skew): a few members produce most rows
+  * timestamps favour recent days and evening hours across --days
+  * quiz, story and tribble rarity popularity are uneven
+
+Usage:
+    python benchmarks/generate_data.py [--user-scores 1000000] [--runs 200000]
+        [--tribble-drops 1000000] [--days 365] [--users 20000] [--method load-data]
+
+Connection settings use the same BENCH_* variables as load_test.py. Dashboard
+migrations are applied and missing reference data (quizzes, stories, a
+dashboard user) is created with benchmarks/seed.py first.
+
+--method insert uses multi-row INSERTs; --method load-data streams each chunk
+through LOAD DATA LOCAL INFILE, which is several times faster but needs
+local_infile enabled on the server (the docker-compose stand-in has it).
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import seed  # noqa: E402
+
+CHUNK_SIZE = 20000
+MEMBER_ID_BASE = 100000000000000000
+
+# Relative activity per hour of day (UTC), busiest in the evening
+HOUR_WEIGHTS = [3, 2, 1, 1, 1, 1, 2, 3, 4, 5, 5, 6, 6, 6, 6, 7, 8, 9, 10, 10, 9, 8, 6, 4]
+LOG_ACTIONS = [('login', 50), ('view_quiz', 25), ('edit_quiz', 10), ('update_user_roles', 2),
+               ('clear_cache', 1), ('create_backup', 1), ('logout', 11)]
+
+class ZipfPicker:
+    """Draw items with weight 1/rank**skew using a precomputed cumulative table."""
+
+    def __init__(self, rng, items, skew):
+        self.rng = rng
+        self.items = items
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(len(items))))
+
+    def pick(self):
+        return self.items[bisect.bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+
+class TimeSampler:
+    """Timestamps within the last `days`, biased to recent days and busy hours."""
+
+    def __init__(self, rng, now, days):
+        self.rng = rng
+        self.now = now
+        self.days = days
+        self.cum_hours = list(itertools.accumulate(HOUR_WEIGHTS))
+
+    def sample(self):
+        # u**2 concentrates ages near zero: recent days are busier
+        day = int(self.days * self.rng.random() ** 2)
+        hour = bisect.bisect(self.cum_hours, self.rng.random() * self.cum_hours[-1])
+        midnight = (self.now - timedelta(days=day)).replace(hour=0, minute=0, second=0)
+        ts = midnight + timedelta(hours=hour, seconds=self.rng.randint(0, 3599))
+        return min(ts, self.now)
+
+class ChunkWriter:
+    """Buffer rows for one table and flush them with INSERT or LOAD DATA."""
+
+    def __init__(self, conn, table, columns, method):
+        self.conn = conn
+        self.table = table
+        self.columns = columns
+        self.method = method
+        self.rows = []
+        self.written = 0
+        self.started = time.time()
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        with self.conn.cursor() as cursor:
+            if self.method == 'load-data':
+                self._load_data(cursor)
+            else:
+                seed._insert(cursor, self.table, self.columns, self.rows)
+        self.conn.commit()
+        self.written += len(self.rows)
+        self.rows = []
+        rate = self.written / max(time.time() - self.started, 1e-6)
+        print(f"  {self.table}: {self.written:,} rows ({rate:,.0f} rows/s)", flush=True)
+
+    def _load_data(self, cursor):
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, encoding='utf-8') as f:
+            for row in self.rows:
+                f.write('\t'.join(_tsv_value(v) for v in row) + '\n')
+            path = f.name
+        try:
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {self.table} "
+                f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+                f"({', '.join(self.columns)})",
+                (path,)
+            )
+        finally:
+            os.unlink(path)
+
+def _tsv_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value).replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ')
+
+def ensure_reference_data(conn, users):
+    """Create seed data if missing and make sure `users` members exist."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS count FROM quizzes")
+        if cursor.fetchone()['count'] == 0:
+            print("Reference data missing; running benchmarks/seed.py first")
+            seed.seed(conn)
+    with conn.cursor() as cursor:
+        rows = [(str(MEMBER_ID_BASE + n), f"member{n}") for n in range(users)]
+        for i in range(0, len(rows), seed.BATCH_SIZE):
+            cursor.executemany("INSERT IGNORE INTO members (user_id, user_name) VALUES (%s, %s)",
+                               rows[i:i + seed.BATCH_SIZE])
+    conn.commit()
+    return [r[0] for r in rows]
+
+def generate_user_scores(conn, args, rng, users, times):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT quiz_id FROM quizzes ORDER BY quiz_id")
+        quizzes = ZipfPicker(rng, [r['quiz_id'] for r in cursor.fetchall()], 0.8)
+    writer = ChunkWriter(conn, 'user_scores', ('user_id', 'user_name', 'quiz_id', 'score', 'completion_date'), args.method)
+    for _ in range(args.user_scores):
+        user_id = users.pick()
+        writer.add((user_id, f"member{int(user_id) - MEMBER_ID_BASE}", quizzes.pick(),
+                    max(0, min(100, int(rng.gauss(65, 20)))) if rng.random() < 0.95 else 0, times.sample()))
+    writer.flush()
+    return {'user_scores': writer.written}
+
+def generate_tribbles(conn, args, rng, users, times):
+    now = times.now
+    event_length = timedelta(days=14)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(message_id), 700000000000000000) AS max_id FROM tribble_drops")
+        next_message_id = cursor.fetchone()['max_id'] + 1
+        # One two-week event per fortnight of the time span; the newest is active
+        events = []
+        start = now - timedelta(days=args.days)
+        while start < now:
+            end = start + event_length
+            cursor.execute(
+                "INSERT INTO tribble_event (event_name, start_time, end_time, active) VALUES (%s, %s, %s, %s)",
+                (f"Hunt {start:%Y-%m-%d}", start, end, int(end >= now))
+            )
+            events.append((start, cursor.lastrowid))
+            start = end
+    conn.commit()
+    event_starts = [s for s, _ in events]
+
+    drops = ChunkWriter(conn, 'tribble_drops',
+                        ('message_id', 'event_id', 'rarity', 'claimed_by', 'captured_at',
+                         'is_escaped', 'is_borg', 'was_defeated'), args.method)
+    for n in range(args.tribble_drops):
+        spawned = times.sample()
+        event_id = events[max(0, bisect.bisect(event_starts, spawned) - 1)][1]
+        is_borg = rng.random() < 0.05
+        roll = rng.random()
+        claimed = roll < 0.7
+        escaped = not claimed and roll < 0.9
+        defeated = is_borg and claimed and rng.random() < 0.4
+        drops.add((next_message_id + n, event_id, rng.choices([1, 2, 3, 4], weights=[60, 25, 10, 5])[0],
+                   users.pick() if claimed else None,
+                   spawned + timedelta(seconds=rng.randint(1, 600)) if claimed or escaped else None,
+                   int(escaped), int(is_borg), int(defeated)))
+    drops.flush()
+
+    scores = ChunkWriter(conn, 'tribble_scores', ('user_id', 'username', 'event_id', 'score'), args.method)
+    for _ in range(args.tribble_scores):
+        user_id = users.pick()
+        scores.add((user_id, f"member{int(user_id) - MEMBER_ID_BASE}", rng.choice(events)[1],
+                    int(rng.paretovariate(1.5) * 10)))
+    scores.flush()
+    return {'tribble_drops': drops.written, 'tribble_scores': scores.written}
+
+def generate_runs(conn, args, rng, users, times):
+    """Walk the story graphs to produce player_choices, user_points and custom_actions."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id, code FROM stories ORDER BY id")
+        stories = cursor.fetchall()
+        graphs = {}
+        for story in stories:
+            cursor.execute("SELECT id, choices FROM story_nodes WHERE story_id = %s ORDER BY id", (story['id'],))
+            nodes = cursor.fetchall()
+            graph = {}
+            for node in nodes:
+                try:
+                    choices = json.loads(node['choices'] or '{}')
+                    if isinstance(choices, str):
+                        choices = json.loads(choices)
+                except ValueError:
+                    choices = {}
+                graph[node['id']] = {k: c.get('next') for k, c in choices.items() if isinstance(c, dict)}
+            if nodes:
+                graphs[story['code']] = (nodes[0]['id'], graph)
+    story_picker = ZipfPicker(rng, sorted(graphs), 0.7)
+
+    choices = ChunkWriter(conn, 'player_choices', ('user_id', 'run_id', 'node_id', 'choice', 'timestamp'), args.method)
+    points = ChunkWriter(conn, 'user_points', ('user_id', 'run_id', 'points', 'timestamp'), args.method)
+    actions = ChunkWriter(conn, 'custom_actions',
+                          ('guild_id', 'node_id', 'run_id', 'user_id', 'text', 'submitted_at'), args.method)
+    run_offset = int(time.time())
+    for run in range(args.runs):
+        user_id = users.pick()
+        code = story_picker.pick()
+        start_node, graph = graphs[code]
+        run_id = f"{code}_{user_id}_{run_offset + run}"
+        ts = times.sample()
+        node_id = start_node
+        # Most runs are abandoned part way through
+        max_steps = len(graph) if rng.random() < 0.6 else rng.randint(1, 5)
+        for _ in range(max_steps):
+            options = graph.get(node_id)
+            if not options:
+                break
+            key = rng.choice(sorted(options))
+            choices.add((user_id, run_id, node_id, key, ts))
+            if rng.random() < 0.03:
+                actions.add(('800000000000000001', node_id, run_id, user_id, f"Custom action at {node_id}", ts))
+            node_id = options[key]
+            ts += timedelta(seconds=rng.randint(10, 300))
+        points.add((user_id, run_id, rng.randint(0, 20), ts))
+    for writer in (choices, points, actions):
+        writer.flush()
+    return {'player_choices': choices.written, 'user_points': points.written, 'custom_actions': actions.written}
+
+def generate_dashboard_logs(conn, args, rng, users, times):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM dashboard_users ORDER BY id")
+        dashboard_users = ZipfPicker(rng, [r['id'] for r in cursor.fetchall()], 1.0)
+    actions = [a for a, _ in LOG_ACTIONS]
+    cum_weights = list(itertools.accumulate(w for _, w in LOG_ACTIONS))
+    writer = ChunkWriter(conn, 'dashboard_logs', ('user_id', 'action', 'details', 'ip_address', 'timestamp'), args.method)
+    for _ in range(args.dashboard_logs):
+        action = rng.choices(actions, cum_weights=cum_weights)[0]
+        writer.add((dashboard_users.pick(), action, f"Synthetic {action}",
+                    f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}", times.sample()))
+    writer.flush()
+    return {'dashboard_logs': writer.written}
+
+GENERATORS = {
+    'user_scores': generate_user_scores,
+    'tribbles': generate_tribbles,
+    'runs': generate_runs,
+    'dashboard_logs': generate_dashboard_logs,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-scores', type=int, default=1_000_000)
+    parser.add_argument('--tribble-drops', type=int, default=1_000_000)
+    parser.add_argument('--tribble-scores', type=int, default=50_000)
+    parser.add_argument('--runs', type=int, default=200_000,
+                        help='story runs; each yields several player_choices rows')
+    parser.add_argument('--dashboard-logs', type=int, default=500_000)
+    parser.add_argument('--users', type=int, default=20_000, help='distinct members')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for user activity')
+    parser.add_argument('--days', type=int, default=365, help='time span covered by timestamps')
+    parser.add_argument('--method', choices=('insert', 'load-data'), default='insert')
+    parser.add_argument('--only', choices=sorted(GENERATORS), action='append',
+                        help='generate only these groups (repeatable)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    config = seed.bench_db_config()
+    seed.migrate(config)
+    conn = seed.connect(config, local_infile=args.method == 'load-data')
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    try:
+        member_ids = ensure_reference_data(conn, args.users)
+        users = ZipfPicker(rng, member_ids, args.skew)
+        times = TimeSampler(rng, now, args.days)
+
+        totals = {}
+        for name in args.only or GENERATORS:
+            print(f"Generating {name}...", flush=True)
+            totals.update(GENERATORS[name](conn, args, rng, users, times))
+    finally:
+        conn.close()
+
+    print(f"Done: {sum(totals.values()):,} rows")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
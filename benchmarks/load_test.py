@@ -0,0 +1,313 @@
+"""
+Load test against local MySQL and Redis stand-ins.
+
+`run` creates the schema, seeds a deterministic dataset (benchmarks/seed.py),
+mints an authenticated admin session, boots the app under gunicorn and drives
+the hot routes with concurrent clients. Throughput and per-route p50/p99
+latency are written to a JSON file named after the current commit.
+
+`compare` diffs two result files and exits non-zero when a route got slower
+by more than --threshold percent, so it can gate CI.
+
+Usage:
+    docker compose -f benchmarks/docker-compose.yml up -d
+    python benchmarks/load_test.py run [--clients 8] [--iterations 20] [--workers 2]
+    python benchmarks/load_test.py compare benchmarks/results/<base>.json benchmarks/results/<head>.json
+
+The stand-ins are configured with BENCH_DBHOST, BENCH_DBPORT, BENCH_DBUSER,
+BENCH_DBPASSWORD, BENCH_DBNAME, BENCH_REDIS_HOST and BENCH_REDIS_PORT
+(defaults match docker-compose.yml). The regular DB*/REDIS_* variables are
+deliberately ignored so a stray production environment is never seeded.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, ROOT)
+
+from benchmarks import seed  # noqa: E402
+
+# Hot routes; {quiz_id} is filled from the seeded quizzes
+ROUTES = [
+    ('dashboard', '/dashboard'),
+    ('quizzes.list', '/quizzes/'),
+    ('quizzes.view', '/quizzes/{quiz_id}'),
+    ('analytics.index', '/analytics/'),
+    ('analytics.quizzes', '/analytics/quizzes'),
+    ('analytics.users', '/analytics/users'),
+    ('analytics.tribbles', '/analytics/tribbles'),
+    ('analytics.api_summary', '/analytics/api/summary'),
+    ('analytics.api_user_activity', '/analytics/api/user_activity'),
+    ('kobayashi.analytics', '/kobayashi/analytics'),
+    ('api.quizzes', '/api/quizzes'),
+    ('api.quiz', '/api/quizzes/{quiz_id}'),
+    ('api.stats_user', '/api/stats/user'),
+    ('api.quiz_completions', '/api/quiz-completions'),
+]
+
+def standin_env():
+    """Environment for the app process, pointing at the stand-ins only."""
+    db_config = seed.bench_db_config()
+    env = dict(os.environ)
+    env.update({
+        'DBHOST': db_config['host'],
+        'DBPORT': str(db_config['port']),
+        'DBUSER': db_config['user'],
+        'DBPASSWORD': db_config['password'],
+        'DBNAME': db_config['database'],
+        'REDIS_HOST': os.getenv('BENCH_REDIS_HOST', '127.0.0.1'),
+        'REDIS_PORT': os.getenv('BENCH_REDIS_PORT', '6380'),
+        'REDIS_PASSWORD': '',
+        'SECRET_KEY': 'bench-secret',
+        'FLASK_ENV': 'development',
+    })
+    return env
+
+def prepare(scale, skip_seed):
+    """Migrate, seed and return (seed info, session cookie) for an admin user."""
+    os.environ.update(standin_env())
+    seed.migrate(seed.bench_db_config())
+    from app import app
+
+    conn = seed.connect(app.config['DATABASE'])
+    try:
+        if skip_seed:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id FROM dashboard_users WHERE username = 'bench-admin'")
+                row = cursor.fetchone()
+                cursor.execute("SELECT quiz_id FROM quizzes ORDER BY quiz_id")
+                quiz_ids = [r['quiz_id'] for r in cursor.fetchall()]
+            if not row or not quiz_ids:
+                raise SystemExit("--skip-seed given but the benchmark database is empty")
+            info = {'admin_user_id': row['id'], 'quiz_ids': quiz_ids}
+        else:
+            info = seed.seed(conn, scale=scale)
+    finally:
+        conn.close()
+
+    # Store a logged-in session through the app's own session interface
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(info['admin_user_id'])
+        sess['_fresh'] = True
+    cookie_name = app.config['SESSION_COOKIE_NAME']
+    if hasattr(client, 'get_cookie'):
+        cookie = client.get_cookie(cookie_name).value
+    else:
+        cookie = next(c.value for c in client.cookie_jar if c.name == cookie_name)
+    return info, cookie_name, cookie
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(workers):
+    """Boot gunicorn against the stand-ins and wait until /health answers."""
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ROOT, env=standin_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("gunicorn exited during startup")
+        try:
+            if requests.get(f'{base_url}/health', timeout=1).status_code == 200:
+                return proc, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("gunicorn did not become healthy within 60s")
+
+def run_client(base_url, cookie_name, cookie, plan, samples, lock):
+    """Issue every (route, path) in plan and append (route, ms, status) to samples."""
+    http = requests.Session()
+    http.cookies.set(cookie_name, cookie)
+    local = []
+    for route, path in plan:
+        start = time.perf_counter()
+        try:
+            status = http.get(base_url + path, allow_redirects=False, timeout=30).status_code
+        except requests.RequestException:
+            status = 0
+        local.append((route, (time.perf_counter() - start) * 1000, status))
+    with lock:
+        samples.extend(local)
+
+def build_plans(quiz_ids, clients, iterations, seed_value=7):
+    """One shuffled request list per client; identical across runs."""
+    rng = random.Random(seed_value)
+    plans = []
+    for _ in range(clients):
+        plan = []
+        for _ in range(iterations):
+            for route, template in ROUTES:
+                plan.append((route, template.format(quiz_id=rng.choice(quiz_ids))))
+        rng.shuffle(plan)
+        plans.append(plan)
+    return plans
+
+def summarize(samples, wall_seconds):
+    from monitoring.report import percentile
+    routes = {}
+    for route, ms, status in samples:
+        routes.setdefault(route, {'durations': [], 'errors': 0})
+        routes[route]['durations'].append(ms)
+        if status != 200:
+            routes[route]['errors'] += 1
+    summary = {}
+    for route, data in sorted(routes.items()):
+        durations = sorted(data['durations'])
+        summary[route] = {
+            'requests': len(durations),
+            'errors': data['errors'],
+            'p50_ms': round(percentile(durations, 50), 2),
+            'p99_ms': round(percentile(durations, 99), 2),
+            'mean_ms': round(statistics.mean(durations), 2),
+        }
+    all_durations = sorted(ms for _, ms, _ in samples)
+    overall = {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, status in samples if status != 200),
+        'wall_seconds': round(wall_seconds, 2),
+        'throughput_rps': round(len(samples) / wall_seconds, 1) if wall_seconds else 0.0,
+        'p50_ms': round(percentile(all_durations, 50), 2),
+        'p99_ms': round(percentile(all_durations, 99), 2),
+    }
+    return overall, summary
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def cmd_run(args):
+    info, cookie_name, cookie = prepare(args.scale, args.skip_seed)
+    proc, base_url = start_server(args.workers)
+    try:
+        plans = build_plans(info['quiz_ids'], args.clients, args.iterations)
+        # Warm caches and connection pools; not measured
+        run_client(base_url, cookie_name, cookie, plans[0][:len(ROUTES) * 2], [], threading.Lock())
+
+        samples, lock = [], threading.Lock()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            for plan in plans:
+                pool.submit(run_client, base_url, cookie_name, cookie, plan, samples, lock)
+        wall_seconds = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    overall, routes = summarize(samples, wall_seconds)
+    commit = _git('rev-parse', '--short', 'HEAD') or 'unknown'
+    result = {
+        'commit': commit,
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'config': {'clients': args.clients, 'iterations': args.iterations,
+                   'workers': args.workers, 'scale': args.scale},
+        'overall': overall,
+        'routes': routes,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{overall['requests']} requests in {overall['wall_seconds']}s: "
+          f"{overall['throughput_rps']} req/s, p50 {overall['p50_ms']} ms, p99 {overall['p99_ms']} ms, "
+          f"{overall['errors']} errors")
+    for route, stats in routes.items():
+        print(f"  {route:30} p50 {stats['p50_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  errors {stats['errors']}")
+    print(f"Results written to {output}")
+    return 1 if overall['errors'] else 0
+
+def _change(base, head):
+    return (head - base) * 100 / base if base else 0.0
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"base {base['commit']} vs head {head['commit']} (threshold {args.threshold:.0f}%)")
+    regressions = []
+    throughput_change = _change(base['overall']['throughput_rps'], head['overall']['throughput_rps'])
+    print(f"  throughput {base['overall']['throughput_rps']} -> {head['overall']['throughput_rps']} req/s "
+          f"({throughput_change:+.1f}%)")
+    if throughput_change < -args.threshold:
+        regressions.append('throughput')
+
+    for route in sorted(set(base['routes']) | set(head['routes'])):
+        if route not in base['routes'] or route not in head['routes']:
+            print(f"  {route:30} only in {'head' if route in head['routes'] else 'base'}")
+            continue
+        b, h = base['routes'][route], head['routes'][route]
+        flags = []
+        for metric in ('p50_ms', 'p99_ms'):
+            pct = _change(b[metric], h[metric])
+            # Ignore sub-millisecond noise on fast routes
+            if pct > args.threshold and h[metric] - b[metric] > args.min_ms:
+                flags.append(f"{metric[:3]} {pct:+.0f}%")
+        if h['errors'] > b['errors']:
+            flags.append(f"errors {b['errors']} -> {h['errors']}")
+        marker = 'REGRESSION ' + ', '.join(flags) if flags else ''
+        print(f"  {route:30} p50 {b['p50_ms']:7.1f} -> {h['p50_ms']:7.1f}  "
+              f"p99 {b['p99_ms']:7.1f} -> {h['p99_ms']:7.1f}  {marker}")
+        if flags:
+            regressions.append(route)
+
+    if regressions:
+        print(f"FAIL: {len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("OK")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='seed the stand-ins and drive the hot routes')
+    run.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    run.add_argument('--iterations', type=int, default=20, help='passes over the route list per client')
+    run.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    run.add_argument('--scale', type=int, default=1, help='dataset size multiplier')
+    run.add_argument('--skip-seed', action='store_true', help='reuse an already seeded database')
+    run.add_argument('--output', help='result file (default benchmarks/results/<commit>.json)')
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser('compare', help='flag regressions between two result files')
+    compare.add_argument('base')
+    compare.add_argument('head')
+    compare.add_argument('--threshold', type=float, default=10.0, help='allowed slowdown in percent')
+    compare.add_argument('--min-ms', type=float, default=2.0, help='ignore slowdowns smaller than this')
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
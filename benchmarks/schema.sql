@@ -0,0 +1,132 @@
+-- Bot-owned tables the dashboard reads but does not create.
+--
+-- The Discord bot owns these in production. This is a reconstruction from the
+-- columns the dashboard queries, used only to stand up a local benchmark
+-- database (see benchmarks/load_test.py). Dashboard tables (dashboard_users,
+-- dashboard_sessions, dashboard_logs) come from models/migrations.py.
+
+CREATE TABLE IF NOT EXISTS members (
+    user_id VARCHAR(32) PRIMARY KEY,
+    user_name VARCHAR(128)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS quizzes (
+    quiz_id INT PRIMARY KEY AUTO_INCREMENT,
+    quiz_name VARCHAR(255) NOT NULL,
+    creator_id VARCHAR(32),
+    creator_username VARCHAR(128),
+    question_limit INT,
+    start_date DATETIME,
+    end_date DATETIME,
+    creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS questions (
+    question_id INT PRIMARY KEY AUTO_INCREMENT,
+    quiz_id INT NOT NULL,
+    question TEXT NOT NULL,
+    options TEXT,
+    correct_answer VARCHAR(255),
+    explanation TEXT,
+    score INT DEFAULT 10,
+    KEY idx_questions_quiz (quiz_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS user_scores (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_id VARCHAR(32) NOT NULL,
+    user_name VARCHAR(128),
+    quiz_id INT NOT NULL,
+    score INT NOT NULL DEFAULT 0,
+    completion_date DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS quiz_scores (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_id VARCHAR(32) NOT NULL,
+    quiz_id INT NOT NULL,
+    score INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS site_settings (
+    id INT PRIMARY KEY,
+    site_title VARCHAR(255),
+    maintenance_mode TINYINT(1) DEFAULT 0,
+    allow_registration TINYINT(1) DEFAULT 1
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS tribble_event (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    event_name VARCHAR(255),
+    start_time DATETIME,
+    end_time DATETIME,
+    active TINYINT(1) DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS tribble_drops (
+    message_id BIGINT PRIMARY KEY,
+    event_id INT,
+    rarity TINYINT NOT NULL DEFAULT 1,
+    claimed_by VARCHAR(32),
+    captured_at DATETIME,
+    is_escaped TINYINT(1) NOT NULL DEFAULT 0,
+    is_borg TINYINT(1) NOT NULL DEFAULT 0,
+    was_defeated TINYINT(1) NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS tribble_scores (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_id VARCHAR(32) NOT NULL,
+    username VARCHAR(128),
+    event_id INT,
+    score INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS stories (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    title VARCHAR(255) NOT NULL,
+    intro TEXT,
+    code VARCHAR(32) NOT NULL,
+    author VARCHAR(128),
+    created_at DATETIME
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS story_nodes (
+    id VARCHAR(64) PRIMARY KEY,
+    story_id INT NOT NULL,
+    title VARCHAR(255),
+    description TEXT,
+    choices TEXT,
+    conditions TEXT,
+    is_terminal TINYINT(1) NOT NULL DEFAULT 0,
+    ending_type VARCHAR(64),
+    ending_text TEXT,
+    KEY idx_story_nodes_story (story_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS player_choices (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    user_id VARCHAR(32) NOT NULL,
+    run_id VARCHAR(64) NOT NULL,
+    node_id VARCHAR(64) NOT NULL,
+    choice VARCHAR(64) NOT NULL,
+    timestamp DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS user_points (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    user_id VARCHAR(32) NOT NULL,
+    run_id VARCHAR(64) NOT NULL,
+    points INT NOT NULL DEFAULT 0,
+    timestamp DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS custom_actions (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    guild_id VARCHAR(32),
+    node_id VARCHAR(64),
+    run_id VARCHAR(64),
+    user_id VARCHAR(32),
+    text TEXT,
+    submitted_at DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
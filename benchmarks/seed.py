@@ -0,0 +1,255 @@
+"""
+Deterministic synthetic dataset for the load-test benchmark.
+
+Creates the bot-owned tables from benchmarks/schema.sql and fills them with a
+small, reproducible dataset: members, quizzes with questions and scores,
+three Kobayashi stories (ids 1-3, codes KOBA, TITEN and KHAN) with branching
+node graphs and player runs, and a tribble event with drops. Activity is
+skewed towards a few heavy users, as it is in production.
+
+Everything is generated from a seeded random.Random, so two runs at the same
+scale produce identical rows.
+"""
+
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import pymysql
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+BATCH_SIZE = 1000
+
+STORIES = [
+    (1, 'Kobayashi Maru', 'KOBA'),
+    (2, 'Titan Rescue', 'TITEN'),
+    (3, 'Wrath of Khan', 'KHAN'),
+]
+
+def bench_db_config():
+    """Stand-in database settings from BENCH_* variables (defaults match docker-compose.yml).
+
+    The regular DB* variables are deliberately ignored so a stray production
+    environment is never seeded.
+    """
+    return {
+        'host': os.getenv('BENCH_DBHOST', '127.0.0.1'),
+        'port': int(os.getenv('BENCH_DBPORT', '3307')),
+        'user': os.getenv('BENCH_DBUSER', 'root'),
+        'password': os.getenv('BENCH_DBPASSWORD', 'bench'),
+        'database': os.getenv('BENCH_DBNAME', 'badgey_bench'),
+    }
+
+def connect(db_config, **kwargs):
+    """Open a pymysql connection from an app-style DATABASE dict."""
+    return pymysql.connect(
+        host=db_config['host'],
+        port=int(db_config['port']),
+        user=db_config['user'],
+        password=db_config['password'],
+        database=db_config['database'],
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor,
+        autocommit=False,
+        **kwargs
+    )
+
+def migrate(db_config):
+    """Create the bot tables, then run the app's own migrations and index checks.
+
+    The bot tables come first so the analytics index migration finds them.
+    """
+    conn = connect(db_config)
+    try:
+        apply_schema(conn)
+    finally:
+        conn.close()
+
+    os.environ.update({
+        'DBHOST': db_config['host'],
+        'DBPORT': str(db_config['port']),
+        'DBUSER': db_config['user'],
+        'DBPASSWORD': db_config['password'],
+        'DBNAME': db_config['database'],
+    })
+    from app import app
+    from models.migrations import ensure_indexes, run_migrations
+    with app.app_context():
+        run_migrations()
+        ensure_indexes()
+
+def apply_schema(conn):
+    """Create the bot-owned tables if they are missing."""
+    with open(SCHEMA_PATH) as f:
+        script = f.read()
+    statements = [s.strip() for s in script.split(';')]
+    with conn.cursor() as cursor:
+        for statement in statements:
+            lines = [l for l in statement.splitlines() if not l.lstrip().startswith('--')]
+            if any(l.strip() for l in lines):
+                cursor.execute('\n'.join(lines))
+    conn.commit()
+
+def _insert(cursor, table, columns, rows):
+    """Insert rows in multi-row batches (pymysql rewrites executemany into one INSERT)."""
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    for i in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(sql, rows[i:i + BATCH_SIZE])
+
+def _skewed(rng, items, count):
+    """Pick `count` items with a 1/rank weighting so early items dominate."""
+    weights = [1.0 / (rank + 1) for rank in range(len(items))]
+    return rng.choices(items, weights=weights, k=count)
+
+def _story_graph(rng, code, node_count):
+    """Build a layered branching story: every node offers two or three choices."""
+    prefix = code.lower()
+    node_ids = [f"{prefix}_{n:03d}" for n in range(node_count)]
+    terminal_from = int(node_count * 0.8)
+    nodes = []
+    for n, node_id in enumerate(node_ids):
+        is_terminal = n >= terminal_from
+        choices = {}
+        if not is_terminal:
+            for c in range(rng.randint(2, 3)):
+                target = rng.randint(n + 1, min(node_count - 1, n + 6))
+                choice = {'text': f"Option {c + 1}", 'next': node_ids[target], 'flags_required': []}
+                if rng.random() < 0.2:
+                    choice['flags_set'] = [f"flag_{rng.randint(1, 5)}"]
+                choices[f"choice_{c + 1}"] = choice
+        conditions = [{'flag': f"flag_{rng.randint(1, 5)}"}] if rng.random() < 0.1 else []
+        nodes.append({
+            'id': node_id,
+            'title': f"{code} scene {n}",
+            'description': f"Synthetic scene {n} of story {code}.",
+            'choices': choices,
+            'conditions': conditions,
+            'is_terminal': int(is_terminal),
+            'ending_type': rng.choice(['victory', 'defeat', 'draw']) if is_terminal else None,
+            'ending_text': f"Ending {n}" if is_terminal else None,
+        })
+    return nodes
+
+def seed(conn, scale=1, seed_value=42, now=None):
+    """Fill an empty benchmark database.
+
+    Args:
+        conn: pymysql connection with DictCursor
+        scale (int): Multiplier for row counts (1 is roughly 50k rows)
+        seed_value (int): Random seed
+        now (datetime): Reference time for generated timestamps
+
+    Returns:
+        dict: Ids the load test needs (admin_user_id, quiz_ids, story_ids)
+    """
+    rng = random.Random(seed_value)
+    now = now or datetime.utcnow().replace(microsecond=0)
+
+    def recent(days):
+        return now - timedelta(seconds=rng.randint(0, days * 24 * 3600))
+
+    member_ids = [str(100000000000000000 + n) for n in range(200 * scale)]
+    member_names = {m: f"member{n}" for n, m in enumerate(member_ids)}
+    quiz_count = 20 * scale
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO dashboard_users (discord_id, username, roles) VALUES (%s, %s, %s)",
+            ('900000000000000001', 'bench-admin', json.dumps(['admin']))
+        )
+        admin_user_id = cursor.lastrowid
+
+        _insert(cursor, 'members', ('user_id', 'user_name'),
+                list(member_names.items()))
+
+        _insert(cursor, 'quizzes',
+                ('quiz_id', 'quiz_name', 'creator_id', 'creator_username', 'question_limit', 'creation_date'),
+                [(q, f"Quiz {q}", '900000000000000001', 'bench-admin', 10, recent(180))
+                 for q in range(1, quiz_count + 1)])
+        quiz_ids = list(range(1, quiz_count + 1))
+
+        questions = []
+        for quiz_id in quiz_ids:
+            for n in range(10):
+                options = {k: f"Answer {k} to question {n}" for k in 'ABCD'}
+                questions.append((quiz_id, f"Question {n} of quiz {quiz_id}?", json.dumps(options),
+                                  rng.choice('ABCD'), f"Explanation {n}", rng.choice([5, 10, 20])))
+        _insert(cursor, 'questions',
+                ('quiz_id', 'question', 'options', 'correct_answer', 'explanation', 'score'), questions)
+
+        scores = []
+        for user_id in _skewed(rng, member_ids, 5000 * scale):
+            scores.append((user_id, member_names[user_id], rng.choice(quiz_ids),
+                           rng.randint(0, 100), recent(60)))
+        _insert(cursor, 'user_scores', ('user_id', 'user_name', 'quiz_id', 'score', 'completion_date'), scores)
+
+        story_nodes = {}
+        for story_id, title, code in STORIES:
+            cursor.execute(
+                "INSERT INTO stories (id, title, intro, code, author, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+                (story_id, title, f"Intro to {title}", code, 'bench-admin', recent(365))
+            )
+            nodes = _story_graph(rng, code, 40)
+            story_nodes[code] = nodes
+            _insert(cursor, 'story_nodes',
+                    ('story_id', 'id', 'title', 'description', 'choices', 'conditions',
+                     'is_terminal', 'ending_type', 'ending_text'),
+                    [(story_id, n['id'], n['title'], n['description'], json.dumps(n['choices']),
+                      json.dumps(n['conditions']), n['is_terminal'], n['ending_type'], n['ending_text'])
+                     for n in nodes])
+
+        choices, points, actions = [], [], []
+        for run, user_id in enumerate(_skewed(rng, member_ids, 1500 * scale)):
+            code = rng.choice(STORIES)[2]
+            run_id = f"{code}_{user_id}_{run}"
+            nodes = {n['id']: n for n in story_nodes[code]}
+            node = story_nodes[code][0]
+            started = recent(90)
+            step = 0
+            while node and node['choices']:
+                key = rng.choice(sorted(node['choices']))
+                choices.append((user_id, run_id, node['id'], key, started + timedelta(minutes=step)))
+                if rng.random() < 0.05:
+                    actions.append(('800000000000000001', node['id'], run_id, user_id,
+                                    f"Custom action at {node['id']}", started + timedelta(minutes=step)))
+                node = nodes.get(node['choices'][key]['next'])
+                step += 1
+            points.append((user_id, run_id, rng.randint(0, 20), started + timedelta(minutes=step)))
+        _insert(cursor, 'player_choices', ('user_id', 'run_id', 'node_id', 'choice', 'timestamp'), choices)
+        _insert(cursor, 'user_points', ('user_id', 'run_id', 'points', 'timestamp'), points)
+        _insert(cursor, 'custom_actions',
+                ('guild_id', 'node_id', 'run_id', 'user_id', 'text', 'submitted_at'), actions)
+
+        cursor.execute(
+            "INSERT INTO tribble_event (event_name, start_time, end_time, active) VALUES (%s, %s, %s, 1)",
+            ('Bench Hunt', now - timedelta(days=2), now + timedelta(days=5))
+        )
+        event_id = cursor.lastrowid
+        drops = []
+        hunters = _skewed(rng, member_ids, 5000 * scale)
+        for n in range(5000 * scale):
+            claimed = rng.random() < 0.7
+            escaped = not claimed and rng.random() < 0.5
+            drops.append((
+                700000000000000000 + n, event_id, rng.choices([1, 2, 3, 4], weights=[60, 25, 10, 5])[0],
+                hunters[n] if claimed else None,
+                recent(2) if claimed or escaped else None,
+                int(escaped), int(rng.random() < 0.05), 0
+            ))
+        _insert(cursor, 'tribble_drops',
+                ('message_id', 'event_id', 'rarity', 'claimed_by', 'captured_at',
+                 'is_escaped', 'is_borg', 'was_defeated'), drops)
+        _insert(cursor, 'tribble_scores', ('user_id', 'username', 'event_id', 'score'),
+                [(m, member_names[m], event_id, rng.randint(0, 500)) for m in member_ids[:100]])
+
+        _insert(cursor, 'dashboard_logs', ('user_id', 'action', 'details', 'ip_address', 'timestamp'),
+                [(admin_user_id, 'login', 'Synthetic log entry', '127.0.0.1', recent(30)) for _ in range(500 * scale)])
+
+    conn.commit()
+    return {
+        'admin_user_id': admin_user_id,
+        'quiz_ids': quiz_ids,
+        'story_ids': [s[0] for s in STORIES],
+    }
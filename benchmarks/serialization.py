@@ -0,0 +1,144 @@
+"""
+Micro-benchmarks for serialization on hot paths.
+
+Covers the work every request or cache hit repeats:
+
+  session.*           pickling the session dict (Redis stores the pickle, MySQL its base64)
+  quiz_list.*         quizzes list cache: serialize_quiz_data + json.dumps and the reverse
+  question.from_dict  rebuilding a Question from a cached dict
+  question.init       Question.__init__ parsing options from the JSON column
+  kobayashi.*         decode_json_field on canonical and legacy double-encoded node choices
+
+Fixtures are fixed, so numbers are comparable across commits on the same
+machine. Each case is auto-ranged to run for about 0.2s per repeat with the
+garbage collector disabled; the median of --repeat repeats is reported.
+
+Usage:
+    python benchmarks/serialization.py [--repeat 7] [--filter quiz] [--json out.json]
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from custom_session import CustomSqlAlchemySessionInterface  # noqa: E402
+from models.question import Question  # noqa: E402
+from models.story_graph import decode_json_field  # noqa: E402
+from models.quiz import Quiz  # noqa: E402
+from routes.quizzes import deserialize_quiz_data, serialize_quiz_data  # noqa: E402
+
+QUIZ_COUNT = 50
+
+def session_fixture():
+    """A logged-in session as flask-login and the OAuth flow leave it."""
+    return {
+        '_user_id': '42',
+        '_fresh': True,
+        '_id': 'f' * 128,
+        '_permanent': True,
+        'csrf_token': 'c' * 40,
+        'oauth2_state': 's' * 30,
+        'discord_token': {'access_token': 'a' * 30, 'token_type': 'Bearer', 'expires_in': 604800,
+                          'refresh_token': 'r' * 30, 'scope': ['identify', 'email', 'guilds']},
+        '_flashes': [('success', 'Quiz updated successfully!')],
+    }
+
+def quizzes_fixture():
+    quizzes = []
+    for n in range(1, QUIZ_COUNT + 1):
+        quiz = Quiz(
+            id=n, name=f"Starfleet Academy Quiz {n}", creator_id='123456789012345678',
+            created_at=datetime(2024, 1, 1, 12, 0, 0), creator_username='captain',
+            question_limit=10
+        )
+        quiz.question_count = 10
+        quiz.total_points = 100
+        quizzes.append(quiz)
+    return quizzes
+
+def question_fixture():
+    options = {k: f"Answer {k}: the {k.lower()} option text" for k in 'ABCD'}
+    return {
+        'id': 7, 'quiz_id': 3, 'text': 'Which ship did Kirk command?',
+        'options': options, 'correct_answer': 'A', 'score': 10,
+        'explanation': 'The USS Enterprise, NCC-1701.',
+    }
+
+def choices_fixture():
+    return {
+        f"choice_{n}": {'text': f"Option {n}", 'next': f"node_{n + 10}",
+                        'flags_required': ['shields_up'], 'flags_set': [f"flag_{n}"]}
+        for n in range(1, 4)
+    }
+
+def build_cases():
+    """Return {name: zero-argument callable} over fixed fixtures."""
+    serializer = CustomSqlAlchemySessionInterface.serializer
+    session = session_fixture()
+    pickled = serializer.dumps(session)
+    encoded = base64.b64encode(pickled).decode('utf-8')
+
+    quizzes = quizzes_fixture()
+    cached_quizzes = json.dumps(serialize_quiz_data(quizzes))
+
+    question = question_fixture()
+    options_json = json.dumps(question['options'])
+
+    choices_once = json.dumps(choices_fixture())
+    choices_twice = json.dumps(choices_once)
+
+    return {
+        'session.dumps': lambda: serializer.dumps(session),
+        'session.loads': lambda: serializer.loads(pickled),
+        'session.dumps_b64': lambda: base64.b64encode(serializer.dumps(session)).decode('utf-8'),
+        'session.loads_b64': lambda: serializer.loads(base64.b64decode(encoded)),
+        'quiz_list.serialize': lambda: json.dumps(serialize_quiz_data(quizzes)),
+        'quiz_list.deserialize': lambda: deserialize_quiz_data(json.loads(cached_quizzes)),
+        'question.from_dict': lambda: Question.from_dict(question),
+        'question.init': lambda: Question(
+            question['id'], question['quiz_id'], question['text'], options_json,
+            question['correct_answer'], question['score'], question['explanation']
+        ),
+        'kobayashi.choices_once': lambda: decode_json_field(choices_once, {}),
+        'kobayashi.choices_twice': lambda: decode_json_field(choices_twice, {}),
+    }
+
+def measure(func, repeat):
+    """Median and min seconds per call over `repeat` auto-ranged repeats."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    # autorange targets 0.2s; the first repeat doubles as warm-up
+    runs = [t / number for t in timer.repeat(repeat=repeat + 1, number=number)[1:]]
+    return statistics.median(runs), min(runs), number
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--filter', help='only run cases whose name contains this')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, func in build_cases().items():
+        if args.filter and args.filter not in name:
+            continue
+        median, best, number = measure(func, args.repeat)
+        results[name] = {'median_us': round(median * 1e6, 3), 'min_us': round(best * 1e6, 3), 'loops': number}
+        print(f"{name:28} {median * 1e6:10.2f} us  (min {best * 1e6:.2f} us, {number} loops x {args.repeat})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Worker boot benchmark.
+
+Imports app.py in fresh interpreters (the same work a gunicorn worker does
+without --preload) and checks that:
+
+  * the median import time stays under STARTUP_BUDGET_MS, and
+  * importing the app opens no network connections (Redis, MySQL, ...).
+
+Usage:
+    python benchmarks/startup_time.py [--runs 5] [--budget-ms 1500]
+
+Exits non-zero when either check fails, so it can gate CI.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter: count outbound connections, time the import
+CHILD_SCRIPT = r"""
+import json, socket, sys, time
+connects = []
+_orig_connect = socket.socket.connect
+def _guard(self, address):
+    connects.append(repr(address))
+    return _orig_connect(self, address)
+socket.socket.connect = _guard
+start = time.perf_counter()
+import app
+elapsed_ms = (time.perf_counter() - start) * 1000
+sys.stdout.write('\n' + json.dumps({'elapsed_ms': elapsed_ms, 'connects': connects}))
+"""
+
+def measure_once():
+    """Import the app in a fresh interpreter and return its measurement dict."""
+    env = dict(os.environ)
+    # Point at unroutable endpoints so an accidental connect shows up as a failure
+    env.setdefault('DBHOST', '127.0.0.1')
+    env.setdefault('DBPORT', '1')
+    env.setdefault('REDIS_HOST', '127.0.0.1')
+    env.setdefault('REDIS_PORT', '1')
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('STARTUP_BUDGET_MS', 1500)))
+    args = parser.parse_args(argv)
+
+    samples = [measure_once() for _ in range(args.runs)]
+    timings = [s['elapsed_ms'] for s in samples]
+    connects = sorted({c for s in samples for c in s['connects']})
+    median_ms = statistics.median(timings)
+
+    print(f"app import: median {median_ms:.1f} ms, min {min(timings):.1f} ms, "
+          f"max {max(timings):.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        print(f"FAIL: median boot time {median_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    if connects:
+        print(f"FAIL: importing app opened network connections: {', '.join(connects)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
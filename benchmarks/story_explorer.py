@@ -0,0 +1,95 @@
+"""
+Story explorer benchmark.
+
+Builds deterministic synthetic Kobayashi stories (layered, with choices that
+reconverge on shared nodes and flags that gate later choices), compiles them
+with models.story_graph and times models.story_explorer.explore_graph.
+
+Usage:
+    python benchmarks/story_explorer.py [--nodes 500] [--runs 5] [--budget-ms 1000]
+
+Exits non-zero when the median exploration time of the largest story
+exceeds the budget, so it can gate CI.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models.story_explorer import MAX_STATES, explore_graph  # noqa: E402
+from models.story_graph import compile_graph  # noqa: E402
+
+LAYER_WIDTH = 10
+CHOICES_PER_NODE = 3
+FLAG_NAMES = ('shields', 'cloak', 'hailed', 'damaged')
+
+def build_story(node_count, seed=42):
+    """Return story_nodes-like rows for a layered story with reconvergent choices."""
+    rng = random.Random(seed)
+    layers = [[f"n{i}" for i in range(start, min(start + LAYER_WIDTH, node_count - 1))]
+              for start in range(1, node_count - 1, LAYER_WIDTH)]
+    rows = [{'id': 'n0', 'title': 'Start', 'choices': {}, 'conditions': [], 'is_terminal': 0}]
+    rows[0]['choices'] = {
+        f"c{k}": {'text': f"Choice {k}", 'next': node_id}
+        for k, node_id in enumerate(layers[0][:CHOICES_PER_NODE])
+    }
+    for depth, layer in enumerate(layers):
+        next_layer = layers[depth + 1] if depth + 1 < len(layers) else [f"n{node_count - 1}"]
+        for node_id in layer:
+            choices = {}
+            for k, target in enumerate(rng.sample(next_layer, min(CHOICES_PER_NODE, len(next_layer)))):
+                choice = {'text': f"Choice {k}", 'next': target}
+                if rng.random() < 0.3:
+                    choice['flags_set'] = [rng.choice(FLAG_NAMES)]
+                if rng.random() < 0.1:
+                    choice['flags_required'] = [rng.choice(FLAG_NAMES)]
+                choices[f"c{k}"] = choice
+            rows.append({'id': node_id, 'title': node_id, 'choices': choices,
+                         'conditions': [], 'is_terminal': 0})
+    rows.append({'id': f"n{node_count - 1}", 'title': 'End', 'choices': {}, 'conditions': [],
+                 'is_terminal': 1, 'ending_type': 'survived'})
+    for row in rows:
+        row['choices'] = json.dumps(row['choices'])
+        row['conditions'] = json.dumps(row['conditions'])
+    return rows
+
+def measure(node_count, runs):
+    graph = compile_graph(0, build_story(node_count))
+    timings = []
+    report = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        report = explore_graph(graph, max_states=MAX_STATES)
+        timings.append((time.perf_counter() - start) * 1000)
+    return report, timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=500, help='Largest story size (smaller sizes are also timed)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    args = parser.parse_args(argv)
+
+    median_ms = 0.0
+    for node_count in sorted({max(10, args.nodes // 5), args.nodes}):
+        report, timings = measure(node_count, args.runs)
+        median_ms = statistics.median(timings)
+        print(f"{node_count} nodes: {report['state_count']} states, {report['total_paths']} paths, "
+              f"median {median_ms:.1f} ms, max {max(timings):.1f} ms over {args.runs} runs"
+              f"{' (truncated)' if report['truncated'] else ''}")
+
+    if median_ms > args.budget_ms:
+        print(f"FAIL: median exploration time {median_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
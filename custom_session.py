@@ -14,6 +14,8 @@ from werkzeug.datastructures import CallbackDict
 from flask_login import current_user
 from uuid import uuid4
 from itsdangerous.url_safe import URLSafeSerializer
+from monitoring.metrics import record_session_load
+from monitoring.tracing import span
 
 # Create a standard logger instead of using current_app.logger
 logger = logging.getLogger(__name__)
@@ -120,8 +122,16 @@ class CustomSqlAlchemySessionInterface(SessionInterface):
             self.redis = None
             return None
         
+    def reset_after_fork(self):
+        """Drop the Redis client so a forked worker opens its own connections."""
+        self.redis = None
+        
     def open_session(self, app, request):
         """Open a session from the request."""
+        with span('session.open'):
+            return self._open_session(app, request)
+
+    def _open_session(self, app, request):
         cookie_name = app.config.get('SESSION_COOKIE_NAME', 'session')
         sid = request.cookies.get(cookie_name)
         
@@ -131,6 +141,7 @@ class CustomSqlAlchemySessionInterface(SessionInterface):
             # No session ID, create a new session
             new_sid = self._generate_sid()
             app.logger.debug(f"No session ID found, creating new session: {new_sid}")
+            record_session_load('new')
             return self.session_class(sid=new_sid, permanent=True)
         
         if self.use_signer:
@@ -142,10 +153,12 @@ class CustomSqlAlchemySessionInterface(SessionInterface):
             except BadSignature:
                 new_sid = self._generate_sid()
                 app.logger.debug(f"Bad signature, creating new session: {new_sid}")
+                record_session_load('new')
                 return self.session_class(sid=new_sid, permanent=True)
             except Exception as e:
                 app.logger.error(f"Error checking session signature: {e}")
                 new_sid = self._generate_sid()
+                record_session_load('new')
                 return self.session_class(sid=new_sid, permanent=True)
         
         # Try to get session from Redis cache first
@@ -156,6 +169,7 @@ class CustomSqlAlchemySessionInterface(SessionInterface):
                 if cached_data:
                     app.logger.debug(f"Session found in Redis cache: {sid}")
                     session_data = self.serializer.loads(cached_data)
+                    record_session_load('redis')
                     return self.session_class(session_data, sid=sid, permanent=True)
             except Exception as e:
                 app.logger.error(f"Error fetching session from Redis: {e}")
@@ -190,6 +204,7 @@ class CustomSqlAlchemySessionInterface(SessionInterface):
                         except Exception as e:
                             app.logger.error(f"Error caching session in Redis: {e}")
                     
+                    record_session_load('mysql')
                     return self.session_class(session_data, sid=sid, permanent=True)
                 except Exception as e:
                     app.logger.error(f"Error deserializing session data: {e}")
@@ -200,10 +215,15 @@ class CustomSqlAlchemySessionInterface(SessionInterface):
         # If we get here, either the session doesn't exist or is expired
         new_sid = self._generate_sid()
         app.logger.debug(f"Creating new session due to load failure: {new_sid}")
+        record_session_load('new')
         return self.session_class(sid=new_sid, permanent=True)
     
     def save_session(self, app, session, response):
         """Save the session to the database."""
+        with span('session.save'):
+            return self._save_session(app, session, response)
+
+    def _save_session(self, app, session, response):
         domain = self.get_cookie_domain(app)
         path = self.get_cookie_path(app)
         cookie_name = app.config.get('SESSION_COOKIE_NAME', 'session')
@@ -1,8 +1,9 @@
-import mysql.connector
 from flask import current_app, g
 
 def get_db_connection():
     if 'db' not in g:
+        # Imported lazily: mysql.connector is slow to import and rarely used
+        import mysql.connector
         g.db = mysql.connector.connect(
             host=current_app.config['DATABASE']['host'],
             port=current_app.config['DATABASE']['port'],
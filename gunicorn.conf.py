@@ -0,0 +1,95 @@
+"""
+Gunicorn configuration for the dashboard.
+
+Gunicorn loads this file automatically from the working directory; it can
+also be passed explicitly with `gunicorn -c gunicorn.conf.py app:app`.
+
+Preloading
+----------
+With preload_app the master imports app.py once and forks workers from it,
+so the interpreter, Flask, SQLAlchemy, Jinja templates and route modules are
+shared copy-on-write instead of being loaded again in every worker. That cuts
+both per-worker memory and rolling-restart time.
+
+Preloading is only safe because nothing in the master keeps live sockets
+across fork():
+
+  * on_starting runs the one-shot startup work (cache probe, schema
+    migrations) in the master, then closes every connection it opened.
+  * post_fork calls app.reset_after_fork in each worker, which forgets any
+    inherited MySQL pool entries, SQLAlchemy engine connections and Redis
+    clients so the worker opens its own.
+
+Measuring the savings
+---------------------
+Run `python benchmarks/preload_memory.py --workers 4` against your
+environment. It boots gunicorn with and without preloading and reports the
+summed unique (USS) and proportional (PSS) memory of master plus workers.
+The savings depend on the worker count and installed dependencies, so
+measure them on the deployment host rather than relying on fixed figures.
+
+Set GUNICORN_PRELOAD=0 to disable preloading (for example when debugging
+import-time side effects).
+
+Metrics
+-------
+PROMETHEUS_MULTIPROC_DIR points prometheus_client at a shared directory so
+/metrics aggregates every worker (see monitoring/metrics.py). It has to be
+set before the app is imported, which is why it lives here. Stale files from
+a previous run are removed in on_starting, which runs once per master (not
+on a HUP reload, when live workers still own their files), and dead workers
+are marked in child_exit so their live gauges drop out.
+"""
+
+import glob
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger('gunicorn.error')
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'badgey-prometheus')
+)
+_metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+os.makedirs(_metrics_dir, exist_ok=True)
+
+def on_starting(server):
+    """Do the one-shot startup work in the master before any worker forks."""
+    for stale in glob.glob(os.path.join(_metrics_dir, '*.db')):
+        os.remove(stale)
+
+    if not server.cfg.preload_app:
+        return
+
+    from app import app, run_startup_tasks
+    from models.db import close_all_connections
+
+    try:
+        if not run_startup_tasks(app):
+            logger.error("Startup tasks failed in master; workers will retry")
+    except Exception as e:
+        # Workers retry once the STARTUP_RETRY_INTERVAL backoff expires
+        logger.error(f"Startup tasks failed in master: {e}")
+    finally:
+        # Nothing opened here may survive into the forked workers
+        close_all_connections()
+        app.db_engine.dispose()
+        app.session_interface.reset_after_fork()
+
+def post_fork(server, worker):
+    """Give each worker its own database and Redis connections."""
+    if not server.cfg.preload_app:
+        return
+
+    from app import app, reset_after_fork
+    reset_after_fork(app)
+    logger.info(f"Worker {worker.pid}: reset inherited connection pools")
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the aggregated metrics."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,262 @@
+"""
+Incremental node -> choice -> next node transition counts for Kobayashi stories.
+
+dashboard_choice_transitions holds, per story code, how many times each
+choice at each node was followed by a choice at next_node_id within the same
+run. next_node_id '' counts choices that are (so far) the last one recorded
+for their run: completions when the choice leads to a terminal node, and
+drop-offs otherwise.
+
+The table is maintained from a watermark on player_choices.id: each new row
+adds one '' count for itself and, if its run already had a choice, moves that
+previous choice's '' count to the new row's node. Counts and watermark are
+written in the same transaction under an advisory lock, so concurrent
+refreshes never double count.
+
+AUTO_INCREMENT ids are assigned at insert but become visible at commit, so
+with several bot writers a lower id can appear after a higher one was
+folded. Each refresh therefore re-scans the last RESCAN_WINDOW ids below the
+watermark and skips rows listed in dashboard_counted_choices, which holds
+the ids folded within that window. This relies on a run's own choices being
+committed in order (one player makes them one at a time); a row committed
+more than RESCAN_WINDOW ids late is still missed until a rebuild.
+"""
+
+import logging
+from collections import Counter
+from models.db import checkout_db, get_db, release_db
+from models.story_graph import get_story_graph
+from models.watermarks import get_watermark, set_watermark
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'choice_transitions'
+LOCK_NAME = 'badgey_dashboard_choice_transitions'
+BATCH_SIZE = 5000  # player_choices rows folded in per transaction
+REQUEST_MAX_BATCHES = 4  # catch-up work allowed inside a page load
+RESCAN_WINDOW = 1000  # ids below the watermark re-checked for late commits
+END_OF_RUN = ''
+
+_id_column_checked = False
+
+def _check_id_column(cursor):
+    """Fail clearly if player_choices has no id column to keep a watermark on."""
+    global _id_column_checked
+    if _id_column_checked:
+        return
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'player_choices' AND COLUMN_NAME = 'id'
+    """)
+    if cursor.fetchone() is None:
+        raise RuntimeError("player_choices has no id column; the choice transition matrix cannot be maintained")
+    _id_column_checked = True
+
+def _previous_choices(cursor, first_ids):
+    """Latest choice of each run below that run's first id in the batch: run_id -> (node_id, choice).
+
+    Args:
+        first_ids (dict): run_id -> the run's lowest id in the batch
+
+    A run's own choices are committed in order, so all of its rows below that
+    id are already counted. One cutoff for the whole batch would be wrong: a
+    late row of one run can precede already-counted rows of another run.
+    """
+    if not first_ids:
+        return {}
+    conditions = ' OR '.join(['(run_id = %s AND id < %s)'] * len(first_ids))
+    cursor.execute(f"""
+        SELECT run_id, node_id, choice FROM (
+            SELECT run_id, node_id, choice,
+                   ROW_NUMBER() OVER (PARTITION BY run_id ORDER BY id DESC) as choice_rank
+            FROM player_choices
+            WHERE {conditions}
+        ) latest
+        WHERE choice_rank = 1
+    """, tuple(value for item in first_ids.items() for value in item))
+    return {row['run_id']: (row['node_id'], row['choice']) for row in cursor.fetchall()}
+
+def _fold_batch(cursor, watermark):
+    """Fold the next batch of player_choices into the matrix.
+
+    Returns:
+        tuple: (new watermark, rows processed)
+    """
+    cursor.execute("""
+        SELECT pc.id, pc.run_id, pc.story_code, pc.node_id, pc.choice
+        FROM player_choices pc
+        LEFT JOIN dashboard_counted_choices counted ON counted.id = pc.id
+        WHERE pc.id > %s AND counted.id IS NULL
+        ORDER BY pc.id
+        LIMIT %s
+    """, (max(0, watermark - RESCAN_WINDOW), BATCH_SIZE))
+    rows = cursor.fetchall()
+    if not rows:
+        return watermark, 0
+
+    late = sum(1 for row in rows if row['id'] <= watermark)
+    if late:
+        logger.info(f"Folding {late} player choices committed after the transition watermark passed them")
+
+    first_ids = {}
+    for row in rows:
+        first_ids.setdefault(row['run_id'], row['id'])
+    previous = _previous_choices(cursor, first_ids)
+    deltas = Counter()
+    for row in rows:
+        story_code = row['story_code']
+        prev = previous.get(row['run_id'])
+        if prev:
+            deltas[(story_code, prev[0], prev[1], END_OF_RUN)] -= 1
+            deltas[(story_code, prev[0], prev[1], row['node_id'])] += 1
+        deltas[(story_code, row['node_id'], row['choice'], END_OF_RUN)] += 1
+        previous[row['run_id']] = (row['node_id'], row['choice'])
+
+    cursor.executemany("""
+        INSERT INTO dashboard_choice_transitions (story_code, node_id, choice, next_node_id, transitions)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE transitions = transitions + VALUES(transitions)
+    """, [(*key, count) for key, count in deltas.items() if count])
+
+    watermark = max(watermark, rows[-1]['id'])
+    cursor.executemany(
+        "INSERT INTO dashboard_counted_choices (id) VALUES (%s)",
+        [(row['id'],) for row in rows]
+    )
+    cursor.execute("DELETE FROM dashboard_counted_choices WHERE id <= %s", (watermark - RESCAN_WINDOW,))
+    return watermark, len(rows)
+
+def refresh_transitions(max_batches=None):
+    """Bring the transition matrix up to date with player_choices.
+
+    Args:
+        max_batches (int): Stop after this many batches (None for no limit)
+
+    Returns:
+        int: player_choices rows folded in, or -1 if another refresh holds the lock
+    """
+    conn = checkout_db()
+    processed = 0
+    locked = False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, 0) as locked", (LOCK_NAME,))
+            row = cursor.fetchone()
+            locked = bool(row and row['locked'])
+            if not locked:
+                return -1
+
+            _check_id_column(cursor)
+            watermark = get_watermark(cursor, WATERMARK_NAME)
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                watermark, count = _fold_batch(cursor, watermark)
+                if not count:
+                    break
+                set_watermark(cursor, WATERMARK_NAME, watermark)
+                conn.commit()
+                processed += count
+                batches += 1
+        if processed:
+            logger.info(f"Folded {processed} player choices into the transition matrix (watermark {watermark})")
+        return processed
+    except Exception as e:
+        logger.error(f"Error refreshing choice transitions: {e}")
+        conn.rollback()
+        raise
+    finally:
+        if locked:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            except Exception:
+                pass
+        release_db(conn)
+
+def rebuild_transitions():
+    """Drop all counts and the watermark, then rebuild from scratch.
+
+    Needed only if player_choices rows are deleted or rewritten.
+    """
+    conn = checkout_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM dashboard_choice_transitions")
+            cursor.execute("DELETE FROM dashboard_counted_choices")
+            set_watermark(cursor, WATERMARK_NAME, 0)
+        conn.commit()
+    finally:
+        release_db(conn)
+    return refresh_transitions()
+
+def get_story_transitions(story_id):
+    """Return the transition matrix rows for one story.
+
+    Returns:
+        list: node_id, node_title, choice, next_node_id ('' for end of run) and transitions
+    """
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    t.node_id,
+                    sn.title as node_title,
+                    t.choice,
+                    t.next_node_id,
+                    t.transitions
+                FROM
+                    dashboard_choice_transitions t
+                JOIN
+                    stories s ON s.code = t.story_code
+                LEFT JOIN
+                    story_nodes sn ON sn.id = t.node_id
+                WHERE
+                    s.id = %s AND t.transitions > 0
+                ORDER BY
+                    t.node_id, t.transitions DESC
+            """, (story_id,))
+            return cursor.fetchall()
+    finally:
+        release_db(conn)
+
+def get_story_funnel(story_id):
+    """Summarize a story's matrix per node: choices made, completions, drop-offs and choice split.
+
+    A run's last recorded choice counts as a completion when the story graph
+    sends it to a terminal node, and as a drop-off otherwise.
+
+    Returns:
+        list: One dict per node (most visited first) with node_id, node_title,
+              choices_made, completions, drop_offs, drop_off_rate and choices
+              [{'choice', 'count', 'next': {next_node_id: count}}]
+    """
+    graph_nodes = get_story_graph(story_id)['nodes']
+    nodes = {}
+    for row in get_story_transitions(story_id):
+        node = nodes.setdefault(row['node_id'], {
+            'node_id': row['node_id'],
+            'node_title': row['node_title'] or row['node_id'],
+            'choices_made': 0,
+            'completions': 0,
+            'drop_offs': 0,
+            'choices': {},
+        })
+        choice = node['choices'].setdefault(row['choice'], {'choice': row['choice'], 'count': 0, 'next': {}})
+        choice['count'] += row['transitions']
+        choice['next'][row['next_node_id']] = row['transitions']
+        node['choices_made'] += row['transitions']
+        if row['next_node_id'] == END_OF_RUN:
+            target_id = graph_nodes.get(row['node_id'], {}).get('choices', {}).get(row['choice'], {}).get('next')
+            target = graph_nodes.get(target_id)
+            if target and target['is_terminal']:
+                node['completions'] += row['transitions']
+            else:
+                node['drop_offs'] += row['transitions']
+
+    funnel = []
+    for node in sorted(nodes.values(), key=lambda n: n['choices_made'], reverse=True):
+        node['drop_off_rate'] = round(node['drop_offs'] / node['choices_made'] * 100, 1) if node['choices_made'] else 0
+        node['choices'] = sorted(node['choices'].values(), key=lambda c: c['count'], reverse=True)
+        funnel.append(node)
+    return funnel
@@ -1,9 +1,11 @@
 import os
 import pymysql
 import logging
-from flask import current_app, g
+from flask import current_app, g, has_app_context
 import time
 import threading
+from monitoring.queries import record_query
+from monitoring import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,25 @@ MAX_POOL_SIZE = 10
 IDLE_TIMEOUT = 300  # seconds
 _last_used = {}
 
+class _InstrumentedExecuteMixin:
+    """Records each statement's duration for the current request."""
+
+    def execute(self, query, args=None):
+        # executemany() funnels through execute(), so this covers it too. callproc()
+        # calls _query() directly and is not recorded; hooking _query() instead
+        # would log statements with their parameters already substituted.
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            record_query(query, (time.perf_counter() - start) * 1000)
+
+class InstrumentedDictCursor(_InstrumentedExecuteMixin, pymysql.cursors.DictCursor):
+    """DictCursor that records each statement's duration for the current request."""
+
+class InstrumentedSSDictCursor(_InstrumentedExecuteMixin, pymysql.cursors.SSDictCursor):
+    """Unbuffered DictCursor; the recorded duration is the time to the first row."""
+
 def _create_connection():
     """Create a new database connection."""
     try:
@@ -23,7 +44,7 @@ def _create_connection():
             user=current_app.config['DATABASE']['user'],
             password=current_app.config['DATABASE']['password'],
             database=current_app.config['DATABASE']['database'],
-            cursorclass=pymysql.cursors.DictCursor,
+            cursorclass=InstrumentedDictCursor,
             charset='utf8mb4',
             connect_timeout=5
         )
@@ -41,18 +62,41 @@ def _init_connection_pool():
             _connection_pool = []
 
 def get_db():
-    """Get a database connection from the pool."""
+    """Get a database connection from the pool.
+
+    Inside an app context (requests, CLI commands, background threads that
+    push one) the connection is kept on g.db, so every get_db() call in that
+    context shares it and close_db returns it to the pool at teardown. A
+    commit or rollback on it therefore covers everything the context has
+    written so far; code that needs its own transaction uses checkout_db().
+    Outside an app context the caller owns the connection and must
+    release_db() it.
+    """
+    # Check for connection in app context first (for request transactions)
+    if has_app_context() and 'db' in g:
+        return g.db
+
+    conn = checkout_db()
+    if has_app_context():
+        g.db = conn
+    return conn
+
+def checkout_db():
+    """Check out a pooled connection that is not shared through g.db.
+
+    For helpers that commit or roll back their own work (activity logging,
+    migrations, table refreshes) without touching the calling request's
+    uncommitted writes. The caller must release_db() it.
+    """
     global _connection_pool
     
     # Initialize pool if not already done
     if _connection_pool is None:
         _init_connection_pool()
     
-    # Check for connection in app context first (for request transactions)
-    if 'db' in g:
-        return g.db
-    
     conn = None
+    reused = False
+    wait_start = time.perf_counter()
     with _pool_lock:
         # Clean up idle connections periodically
         now = time.time()
@@ -64,6 +108,7 @@ def get_db():
         # Get connection from pool or create new one
         if _connection_pool:
             conn = _connection_pool.pop()
+            reused = True
             logger.debug("Reusing connection from pool")
             
             # Ping the connection to make sure it's still alive
@@ -75,6 +120,9 @@ def get_db():
         else:
             logger.debug("No connection in pool, creating new one")
             conn = _create_connection()
+        idle_count = len(_connection_pool)
+    
+    metrics.record_pool_checkout(time.perf_counter() - wait_start, reused, idle_count)
     
     # Update last used timestamp
     _last_used[id(conn)] = time.time()
@@ -84,22 +132,62 @@ def release_db(conn):
     """Release a database connection back to the pool."""
     if conn is None:
         return
-        
+    # The app context's shared connection is released by close_db at teardown
+    if has_app_context() and g.get('db') is conn:
+        return
+    _return_to_pool(conn)
+
+def _return_to_pool(conn):
     global _connection_pool
     with _pool_lock:
-        if conn.open and len(_connection_pool) < MAX_POOL_SIZE:
+        if not conn.open:
+            _last_used.pop(id(conn), None)
+            logger.debug("Dropped closed connection")
+        elif len(_connection_pool) < MAX_POOL_SIZE:
             _connection_pool.append(conn)
             _last_used[id(conn)] = time.time()
             logger.debug("Released connection back to pool")
         else:
             conn.close()
-            logger.debug("Closed connection (pool full or connection closed)")
+            logger.debug("Closed connection (pool full)")
+        idle_count = len(_connection_pool)
+    metrics.record_pool_release(idle_count)
 
 def close_db(e=None):
-    """Close the database connection."""
+    """Return the app context's connection to the pool."""
     db = g.pop('db', None)
     if db is not None:
-        release_db(db)
+        try:
+            # End the context's transaction so the next user gets a fresh snapshot
+            db.rollback()
+        except Exception:
+            pass
+        _return_to_pool(db)
+
+def iter_unbuffered(query, args=None):
+    """Yield a query's rows one at a time from a dedicated connection.
+
+    The rows are read from the server as they are consumed instead of being
+    buffered in memory first. A connection with an unread result cannot run
+    any other statement, so this never uses the shared g.db connection; its
+    own connection is opened on first iteration and closed once the rows are
+    exhausted or the generator is closed.
+
+    Args:
+        query (str): SQL statement with %s placeholders
+        args (tuple, optional): Parameters for the statement
+
+    Returns:
+        generator: Row dicts
+    """
+    conn = _create_connection()
+    try:
+        with conn.cursor(InstrumentedSSDictCursor) as cursor:
+            cursor.execute(query, args)
+            for row in cursor:
+                yield row
+    finally:
+        conn.close()
 
 def close_all_connections():
     """Close all connections in the pool."""
@@ -112,70 +200,28 @@ def close_all_connections():
                 pass
         _connection_pool = []
         _last_used.clear()
+    metrics.DB_POOL_IDLE.set(0)
     logger.debug("Closed all database connections")
 
+def reset_pool_after_fork():
+    """Forget pooled connections inherited from a parent process.
+
+    After fork() the child shares its parent's sockets, so closing them here
+    would send COM_QUIT on the parent's connections. Drop the references and
+    start with a fresh, unlocked pool instead.
+    """
+    global _connection_pool, _pool_lock
+    _pool_lock = threading.Lock()
+    _connection_pool = []
+    _last_used.clear()
+    logger.debug("Reset connection pool after fork")
+
 def init_app(app):
     """Register database functions with the Flask app."""
     app.teardown_appcontext(close_db)
-    app.before_first_request(_init_connection_pool)
-    
-    # Add connection pool cleanup on app shutdown
-    if hasattr(app, 'teardown_appcontext'):
-        @app.teardown_appcontext
-        def shutdown_pool(exception=None):
-            close_all_connections()
     
-    # Migrate sessions on startup
-    migrate_anonymous_sessions()
-
-def migrate_anonymous_sessions():
-    """Update any sessions with user_id=1 that should be anonymous to user_id=0."""
-    conn = get_db()
-    try:
-        with conn.cursor() as cursor:
-            # First check if the foreign key constraint exists and drop it if needed
-            cursor.execute("""
-                SELECT CONSTRAINT_NAME 
-                FROM information_schema.KEY_COLUMN_USAGE 
-                WHERE TABLE_NAME = 'dashboard_sessions' 
-                  AND COLUMN_NAME = 'user_id' 
-                  AND REFERENCED_TABLE_NAME = 'dashboard_users'
-                  AND CONSTRAINT_SCHEMA = DATABASE()
-            """)
-            result = cursor.fetchone()
-            
-            if result and result.get('CONSTRAINT_NAME'):
-                constraint_name = result['CONSTRAINT_NAME']
-                logger.info(f"Found foreign key constraint: {constraint_name}")
-                
-                # Drop the constraint
-                cursor.execute(f"""
-                    ALTER TABLE dashboard_sessions
-                    DROP FOREIGN KEY {constraint_name}
-                """)
-                logger.info(f"Successfully dropped foreign key constraint: {constraint_name}")
-            
-            # Check if user with ID 1 exists
-            cursor.execute("SELECT id FROM dashboard_users WHERE id = 1")
-            user_exists = cursor.fetchone() is not None
-            
-            if not user_exists:
-                # Update all sessions with user_id=1 to user_id=0
-                cursor.execute("""
-                    UPDATE dashboard_sessions
-                    SET user_id = 0
-                    WHERE user_id = 1
-                """)
-                affected_rows = cursor.rowcount
-                logger.info(f"Updated {affected_rows} anonymous sessions from user_id=1 to user_id=0")
-                
-        conn.commit()
-        logger.info("Session migration completed successfully")
-    except Exception as e:
-        logger.error(f"Error during session migration: {e}")
-        conn.rollback()
-    finally:
-        release_db(conn)
+    # Schema changes (including the anonymous session migration) are applied
+    # once by models.migrations.run_migrations, not on every startup
 
 def log_activity(user_id, action, details, ip_address=None):
     """
@@ -187,7 +233,8 @@ def log_activity(user_id, action, details, ip_address=None):
         details (str): Additional details about the action
         ip_address (str, optional): IP address of the user
     """
-    conn = get_db()
+    # Own connection: the commit or rollback must not cover the caller's writes
+    conn = checkout_db()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -205,54 +252,7 @@ def log_activity(user_id, action, details, ip_address=None):
         release_db(conn)
 
 def init_db():
-    """Initialize the database tables if they don't exist."""
-    conn = get_db()
-    try:
-        with conn.cursor() as cursor:
-            # Create dashboard_users table if it doesn't exist
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS dashboard_users (
-                id INT PRIMARY KEY AUTO_INCREMENT,
-                discord_id VARCHAR(32) UNIQUE NOT NULL,
-                username VARCHAR(128) NOT NULL,
-                discriminator VARCHAR(4),
-                avatar VARCHAR(128),
-                email VARCHAR(255),
-                roles TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """)
-            
-            # Create dashboard_sessions table if it doesn't exist
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS dashboard_sessions (
-                id VARCHAR(128) PRIMARY KEY,
-                user_id INT NOT NULL,
-                data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """)
-            
-            # Create dashboard_logs table if it doesn't exist
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS dashboard_logs (
-                id INT PRIMARY KEY AUTO_INCREMENT,
-                user_id INT,
-                action VARCHAR(64) NOT NULL,
-                details TEXT,
-                ip_address VARCHAR(45),
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES dashboard_users(id) ON DELETE SET NULL
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """)
-            
-        conn.commit()
-        logger.info("Database tables initialized successfully")
-    except Exception as e:
-        logger.error(f"Error initializing database tables: {e}")
-        conn.rollback()
-        raise e
-    finally:
-        release_db(conn) 
\ No newline at end of file
+    """Initialize the database tables by applying any pending schema migrations."""
+    from models.migrations import run_migrations
+    applied = run_migrations()
+    logger.info(f"Database tables initialized successfully ({len(applied)} migrations applied)")
@@ -0,0 +1,323 @@
+"""
+Approximate distinct-user counters kept in Redis HyperLogLogs.
+
+Each source table is ingested incrementally from an id watermark: new rows'
+user ids are PFADDed into one all-time HyperLogLog and one per day. Reads
+PFCOUNT the relevant keys, merging day keys on the fly for arbitrary date
+ranges, so a count costs the same however many rows the table holds. Redis
+HyperLogLogs have a standard error of 0.81%.
+
+PFADD is idempotent, so a batch replayed after a crash does not double
+count. That also makes late commits cheap to catch: AUTO_INCREMENT ids become
+visible at commit, so a lower id can appear after a higher one was ingested,
+and every refresh therefore re-reads the last RESCAN_WINDOW ids below the
+watermark. A row committed later than that is missed. The watermark lives in Redis next to the HyperLogLogs, so if Redis
+loses them it also loses the watermark and ingestion starts over instead of
+undercounting.
+
+Day keys expire DAY_KEY_RETENTION days after their day. Ranges that start
+earlier than that are counted exactly.
+
+Sources are ingested independently: one whose columns are missing from the
+bot schema is skipped with a warning, and one that fails is logged without
+stopping the others. A source's HyperLogLogs are read only while it is
+caught up; an ingestion that fails or ends with rows still pending marks it
+behind again. Until then, and whenever Redis is unavailable, counts fall back
+to the exact COUNT(DISTINCT) query; exact=True forces that for audits
+(`flask refresh-distinct-counters --audit`).
+"""
+
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from models.db import get_db, release_db
+from redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000  # rows ingested per batch
+REQUEST_MAX_BATCHES = 2  # catch-up work allowed inside a page load
+REFRESH_INTERVAL = 30  # seconds between request-time ingestions per process
+INGEST_LOCK_TTL = 120  # seconds one process may hold the ingestion lock
+RESCAN_WINDOW = 1000  # ids below the watermark re-read for late commits
+DAY_KEY_RETENTION = 366  # days a day key is kept; longer ranges are counted exactly
+
+# source -> table, user id column and optional time column (for day keys);
+# every table also needs an AUTO_INCREMENT id column for the watermark
+SOURCES = {
+    'quiz_users': {
+        'table': 'user_scores',
+        'user': 'user_id',
+        'time': 'completion_date',
+    },
+    'tribble_participants': {
+        'table': 'tribble_scores',
+        'user': 'user_id',
+        'time': None,
+    },
+    'kobayashi_users': {
+        'table': 'player_choices',
+        'user': 'user_id',
+        'time': 'timestamp',
+    },
+}
+
+_last_refresh = 0.0
+_missing_columns = {}  # source -> columns the table lacks, checked once per process
+
+def _hll_key(source_name, *parts):
+    return redis_key('hll', source_name, *parts)
+
+def _watermark_key():
+    return redis_key('hll', 'watermarks')
+
+def _caught_up_key():
+    return redis_key('hll', 'caught_up')
+
+def _lock_key():
+    return redis_key('hll', 'ingest_lock')
+
+def _source_columns(source):
+    columns = ['id', source['user']]
+    if source['time']:
+        columns.append(source['time'])
+    return columns
+
+def _check_columns(cursor, source_name, source):
+    """Return True if the source's table has every column ingestion reads."""
+    if source_name not in _missing_columns:
+        columns = _source_columns(source)
+        cursor.execute(f"""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            AND COLUMN_NAME IN ({', '.join(['%s'] * len(columns))})
+        """, (source['table'], *columns))
+        present = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        _missing_columns[source_name] = [column for column in columns if column not in present]
+        if _missing_columns[source_name]:
+            logger.warning(f"Distinct counter source {source_name} skipped: {source['table']} has no "
+                           f"{', '.join(_missing_columns[source_name])} column; using exact counts")
+    return not _missing_columns[source_name]
+
+def _retained_since():
+    """First day whose day key has not expired."""
+    return date.today() - timedelta(days=DAY_KEY_RETENTION - 1)
+
+def _ingest_batch(client, cursor, source_name, source, after_id, watermark):
+    """PFADD the batch of a source's rows following after_id.
+
+    Returns:
+        tuple: (last id read, new watermark, rows read, rows above the old watermark)
+    """
+    cursor.execute(f"""
+        SELECT {', '.join(_source_columns(source))}
+        FROM {source['table']}
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+    """, (after_id, BATCH_SIZE))
+    rows = cursor.fetchall()
+    if not rows:
+        return after_id, watermark, 0, 0
+
+    retained_since = _retained_since()
+    members = defaultdict(set)
+    for row in rows:
+        user_id = row[source['user']]
+        if user_id is None:
+            continue
+        members[('all',)].add(user_id)
+        if source['time'] and row[source['time']]:
+            day = row[source['time']].date()
+            if day >= retained_since:
+                members[('day', day)].add(user_id)
+
+    new_watermark = max(watermark, rows[-1]['id'])
+    pipe = client.pipeline(transaction=True)
+    for parts, users in members.items():
+        if parts[0] == 'day':
+            key = _hll_key(source_name, 'day', parts[1].isoformat())
+            pipe.pfadd(key, *users)
+            expires = datetime.combine(parts[1], datetime.min.time()) + timedelta(days=DAY_KEY_RETENTION)
+            pipe.expireat(key, int(expires.timestamp()))
+        else:
+            pipe.pfadd(_hll_key(source_name, *parts), *users)
+    pipe.hset(_watermark_key(), source_name, new_watermark)
+    pipe.execute()
+    return rows[-1]['id'], new_watermark, len(rows), sum(1 for row in rows if row['id'] > watermark)
+
+def _refresh_source(client, cursor, source_name, source, max_batches):
+    """Ingest one source and record whether it has caught up.
+
+    Returns:
+        int: Rows ingested above the previous watermark
+    """
+    watermark = int(client.hget(_watermark_key(), source_name) or 0)
+    # Re-read the ids just below the watermark for rows committed late
+    after_id = max(0, watermark - RESCAN_WINDOW)
+    ingested = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        after_id, watermark, count, new = _ingest_batch(client, cursor, source_name, source, after_id, watermark)
+        ingested += new
+        batches += 1
+        if count < BATCH_SIZE:
+            client.hset(_caught_up_key(), source_name, 1)
+            return ingested
+    # Batch limit reached with rows still pending
+    if client.hdel(_caught_up_key(), source_name):
+        logger.warning(f"Distinct counter source {source_name} fell behind at id {watermark}; "
+                       f"using exact counts until it catches up")
+    return ingested
+
+def refresh_counters(max_batches=None):
+    """Ingest new rows from every source into the HyperLogLogs.
+
+    Args:
+        max_batches (int): Stop each source after this many batches (None for no limit)
+
+    Returns:
+        dict: source -> rows ingested (None for a source that was skipped or
+              failed), or None if Redis is unavailable or another process
+              holds the ingestion lock
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        if not client.set(_lock_key(), 1, nx=True, ex=INGEST_LOCK_TTL):
+            return None
+    except Exception as e:
+        logger.error(f"Error taking distinct counter ingestion lock: {e}")
+        return None
+
+    ingested = {}
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            for source_name, source in SOURCES.items():
+                ingested[source_name] = None
+                try:
+                    if _check_columns(cursor, source_name, source):
+                        ingested[source_name] = _refresh_source(client, cursor, source_name, source, max_batches)
+                except Exception as e:
+                    logger.error(f"Error refreshing distinct counter source {source_name}: {e}")
+                    try:
+                        client.hdel(_caught_up_key(), source_name)
+                    except Exception:
+                        pass
+        if any(ingested.values()):
+            logger.info(f"Ingested rows into distinct counters: {ingested}")
+        return ingested
+    except Exception as e:
+        logger.error(f"Error refreshing distinct counters: {e}")
+        return None
+    finally:
+        release_db(conn)
+        try:
+            client.delete(_lock_key())
+        except Exception:
+            pass
+
+def _maybe_refresh():
+    """Run a small ingestion at most once per REFRESH_INTERVAL in this process."""
+    global _last_refresh
+    if time.time() - _last_refresh < REFRESH_INTERVAL:
+        return
+    _last_refresh = time.time()
+    refresh_counters(max_batches=REQUEST_MAX_BATCHES)
+
+def _approximate_client(source_name):
+    """Return the Redis client if the source's HyperLogLogs are usable, else None."""
+    _maybe_refresh()
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        return client if client.hget(_caught_up_key(), source_name) else None
+    except Exception as e:
+        logger.error(f"Error reading distinct counter state: {e}")
+        return None
+
+def _days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+def _exact_count(source, start=None, end=None):
+    sql = f"SELECT COUNT(DISTINCT {source['user']}) as count FROM {source['table']}"
+    params = ()
+    if start:
+        sql += f" WHERE {source['time']} >= %s AND {source['time']} < %s"
+        params = (start, end + timedelta(days=1))
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+            return row['count'] if row else 0
+    finally:
+        release_db(conn)
+
+def distinct_users(source_name, start=None, end=None, exact=False):
+    """Count distinct users of a source, overall or over a date range.
+
+    Args:
+        source_name (str): A SOURCES key
+        start (date): First day of the range (inclusive); needs end
+        end (date): Last day of the range (inclusive)
+        exact (bool): Run COUNT(DISTINCT) instead of reading the HyperLogLogs
+
+    Returns:
+        int: Number of distinct users (about 1% error unless exact)
+    """
+    source = SOURCES[source_name]
+    if start and not source['time']:
+        raise ValueError(f"{source_name} has no time column for date ranges")
+
+    approximate = not exact and (not start or start >= _retained_since())
+    client = _approximate_client(source_name) if approximate else None
+    if client is not None:
+        if start:
+            keys = [_hll_key(source_name, 'day', day.isoformat()) for day in _days(start, end)]
+        else:
+            keys = [_hll_key(source_name, 'all')]
+        try:
+            return client.pfcount(*keys) if keys else 0
+        except Exception as e:
+            logger.error(f"Error counting distinct {source_name} in Redis: {e}")
+    return _exact_count(source, start, end)
+
+def daily_distinct_users(source_name, start, end, exact=False):
+    """Count distinct users of a source for each day from start to end (inclusive).
+
+    Returns:
+        dict: ISO date string -> distinct users
+    """
+    source = SOURCES[source_name]
+    days = [day.isoformat() for day in _days(start, end)]
+    client = _approximate_client(source_name) if not exact and start >= _retained_since() else None
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for day in days:
+                pipe.pfcount(_hll_key(source_name, 'day', day))
+            return dict(zip(days, pipe.execute()))
+        except Exception as e:
+            logger.error(f"Error counting daily distinct {source_name} in Redis: {e}")
+
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT DATE({source['time']}) as date, COUNT(DISTINCT {source['user']}) as count
+                FROM {source['table']}
+                WHERE {source['time']} >= %s AND {source['time']} < %s
+                GROUP BY DATE({source['time']})
+            """, (start, end + timedelta(days=1)))
+            counts = {row['date'].isoformat(): row['count'] for row in cursor.fetchall()}
+    finally:
+        release_db(conn)
+    return {day: counts.get(day, 0) for day in days}
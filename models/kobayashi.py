@@ -1,5 +1,12 @@
 from datetime import datetime
+import logging
+from flask import current_app
 from models.db import get_db
+from models.story_graph import decode_json_field, invalidate_story_graph, normalize_choices, normalize_conditions
+
+logger = logging.getLogger(__name__)
+
+NODE_COUNT_CACHE_TIMEOUT = 3600
 
 # --- Story Model Functions ---
 def get_all_stories():
@@ -33,14 +40,78 @@ def delete_story(story_id):
     with conn.cursor() as cursor:
         cursor.execute('DELETE FROM stories WHERE id = %s', (story_id,))
     conn.commit()
+    invalidate_story_nodes(story_id)
 
 # --- Node Model Functions ---
-def get_nodes_for_story(story_id):
+def get_nodes_for_story(story_id, limit=None, offset=0, after_id=None):
+    """Get a story's nodes in id order, optionally one page at a time.
+
+    Args:
+        story_id (int): Story ID
+        limit (int): Maximum nodes to return (all when None)
+        offset (int): Nodes to skip (ignored when after_id is given)
+        after_id (str): Keyset cursor; return nodes with ids after this one
+
+    Returns:
+        list: Node rows
+    """
     conn = get_db()
     with conn.cursor() as cursor:
-        cursor.execute('SELECT * FROM story_nodes WHERE story_id = %s ORDER BY id', (story_id,))
+        query = 'SELECT * FROM story_nodes WHERE story_id = %s'
+        params = [story_id]
+        if after_id is not None:
+            query += ' AND id > %s'
+            params.append(after_id)
+        query += ' ORDER BY id'
+        if limit is not None:
+            query += ' LIMIT %s'
+            params.append(limit)
+            if after_id is None and offset:
+                query += ' OFFSET %s'
+                params.append(offset)
+        cursor.execute(query, tuple(params))
         return cursor.fetchall()
 
+def _node_count_key(story_id):
+    return f"kobayashi_node_count_{story_id}"
+
+def count_nodes_for_story(story_id):
+    """Get the number of nodes in a story, cached until a node is added or removed."""
+    cache = current_app.cache if hasattr(current_app, 'cache') else None
+    if cache:
+        try:
+            count = cache.get(_node_count_key(story_id))
+            if count is not None:
+                return count
+        except Exception as e:
+            logger.error(f"Error reading node count cache: {e}")
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) as count FROM story_nodes WHERE story_id = %s', (story_id,))
+        row = cursor.fetchone()
+    count = row['count'] if row else 0
+    if cache:
+        try:
+            cache.set(_node_count_key(story_id), count, timeout=NODE_COUNT_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error caching node count: {e}")
+    return count
+
+def invalidate_story_nodes(story_id):
+    """Drop everything cached about a story's nodes."""
+    invalidate_story_graph(story_id)
+    cache = current_app.cache if hasattr(current_app, 'cache') else None
+    if cache:
+        try:
+            cache.delete(_node_count_key(story_id))
+        except Exception as e:
+            logger.error(f"Error invalidating node count cache: {e}")
+
+def _story_id_for_node(cursor, node_id):
+    cursor.execute('SELECT story_id FROM story_nodes WHERE id = %s', (node_id,))
+    row = cursor.fetchone()
+    return row['story_id'] if row else None
+
 def get_node(node_id):
     conn = get_db()
     with conn.cursor() as cursor:
@@ -49,7 +120,24 @@ def get_node(node_id):
 
 import json
 
+def encode_node_json(node_data):
+    """Validate a node's choices and conditions and encode each exactly once.
+
+    Accepts decoded values or JSON text (including legacy double-encoded
+    text) and returns the canonical stored form.
+
+    Returns:
+        tuple: (choices JSON, conditions JSON)
+
+    Raises:
+        ValueError: If the choices or conditions are malformed
+    """
+    choices = normalize_choices(decode_json_field(node_data.get('choices'), {}))
+    conditions = normalize_conditions(decode_json_field(node_data.get('conditions'), []))
+    return json.dumps(choices), json.dumps(conditions)
+
 def create_node(story_id, node_data):
+    choices_json, conditions_json = encode_node_json(node_data)
     conn = get_db()
     with conn.cursor() as cursor:
         cursor.execute(
@@ -61,18 +149,21 @@ def create_node(story_id, node_data):
                 node_data.get('id'),
                 node_data.get('title'),
                 node_data.get('description'),
-                json.dumps(node_data.get('choices', {})),
-                json.dumps(node_data.get('conditions', [])),
+                choices_json,
+                conditions_json,
                 int(node_data.get('is_terminal', 0)),
                 node_data.get('ending_type'),
                 node_data.get('ending_text'),
             )
         )
     conn.commit()
+    invalidate_story_nodes(story_id)
 
 def update_node(node_id, node_data):
+    choices_json, conditions_json = encode_node_json(node_data)
     conn = get_db()
     with conn.cursor() as cursor:
+        story_id = _story_id_for_node(cursor, node_id)
         cursor.execute(
             '''UPDATE story_nodes SET
                 title = %s,
@@ -86,8 +177,8 @@ def update_node(node_id, node_data):
             (
                 node_data.get('title'),
                 node_data.get('description'),
-                json.dumps(node_data.get('choices', {})),
-                json.dumps(node_data.get('conditions', [])),
+                choices_json,
+                conditions_json,
                 int(node_data.get('is_terminal', 0)),
                 node_data.get('ending_type'),
                 node_data.get('ending_text'),
@@ -95,9 +186,14 @@ def update_node(node_id, node_data):
             )
         )
     conn.commit()
+    if story_id is not None:
+        invalidate_story_nodes(story_id)
 
 def delete_node(node_id):
     conn = get_db()
     with conn.cursor() as cursor:
+        story_id = _story_id_for_node(cursor, node_id)
         cursor.execute('DELETE FROM story_nodes WHERE id = %s', (node_id,))
     conn.commit()
+    if story_id is not None:
+        invalidate_story_nodes(story_id)
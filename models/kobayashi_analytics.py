@@ -1,74 +1,137 @@
+from flask import current_app
 from models.db import get_db
+from models.distinct_counters import distinct_users
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cached aggregates are keyed on the newest run rows, so they stay valid
+# until the bot records another choice or points entry.
+STATS_CACHE_TIMEOUT = 3600
+
+def _cache():
+    return current_app.cache if hasattr(current_app, 'cache') else None
+
+# table -> SQL expressions whose values change whenever rows are added, chosen
+# once per process from the columns the bot's table actually has
+_watermark_exprs = {}
+
+def _watermark_expressions(cursor, table):
+    """MAX(id) when the table has an id column (a primary-key lookup);
+    otherwise COUNT(*) plus the newest timestamp, if there is one."""
+    if table not in _watermark_exprs:
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME IN ('id', 'timestamp')
+        """, (table,))
+        columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        if 'id' in columns:
+            exprs = ['MAX(id)']
+        else:
+            logger.warning(f"{table} has no id column; cached run aggregates are keyed on COUNT(*)")
+            exprs = ['COUNT(*)']
+            if 'timestamp' in columns:
+                exprs.append('UNIX_TIMESTAMP(MAX(timestamp))')
+        _watermark_exprs[table] = exprs
+    return _watermark_exprs[table]
+
+def get_runs_watermark(cursor):
+    """Return values that change whenever player_choices or user_points gain rows.
+
+    With an id column on both tables this is two primary-key lookups, cheap
+    enough to run on every request to decide whether cached run aggregates
+    are still current. Where the bot's table has no id column it falls back
+    to COUNT(*) (and the newest timestamp), which scans an index.
+
+    Returns:
+        tuple: Integers (0 for empty tables); compare whole tuples
+    """
+    selects = []
+    for table in ('player_choices', 'user_points'):
+        for n, expr in enumerate(_watermark_expressions(cursor, table)):
+            selects.append(f"(SELECT {expr} FROM {table}) as {table}_{n}")
+    cursor.execute(f"SELECT {', '.join(selects)}")
+    row = cursor.fetchone() or {}
+    return tuple(int(value or 0) for value in row.values())
 
 def get_story_run_stats():
-    """Get statistics about story runs for analytics"""
+    """Get statistics about story runs for analytics
+
+    Runs, players and completions for every story come from one grouped
+    statement: player_choices and user_points are each aggregated per
+    story_code and joined to stories on stories.code. The result is cached
+    until new runs arrive.
+    """
     conn = get_db()
-    story_stats = []
     
     with conn.cursor() as cursor:
-        # Get total runs and participations per story using player_choices table
+        watermark = '_'.join(str(value) for value in get_runs_watermark(cursor))
+        cache = _cache()
+        cache_key = f"kobayashi_story_stats_{watermark}"
+        if cache:
+            try:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.error(f"Error reading story stats cache: {e}")
+        
         cursor.execute("""
             SELECT 
                 s.id,
                 s.title,
-                COUNT(DISTINCT pc.run_id) as total_runs,
-                COUNT(DISTINCT pc.user_id) as unique_users
+                s.code,
+                COALESCE(runs.total_runs, 0) as total_runs,
+                COALESCE(runs.unique_users, 0) as unique_users,
+                COALESCE(points.completed_runs, 0) as completions
             FROM 
                 stories s
-            LEFT JOIN 
-                player_choices pc ON SUBSTRING_INDEX(pc.run_id, '_', 1) = s.code
-            GROUP BY 
-                s.id, s.title
+            LEFT JOIN (
+                SELECT story_code,
+                       COUNT(DISTINCT run_id) as total_runs,
+                       COUNT(DISTINCT user_id) as unique_users
+                FROM player_choices
+                GROUP BY story_code
+            ) runs ON runs.story_code = s.code
+            LEFT JOIN (
+                SELECT story_code,
+                       COUNT(DISTINCT CASE WHEN points >= 10 THEN run_id END) as completed_runs
+                FROM user_points
+                GROUP BY story_code
+            ) points ON points.story_code = s.code
             ORDER BY 
                 total_runs DESC
         """)
-        base_stats = cursor.fetchall()
-        
-        # Add estimated completion rate based on points earned
-        story_stats = []
-        for story in base_stats:
-            # Fetch all runs for this story to calculate completion rate
-            story_code = None
-            if story['id'] == 2:
-                story_code = 'TITEN'
-            elif story['id'] == 3:
-                story_code = 'KHAN'
-                
-            if story_code:
-                cursor.execute("""
-                    SELECT 
-                        COUNT(DISTINCT run_id) as total_runs,
-                        COUNT(DISTINCT CASE WHEN points >= 10 THEN run_id END) as completed_runs
-                    FROM 
-                        user_points
-                    WHERE 
-                        run_id LIKE %s
-                """, (f"{story_code}_%",))
-                completion_data = cursor.fetchone()
-                
-                # Add completion data to story stats
-                story_stats.append({
-                    'id': story['id'],
-                    'title': story['title'],
-                    'total_runs': story['total_runs'] or 0,
-                    'completions': completion_data['completed_runs'] if completion_data else 0,
-                    'unique_users': story['unique_users'] or 0
-                })
-            else:
-                # For stories without completion data, use defaults
-                story_stats.append({
-                    'id': story['id'],
-                    'title': story['title'],
-                    'total_runs': story['total_runs'] or 0,
-                    'completions': 0,
-                    'unique_users': story['unique_users'] or 0
-                })
+        story_stats = [{
+            'id': story['id'],
+            'title': story['title'],
+            'total_runs': int(story['total_runs']),
+            'completions': int(story['completions']),
+            'unique_users': int(story['unique_users'])
+        } for story in cursor.fetchall()]
+    
+    if cache:
+        try:
+            cache.set(cache_key, story_stats, timeout=STATS_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error caching story stats: {e}")
     
     return story_stats
 
 def get_choice_distribution(story_id=None):
-    """Get distribution of choices made across all stories or a specific story"""
+    """Get distribution of choices made across all stories or a specific story
+
+    Reads the incrementally maintained transition matrix
+    (models/choice_transitions.py) instead of grouping raw player_choices;
+    new choices are folded in first, a bounded number of batches per call.
+    """
+    from models.choice_transitions import REQUEST_MAX_BATCHES, refresh_transitions
+    try:
+        refresh_transitions(max_batches=REQUEST_MAX_BATCHES)
+    except Exception as e:
+        logger.error(f"Error refreshing choice transitions: {e}")
+
     conn = get_db()
     choice_stats = []
     
@@ -76,28 +139,30 @@ def get_choice_distribution(story_id=None):
         # Build the query with optional story_id filter
         query = """
             SELECT 
-                sn.story_id,
+                s.id as story_id,
                 s.title as story_title,
-                sn.id as node_id,
+                t.node_id,
                 sn.title as node_title,
-                pc.choice as choice_key,
-                COUNT(*) as choice_count
+                t.choice as choice_key,
+                SUM(t.transitions) as choice_count
             FROM 
-                player_choices pc
+                dashboard_choice_transitions t
             JOIN 
-                story_nodes sn ON pc.node_id = sn.id
+                stories s ON s.code = t.story_code
             JOIN 
-                stories s ON sn.story_id = s.id
+                story_nodes sn ON sn.id = t.node_id
         """
         
         params = []
         if story_id:
-            query += " WHERE sn.story_id = %s"
+            query += " WHERE s.id = %s"
             params.append(story_id)
         
         query += """
             GROUP BY 
-                sn.story_id, s.title, sn.id, sn.title, pc.choice
+                s.id, s.title, t.node_id, sn.title, t.choice
+            HAVING 
+                choice_count > 0
             ORDER BY 
                 choice_count DESC
             LIMIT 20
@@ -119,17 +184,42 @@ def get_choice_distribution(story_id=None):
                 'node_title': row['node_title'],
                 'choice_key': choice_key,
                 'choice_text': choice_text,
-                'choice_count': row['choice_count']
+                'choice_count': int(row['choice_count'])
             })
     
     return choice_stats
 
-def get_user_participation():
-    """Get user participation stats"""
+def get_user_participation(page=1, per_page=50):
+    """Get user participation stats
+
+    The listed users are fetched first; their points, completions and most
+    common choice are then computed for the whole page at once (a grouped
+    query and a ROW_NUMBER() window), so a page costs three queries however
+    many users it lists. Each page is cached until new runs arrive.
+
+    Args:
+        page (int): Page number, starting at 1
+        per_page (int): Users per page
+
+    Returns:
+        list: One dict per user, most runs first
+    """
     conn = get_db()
     user_stats = []
+    offset = (page - 1) * per_page
     
     with conn.cursor() as cursor:
+        watermark = '_'.join(str(value) for value in get_runs_watermark(cursor))
+        cache = _cache()
+        cache_key = f"kobayashi_user_participation_{page}_{per_page}_{watermark}"
+        if cache:
+            try:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.error(f"Error reading user participation cache: {e}")
+        
         # Get user participation data using player_choices and user_points tables
         # Join with members table to get actual usernames
         cursor.execute("""
@@ -137,7 +227,7 @@ def get_user_participation():
                 pc.user_id,
                 m.user_name,
                 COUNT(DISTINCT pc.run_id) as total_runs,
-                COUNT(DISTINCT SUBSTRING_INDEX(pc.run_id, '_', 1)) as stories_played,
+                COUNT(DISTINCT pc.story_code) as stories_played,
                 MAX(pc.timestamp) as last_played
             FROM 
                 player_choices pc
@@ -147,56 +237,68 @@ def get_user_participation():
                 pc.user_id, m.user_name
             ORDER BY 
                 total_runs DESC
-            LIMIT 50
-        """)
+            LIMIT %s OFFSET %s
+        """, (per_page, offset))
         user_data = cursor.fetchall()
         
-        # For each user, get more details
-        for user in user_data:
-            user_id = user['user_id']
+        points_by_user = {}
+        choice_by_user = {}
+        if user_data:
+            user_ids = [user['user_id'] for user in user_data]
+            placeholders = ', '.join(['%s'] * len(user_ids))
             
-            # Get total points and completion rate
-            cursor.execute("""
+            # Points and completions for every listed user
+            cursor.execute(f"""
                 SELECT 
+                    user_id,
                     SUM(points) as total_points,
                     COUNT(DISTINCT run_id) as runs_with_points,
                     COUNT(DISTINCT CASE WHEN points >= 10 THEN run_id END) as completed_runs
                 FROM 
                     user_points
                 WHERE 
-                    user_id = %s
-            """, (user_id,))
-            
-            points_data = cursor.fetchone()
+                    user_id IN ({placeholders})
+                GROUP BY 
+                    user_id
+            """, tuple(user_ids))
+            points_by_user = {row['user_id']: row for row in cursor.fetchall()}
             
-            # Get the user's most common choice
-            cursor.execute("""
+            # Each user's most common choice, with the node title
+            cursor.execute(f"""
                 SELECT 
-                    choice,
-                    node_id,
-                    COUNT(*) as choice_count
-                FROM 
-                    player_choices
+                    ranked.user_id,
+                    ranked.choice,
+                    ranked.node_id,
+                    sn.title as node_title
+                FROM (
+                    SELECT 
+                        user_id,
+                        choice,
+                        node_id,
+                        ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY COUNT(*) DESC) as choice_rank
+                    FROM 
+                        player_choices
+                    WHERE 
+                        user_id IN ({placeholders})
+                    GROUP BY 
+                        user_id, choice, node_id
+                ) ranked
+                LEFT JOIN 
+                    story_nodes sn ON sn.id = ranked.node_id
                 WHERE 
-                    user_id = %s
-                GROUP BY 
-                    choice, node_id
-                ORDER BY 
-                    choice_count DESC
-                LIMIT 1
-            """, (user_id,))
+                    ranked.choice_rank = 1
+            """, tuple(user_ids))
+            choice_by_user = {row['user_id']: row for row in cursor.fetchall()}
+        
+        for user in user_data:
+            user_id = user['user_id']
+            points_data = points_by_user.get(user_id)
+            completed_runs = int(points_data['completed_runs']) if points_data else 0
             
-            common_choice_data = cursor.fetchone()
+            common_choice_data = choice_by_user.get(user_id)
             common_choice_text = "N/A"
-            
             if common_choice_data:
-                # Get node title if available
-                cursor.execute("""
-                    SELECT title FROM story_nodes WHERE id = %s
-                """, (common_choice_data['node_id'],))
-                node = cursor.fetchone()
-                
-                node_title = node['title'] if node else common_choice_data['node_id']
+                node_title = common_choice_data['node_title'] or common_choice_data['node_id']
                 choice_text = common_choice_data['choice'].replace('_', ' ').capitalize()
                 common_choice_text = f"{node_title}: {choice_text}"
             
@@ -208,12 +310,18 @@ def get_user_participation():
                 'username': username,
                 'runs': user['total_runs'],
                 'stories_played': user['stories_played'],
-                'completed_runs': points_data['completed_runs'] if points_data else 0,
-                'completion_rate': round((points_data['completed_runs'] / user['total_runs']) * 100, 1) if points_data and user['total_runs'] > 0 else 0,
+                'completed_runs': completed_runs,
+                'completion_rate': round((completed_runs / user['total_runs']) * 100, 1) if user['total_runs'] > 0 else 0,
                 'last_played': user['last_played'],
                 'common_choice': common_choice_text
             })
     
+    if cache:
+        try:
+            cache.set(cache_key, user_stats, timeout=STATS_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error caching user participation: {e}")
+    
     return user_stats
 
 def get_analytics_summary():
@@ -228,10 +336,10 @@ def get_analytics_summary():
                 (SELECT COUNT(*) FROM stories) as total_stories,
                 (SELECT COUNT(*) FROM story_nodes) as total_nodes,
                 (SELECT COUNT(DISTINCT run_id) FROM player_choices) as total_runs,
-                (SELECT COUNT(DISTINCT run_id) FROM user_points WHERE points >= 10) as completed_runs,
-                (SELECT COUNT(DISTINCT user_id) FROM player_choices) as active_users
+                (SELECT COUNT(DISTINCT run_id) FROM user_points WHERE points >= 10) as completed_runs
         """)
         summary = cursor.fetchone()
+        summary['active_users'] = distinct_users('kobayashi_users')
         
         # Calculate completion rate
         if summary and summary['total_runs'] > 0:
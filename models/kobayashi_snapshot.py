@@ -0,0 +1,160 @@
+"""
+Precomputed Kobayashi analytics snapshot.
+
+The analytics page's story stats, choice distribution, user participation
+and summary are built together into one snapshot, stored in Redis with the
+time it was built and the run watermark it covers (see
+kobayashi_analytics.get_runs_watermark). Page loads read the snapshot and
+compare watermarks with one query; when new runs have arrived, or the
+snapshot is older than SNAPSHOT_MAX_AGE, the stale copy is served while one
+worker rebuilds it in a background thread. `flask refresh-kobayashi-snapshot`
+rebuilds it from cron.
+
+Without Redis the snapshot is kept in process memory.
+"""
+
+import logging
+import pickle
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from models.db import get_db, release_db
+from models.kobayashi_analytics import (
+    get_analytics_summary,
+    get_choice_distribution,
+    get_runs_watermark,
+    get_story_run_stats,
+    get_user_participation
+)
+from redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAX_AGE = 900  # seconds before a snapshot is rebuilt even without new runs
+SNAPSHOT_TTL = 7 * 24 * 3600  # seconds Redis keeps a snapshot
+REBUILD_LOCK_TTL = 300  # seconds one worker may hold the rebuild lock
+
+_local_snapshot = None
+_rebuild_lock = threading.Lock()
+
+def _snapshot_key():
+    return redis_key('kobayashi', 'analytics_snapshot')
+
+def _lock_key():
+    return redis_key('kobayashi', 'analytics_snapshot_lock')
+
+def _current_watermark():
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            return get_runs_watermark(cursor)
+    finally:
+        release_db(conn)
+
+def _load_snapshot():
+    client = get_redis()
+    if client is not None:
+        try:
+            raw = client.get(_snapshot_key())
+            if raw:
+                return pickle.loads(raw)
+        except Exception as e:
+            logger.error(f"Error reading Kobayashi analytics snapshot from Redis: {e}")
+    return _local_snapshot
+
+def _store_snapshot(snapshot):
+    global _local_snapshot
+    _local_snapshot = snapshot
+    client = get_redis()
+    if client is not None:
+        try:
+            client.setex(_snapshot_key(), SNAPSHOT_TTL, pickle.dumps(snapshot))
+        except Exception as e:
+            logger.error(f"Error storing Kobayashi analytics snapshot in Redis: {e}")
+
+def build_snapshot():
+    """Compute the analytics snapshot and store it.
+
+    Returns:
+        dict: story_stats, choice_stats, user_participation, summary,
+              watermark and built_at
+    """
+    start = time.perf_counter()
+    watermark = _current_watermark()
+    snapshot = {
+        'story_stats': get_story_run_stats(),
+        'choice_stats': get_choice_distribution(),
+        'user_participation': get_user_participation(),
+        'summary': get_analytics_summary(),
+        'watermark': watermark,
+        'built_at': datetime.utcnow(),
+    }
+    _store_snapshot(snapshot)
+    logger.info(f"Built Kobayashi analytics snapshot at watermark {watermark} "
+                f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return snapshot
+
+def _acquire_rebuild():
+    """Claim the rebuild for this worker; False if another rebuild is running."""
+    if not _rebuild_lock.acquire(blocking=False):
+        return False
+    client = get_redis()
+    if client is not None:
+        try:
+            if not client.set(_lock_key(), 1, nx=True, ex=REBUILD_LOCK_TTL):
+                _rebuild_lock.release()
+                return False
+        except Exception as e:
+            logger.error(f"Error taking Kobayashi snapshot rebuild lock: {e}")
+    return True
+
+def _release_rebuild():
+    client = get_redis()
+    if client is not None:
+        try:
+            client.delete(_lock_key())
+        except Exception as e:
+            logger.error(f"Error releasing Kobayashi snapshot rebuild lock: {e}")
+    _rebuild_lock.release()
+
+def _rebuild_in_background(app):
+    with app.app_context():
+        try:
+            build_snapshot()
+        except Exception as e:
+            logger.error(f"Error rebuilding Kobayashi analytics snapshot: {e}")
+        finally:
+            _release_rebuild()
+
+def get_analytics_snapshot():
+    """Return the current analytics snapshot, scheduling a rebuild when stale.
+
+    Only the first request after a restart with an empty Redis builds the
+    snapshot inline; afterwards a stale snapshot is served while a
+    background thread rebuilds it.
+
+    Returns:
+        dict: As build_snapshot, plus 'stale' (True while a newer one is pending)
+    """
+    snapshot = _load_snapshot()
+    if snapshot is None:
+        return dict(build_snapshot(), stale=False)
+
+    try:
+        watermark = _current_watermark()
+    except Exception as e:
+        logger.error(f"Error reading Kobayashi run watermark: {e}")
+        return dict(snapshot, stale=False)
+
+    age = (datetime.utcnow() - snapshot['built_at']).total_seconds()
+    stale = tuple(snapshot['watermark']) != tuple(watermark) or age > SNAPSHOT_MAX_AGE
+    if stale and _acquire_rebuild():
+        app = current_app._get_current_object()
+        threading.Thread(
+            target=_rebuild_in_background,
+            args=(app,),
+            name='kobayashi-snapshot',
+            daemon=True
+        ).start()
+    return dict(snapshot, stale=stale)
@@ -0,0 +1,459 @@
+"""
+One-shot schema migrations tracked in the dashboard_schema_version table.
+
+Each migration runs exactly once per database. Workers only pay for a single
+SELECT on the version table once everything has been applied.
+"""
+
+import json
+import logging
+from models.db import checkout_db, release_db
+from models.story_graph import decode_json_field, normalize_choices, normalize_conditions
+from models.watermarks import get_watermark
+
+logger = logging.getLogger(__name__)
+
+# Name of the MySQL advisory lock that serializes concurrent runners
+MIGRATION_LOCK_NAME = 'badgey_dashboard_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = 30  # seconds
+REPAIR_BATCH_SIZE = 500  # story_nodes rows read per batch by the JSON repair
+
+def _create_dashboard_tables(cursor):
+    """Create the dashboard-owned tables."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_users (
+        id INT PRIMARY KEY AUTO_INCREMENT,
+        discord_id VARCHAR(32) UNIQUE NOT NULL,
+        username VARCHAR(128) NOT NULL,
+        discriminator VARCHAR(4),
+        avatar VARCHAR(128),
+        email VARCHAR(255),
+        roles TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_sessions (
+        id VARCHAR(128) PRIMARY KEY,
+        user_id INT NOT NULL,
+        data TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_logs (
+        id INT PRIMARY KEY AUTO_INCREMENT,
+        user_id INT,
+        action VARCHAR(64) NOT NULL,
+        details TEXT,
+        ip_address VARCHAR(45),
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES dashboard_users(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+def _migrate_anonymous_sessions(cursor):
+    """Drop the sessions -> users foreign key and move user_id=1 sessions to 0."""
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_NAME = 'dashboard_sessions'
+          AND COLUMN_NAME = 'user_id'
+          AND REFERENCED_TABLE_NAME = 'dashboard_users'
+          AND CONSTRAINT_SCHEMA = DATABASE()
+    """)
+    result = cursor.fetchone()
+
+    if result and result.get('CONSTRAINT_NAME'):
+        constraint_name = result['CONSTRAINT_NAME']
+        cursor.execute(f"""
+            ALTER TABLE dashboard_sessions
+            DROP FOREIGN KEY {constraint_name}
+        """)
+        logger.info(f"Dropped foreign key constraint: {constraint_name}")
+
+    # Only remap sessions if user 1 is not a real dashboard user
+    cursor.execute("SELECT id FROM dashboard_users WHERE id = 1")
+    if cursor.fetchone() is None:
+        cursor.execute("""
+            UPDATE dashboard_sessions
+            SET user_id = 0
+            WHERE user_id = 1
+        """)
+        logger.info(f"Updated {cursor.rowcount} anonymous sessions from user_id=1 to user_id=0")
+
+# Indexes for the analytics access paths: (table, index name, columns).
+# Most of these tables belong to the bot, so every index carries an idx_dash_
+# prefix and only ever gets added, never altered or dropped. Trailing columns
+# make the hot aggregate queries covering (no row lookups).
+#
+# Each tuple belongs to one migration and is frozen once that migration has
+# shipped, so a version always means the same DDL; new indexes go in a new
+# tuple with its own migration.
+INITIAL_INDEXES = (  # migration 3
+    ('user_scores', 'idx_dash_us_user_date', ('user_id', 'completion_date')),
+    ('user_scores', 'idx_dash_us_quiz_user_score', ('quiz_id', 'user_id', 'score')),
+    ('user_scores', 'idx_dash_us_completion_user', ('completion_date', 'user_id')),
+    ('tribble_drops', 'idx_dash_td_event_claimed', ('event_id', 'claimed_by', 'is_escaped')),
+    ('tribble_drops', 'idx_dash_td_claimed_flags', ('claimed_by', 'is_escaped', 'is_borg', 'was_defeated')),
+    ('tribble_drops', 'idx_dash_td_captured', ('captured_at', 'claimed_by', 'is_escaped')),
+    ('player_choices', 'idx_dash_pc_user_node_choice', ('user_id', 'node_id', 'choice')),
+    ('player_choices', 'idx_dash_pc_node_choice', ('node_id', 'choice')),
+    ('player_choices', 'idx_dash_pc_run_user', ('run_id', 'user_id')),
+    ('dashboard_logs', 'idx_dash_logs_timestamp', ('timestamp',)),
+)
+STORY_CODE_INDEXES = (  # migration 4, after the story_code columns
+    ('player_choices', 'idx_dash_pc_story_run_user', ('story_code', 'run_id', 'user_id')),
+    ('user_points', 'idx_dash_up_story_run_points', ('story_code', 'run_id', 'points')),
+)
+PARTICIPATION_INDEXES = (  # migration 5
+    ('user_points', 'idx_dash_up_user_run_points', ('user_id', 'run_id', 'points')),
+)
+STORY_NODE_INDEXES = (  # migration 6
+    ('story_nodes', 'idx_dash_sn_story_node', ('story_id', 'id')),
+)
+RUN_TIMELINE_INDEXES = (  # migration 9
+    ('user_points', 'idx_dash_up_run_timestamp', ('run_id', 'timestamp')),
+    ('custom_actions', 'idx_dash_ca_run_submitted', ('run_id', 'submitted_at')),
+)
+
+# Every analytics index the code expects, for verification and catch-up
+ANALYTICS_INDEXES = (INITIAL_INDEXES + STORY_CODE_INDEXES + PARTICIPATION_INDEXES
+                     + STORY_NODE_INDEXES + RUN_TIMELINE_INDEXES)
+
+# FULLTEXT indexes for the search page: (table, index name, columns).
+# Adding the first FULLTEXT index to a table rebuilds it and blocks writes
+# (LOCK=SHARED) while it does; the tables involved are small.
+FULLTEXT_INDEXES = [
+    ('custom_actions', 'idx_dash_ft_ca_text', ('text',)),
+    ('story_nodes', 'idx_dash_ft_sn_content', ('title', 'description')),
+    ('quizzes', 'idx_dash_ft_quiz_name', ('quiz_name',)),
+    ('questions', 'idx_dash_ft_question_text', ('question', 'explanation')),
+]
+
+# Run ids look like '<story code>_<user>_<n>'. Joining on SUBSTRING_INDEX(run_id)
+# cannot use an index, so these tables get an indexed generated column holding
+# the code. VIRTUAL costs no storage or rewrite (only the index is materialized)
+# and INVISIBLE keeps the bot's SELECT * and positional INSERTs unchanged.
+STORY_CODE_COLUMNS = [
+    ('player_choices', 'story_code'),
+    ('user_points', 'story_code'),
+]
+STORY_CODE_DEFINITION = "VARCHAR(32) AS (SUBSTRING_INDEX(run_id, '_', 1)) VIRTUAL INVISIBLE"
+
+def _table_exists(cursor, table):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone() is not None
+
+def _index_columns(cursor, table, index_name):
+    """Return the columns of an index in order, or an empty tuple if it does not exist."""
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        ORDER BY SEQ_IN_INDEX
+    """, (table, index_name))
+    return tuple(row['COLUMN_NAME'] for row in cursor.fetchall())
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+def missing_indexes(cursor):
+    """Return the (table, index name, columns) entries of ANALYTICS_INDEXES and
+    FULLTEXT_INDEXES not present as specified.
+
+    Tables that do not exist yet (the bot has not created them) are skipped.
+    """
+    missing = []
+    for table, index_name, columns in ANALYTICS_INDEXES + tuple(FULLTEXT_INDEXES):
+        if _table_exists(cursor, table) and _index_columns(cursor, table, index_name) != tuple(columns):
+            missing.append((table, index_name, columns))
+    return missing
+
+def _add_indexes(cursor, indexes):
+    """Create the given analytics indexes online and verify them afterwards."""
+    for table, index_name, columns in indexes:
+        if not _table_exists(cursor, table):
+            logger.warning(f"Skipping index {index_name}: table {table} does not exist")
+            continue
+        existing = _index_columns(cursor, table, index_name)
+        if existing == tuple(columns):
+            continue
+        absent = [c for c in columns if not _column_exists(cursor, table, c)]
+        if absent:
+            logger.warning(f"Skipping index {index_name}: {table} has no column {', '.join(absent)} yet")
+            continue
+        if existing:
+            logger.warning(f"Index {table}.{index_name} exists with columns {existing}, expected {columns}; leaving it")
+            continue
+        logger.info(f"Creating index {table}.{index_name} ({', '.join(columns)})")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD INDEX {index_name} ({', '.join(columns)}), "
+            f"ALGORITHM=INPLACE, LOCK=NONE"
+        )
+
+    for table, index_name, columns in missing_indexes(cursor):
+        if (table, index_name, columns) in indexes:
+            logger.error(f"Index verification failed: {table}.{index_name} ({', '.join(columns)}) is missing")
+
+def _add_analytics_indexes(cursor):
+    _add_indexes(cursor, INITIAL_INDEXES)
+
+def _add_participation_indexes(cursor):
+    _add_indexes(cursor, PARTICIPATION_INDEXES)
+
+def _add_story_node_index(cursor):
+    _add_indexes(cursor, STORY_NODE_INDEXES)
+
+def _add_run_timeline_indexes(cursor):
+    _add_indexes(cursor, RUN_TIMELINE_INDEXES)
+
+def _add_fulltext_indexes(cursor):
+    """Create the search FULLTEXT indexes that are missing."""
+    for table, index_name, columns in FULLTEXT_INDEXES:
+        if not _table_exists(cursor, table):
+            logger.warning(f"Skipping index {index_name}: table {table} does not exist")
+            continue
+        existing = _index_columns(cursor, table, index_name)
+        if existing == tuple(columns):
+            continue
+        if existing:
+            logger.warning(f"Index {table}.{index_name} exists with columns {existing}, expected {columns}; leaving it")
+            continue
+        logger.info(f"Creating FULLTEXT index {table}.{index_name} ({', '.join(columns)})")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD FULLTEXT INDEX {index_name} ({', '.join(columns)}), "
+            f"ALGORITHM=INPLACE, LOCK=SHARED"
+        )
+
+def _add_story_code_columns(cursor):
+    """Add the generated story_code columns, then index them."""
+    for table, column in STORY_CODE_COLUMNS:
+        if not _table_exists(cursor, table):
+            logger.warning(f"Skipping {table}.{column}: table {table} does not exist")
+            continue
+        if _column_exists(cursor, table, column):
+            continue
+        logger.info(f"Adding generated column {table}.{column}")
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {STORY_CODE_DEFINITION}")
+    _add_indexes(cursor, STORY_CODE_INDEXES)
+
+def _canonicalize_story_node_json(cursor):
+    """Rewrite story_nodes choices/conditions in the canonical single encoding.
+
+    Double-encoded values are unwrapped and flags normalized, exactly as
+    create_node/update_node now write them. Rows that do not validate are
+    logged and left as they are.
+    """
+    if not _table_exists(cursor, 'story_nodes'):
+        logger.warning("Skipping story node repair: table story_nodes does not exist")
+        return
+    repaired = invalid = 0
+    last_id = ''
+    while True:
+        cursor.execute(
+            "SELECT id, choices, conditions FROM story_nodes WHERE id > %s ORDER BY id LIMIT %s",
+            (last_id, REPAIR_BATCH_SIZE)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for row in rows:
+            try:
+                choices = json.dumps(normalize_choices(decode_json_field(row['choices'], {})))
+                conditions = json.dumps(normalize_conditions(decode_json_field(row['conditions'], [])))
+            except ValueError as e:
+                logger.warning(f"Leaving story node {row['id']} unrepaired: {e}")
+                invalid += 1
+                continue
+            if choices != row['choices'] or conditions != row['conditions']:
+                cursor.execute(
+                    "UPDATE story_nodes SET choices = %s, conditions = %s WHERE id = %s",
+                    (choices, conditions, row['id'])
+                )
+                repaired += 1
+        last_id = rows[-1]['id']
+    logger.info(f"Canonicalized {repaired} story nodes ({invalid} left unrepaired)")
+
+def _create_choice_transition_tables(cursor):
+    """Create the watermark table and the Kobayashi choice transition matrix."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_watermarks (
+        name VARCHAR(64) PRIMARY KEY,
+        last_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_choice_transitions (
+        story_code VARCHAR(32) NOT NULL,
+        node_id VARCHAR(64) NOT NULL,
+        choice VARCHAR(64) NOT NULL,
+        next_node_id VARCHAR(64) NOT NULL DEFAULT '',
+        transitions BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (story_code, node_id, choice, next_node_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+def _create_tribble_rollup_table(cursor):
+    """Create the hourly/daily/weekly tribble outcome rollups."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_tribble_rollups (
+        resolution VARCHAR(8) NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        event_id INT NOT NULL DEFAULT 0,
+        total INT NOT NULL DEFAULT 0,
+        claimed INT NOT NULL DEFAULT 0,
+        escaped INT NOT NULL DEFAULT 0,
+        borg_caught INT NOT NULL DEFAULT 0,
+        borg_escaped INT NOT NULL DEFAULT 0,
+        borg_defeated INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (resolution, bucket_start, event_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+def _create_counted_choices_table(cursor):
+    """Create the ids folded into the transition matrix within its re-scan window.
+
+    Ids already below an existing watermark are recorded as counted so the
+    first re-scan does not count them again.
+    """
+    from models.choice_transitions import RESCAN_WINDOW, WATERMARK_NAME
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_counted_choices (
+        id BIGINT PRIMARY KEY
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+    if not _column_exists(cursor, 'player_choices', 'id'):
+        return
+    watermark = get_watermark(cursor, WATERMARK_NAME)
+    if watermark:
+        cursor.execute("""
+            INSERT IGNORE INTO dashboard_counted_choices (id)
+            SELECT id FROM player_choices WHERE id > %s AND id <= %s
+        """, (watermark - RESCAN_WINDOW, watermark))
+
+# Ordered list of (version, name, function). Never renumber or remove entries;
+# append new migrations with the next version number.
+MIGRATIONS = [
+    (1, 'create_dashboard_tables', _create_dashboard_tables),
+    (2, 'migrate_anonymous_sessions', _migrate_anonymous_sessions),
+    (3, 'add_analytics_indexes', _add_analytics_indexes),
+    (4, 'add_story_code_columns', _add_story_code_columns),
+    (5, 'add_participation_indexes', _add_participation_indexes),
+    (6, 'add_story_node_index', _add_story_node_index),
+    (7, 'canonicalize_story_node_json', _canonicalize_story_node_json),
+    (8, 'create_choice_transition_tables', _create_choice_transition_tables),
+    (9, 'add_run_timeline_indexes', _add_run_timeline_indexes),
+    (10, 'add_fulltext_indexes', _add_fulltext_indexes),
+    (11, 'create_tribble_rollup_table', _create_tribble_rollup_table),
+    (12, 'create_counted_choices_table', _create_counted_choices_table),
+]
+
+def _ensure_version_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_schema_version (
+        version INT PRIMARY KEY,
+        name VARCHAR(128) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+def get_schema_version(cursor):
+    """Return the highest applied migration version (0 if none)."""
+    cursor.execute("SELECT MAX(version) as version FROM dashboard_schema_version")
+    row = cursor.fetchone()
+    return row['version'] if row and row['version'] is not None else 0
+
+def latest_version():
+    """Return the version the code expects the schema to be at."""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def ensure_indexes():
+    """Create any analytics and search indexes (and story_code columns) that are still missing.
+
+    The index migrations skip tables the bot had not created yet; this
+    catches up once they exist.
+
+    Returns:
+        list: (table, index name, columns) entries still missing afterwards
+    """
+    conn = checkout_db()
+    try:
+        with conn.cursor() as cursor:
+            if missing_indexes(cursor):
+                _add_story_code_columns(cursor)
+                _add_indexes(cursor, ANALYTICS_INDEXES)
+                _add_fulltext_indexes(cursor)
+            return missing_indexes(cursor)
+    finally:
+        release_db(conn)
+
+def run_migrations():
+    """Apply any pending migrations.
+
+    Safe to call from every worker: a MySQL advisory lock serializes runners
+    and already-applied versions are skipped.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    applied = []
+    conn = checkout_db()
+    locked = False
+    try:
+        with conn.cursor() as cursor:
+            _ensure_version_table(cursor)
+            conn.commit()
+
+            # Fast path: nothing to do, no lock needed
+            if get_schema_version(cursor) >= latest_version():
+                return applied
+
+            cursor.execute("SELECT GET_LOCK(%s, %s) as locked", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+            row = cursor.fetchone()
+            locked = bool(row and row['locked'])
+            if not locked:
+                raise RuntimeError("Timed out waiting for the schema migration lock")
+
+            # Re-read under the lock; another worker may have finished already
+            current = get_schema_version(cursor)
+            for version, name, migration in MIGRATIONS:
+                if version <= current:
+                    continue
+                logger.info(f"Applying schema migration {version}: {name}")
+                migration(cursor)
+                cursor.execute(
+                    "INSERT INTO dashboard_schema_version (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+                conn.commit()
+                applied.append(version)
+
+        if applied:
+            logger.info(f"Schema migrated to version {applied[-1]}")
+        return applied
+    except Exception as e:
+        logger.error(f"Error running schema migrations: {e}")
+        conn.rollback()
+        raise
+    finally:
+        if locked:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+            except Exception:
+                pass
+        release_db(conn)
@@ -1,4 +1,3 @@
-import mysql.connector
 import json
 from models.db import get_db
 
@@ -1,4 +1,3 @@
-import mysql.connector
 import json
 from datetime import datetime
 from models.db import get_db
@@ -0,0 +1,102 @@
+"""
+Timeline of a single Kobayashi run.
+
+Merges a run's player_choices, user_points and custom_actions rows into one
+time-ordered event stream. The three sources are read with indexed run_id
+lookups in a single UNION ALL ordered by time, and node and choice labels come
+from the compiled story graph, so a run costs two queries however large the
+tables are. The event rows are read through an unbuffered cursor on a
+dedicated connection (models.db.iter_unbuffered) as the stream is consumed,
+so the NDJSON endpoint never holds the whole run in memory.
+
+The bot's tables are not guaranteed to have an id column (see
+kobayashi_analytics.get_runs_watermark); a source without one reports id
+None and its same-second events keep whatever order MySQL returns.
+"""
+
+import logging
+from models.db import get_db, iter_unbuffered
+from models.story_graph import get_story_graph
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TABLES = ('player_choices', 'custom_actions', 'user_points')
+
+# Ties in time keep choices before custom actions before points, then id order;
+# {player_choices} etc. are each table's id expression
+TIMELINE_SQL = """
+    SELECT 'choice' as type, 0 as source_rank, {player_choices} as id, user_id, node_id, choice,
+           NULL as points, NULL as text, timestamp
+    FROM player_choices WHERE run_id = %s
+    UNION ALL
+    SELECT 'custom_action', 1, {custom_actions}, user_id, node_id, NULL, NULL, text, submitted_at
+    FROM custom_actions WHERE run_id = %s
+    UNION ALL
+    SELECT 'points', 2, {user_points}, user_id, NULL, NULL, points, NULL, timestamp
+    FROM user_points WHERE run_id = %s
+    ORDER BY timestamp, source_rank, id
+"""
+
+_timeline_sql = None
+
+def _timeline_statement(cursor):
+    """TIMELINE_SQL with NULL in place of id for tables that lack the column (checked once per process)."""
+    global _timeline_sql
+    if _timeline_sql is None:
+        cursor.execute(f"""
+            SELECT TABLE_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_NAME = 'id'
+            AND TABLE_NAME IN ({', '.join(['%s'] * len(SOURCE_TABLES))})
+        """, SOURCE_TABLES)
+        with_id = {row['TABLE_NAME'] for row in cursor.fetchall()}
+        for table in SOURCE_TABLES:
+            if table not in with_id:
+                logger.warning(f"{table} has no id column; run timeline events from it carry no id")
+        _timeline_sql = TIMELINE_SQL.format(**{
+            table: 'id' if table in with_id else 'NULL' for table in SOURCE_TABLES
+        })
+    return _timeline_sql
+
+def _story_for_run(cursor, run_id):
+    """Run ids look like '<story code>_<user>_<n>'; return that story's row or None."""
+    cursor.execute("SELECT id, title, code FROM stories WHERE code = %s", (run_id.split('_', 1)[0],))
+    return cursor.fetchone()
+
+def _events(rows, nodes):
+    for row in rows:
+        node = nodes.get(row['node_id']) or {}
+        event = {
+            'type': row['type'],
+            'id': row['id'],
+            'timestamp': row['timestamp'],
+            'user_id': row['user_id'],
+            'node_id': row['node_id'],
+            'node_title': node.get('title'),
+        }
+        if row['type'] == 'choice':
+            choice = node.get('choices', {}).get(row['choice']) or {}
+            event.update(choice=row['choice'], choice_text=choice.get('text'), next_node_id=choice.get('next'))
+        elif row['type'] == 'points':
+            event['points'] = row['points']
+        else:
+            event['text'] = row['text']
+        yield event
+
+def iter_run_timeline(run_id):
+    """Return (story, events) for a run.
+
+    The events query runs when the iterator is first advanced, so it must be
+    consumed inside an app context (stream_with_context for responses).
+
+    Returns:
+        tuple: (story row or None, iterator of event dicts in time order; each
+               has type 'choice', 'points' or 'custom_action', id, timestamp,
+               user_id, node_id, node_title and type-specific fields)
+    """
+    conn = get_db()
+    with conn.cursor() as cursor:
+        story = _story_for_run(cursor, run_id)
+        sql = _timeline_statement(cursor)
+
+    nodes = get_story_graph(story['id'])['nodes'] if story else {}
+    return story, _events(iter_unbuffered(sql, (run_id, run_id, run_id)), nodes)
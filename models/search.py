@@ -0,0 +1,120 @@
+"""
+Full-text search over Kobayashi custom actions, story nodes, quizzes and questions.
+
+Each scope is one FULLTEXT MATCH ... AGAINST query (natural language mode)
+over an index created by migration 10. Results are ranked by relevance and
+paged with a keyset cursor on (relevance, id), so later pages cost the same
+as the first instead of scanning and discarding OFFSET rows.
+"""
+
+import logging
+from models.db import get_db, release_db
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 50  # results per page
+RELEVANCE_PRECISION = 6  # relevance is rounded so the cursor compares exactly
+
+# scope -> query parts. 'id' is the unique tie-breaker column and 'match' the
+# FULLTEXT index columns, in index order.
+SEARCH_SOURCES = {
+    'actions': {
+        'label': 'Custom Actions',
+        'from': 'custom_actions ca LEFT JOIN story_nodes sn ON sn.id = ca.node_id',
+        'select': 'ca.id, ca.run_id, ca.node_id, ca.user_id, ca.text, ca.submitted_at, sn.title as node_title',
+        'id': 'ca.id',
+        'id_type': int,
+        'match': ('ca.text',),
+    },
+    'nodes': {
+        'label': 'Story Nodes',
+        'from': 'story_nodes sn JOIN stories s ON s.id = sn.story_id',
+        'select': 'sn.id, sn.story_id, sn.title, sn.description, s.title as story_title',
+        'id': 'sn.id',
+        'id_type': str,
+        'match': ('sn.title', 'sn.description'),
+    },
+    'quizzes': {
+        'label': 'Quizzes',
+        'from': 'quizzes q',
+        'select': 'q.quiz_id as id, q.quiz_name, q.creator_username',
+        'id': 'q.quiz_id',
+        'id_type': int,
+        'match': ('q.quiz_name',),
+    },
+    'questions': {
+        'label': 'Questions',
+        'from': 'questions qu JOIN quizzes q ON q.quiz_id = qu.quiz_id',
+        'select': 'qu.question_id as id, qu.quiz_id, qu.question, qu.explanation, q.quiz_name',
+        'id': 'qu.question_id',
+        'id_type': int,
+        'match': ('qu.question', 'qu.explanation'),
+    },
+}
+
+def encode_cursor(row):
+    """Return the keyset cursor that continues after a result row."""
+    return f"{row['relevance']:.{RELEVANCE_PRECISION}f}:{row['id']}"
+
+def decode_cursor(scope, cursor_value):
+    """Parse a cursor from encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    relevance, _, result_id = cursor_value.partition(':')
+    if not result_id:
+        raise ValueError("invalid search cursor")
+    return round(float(relevance), RELEVANCE_PRECISION), SEARCH_SOURCES[scope]['id_type'](result_id)
+
+def search(scope, query, after=None, limit=20):
+    """Search one scope, most relevant first.
+
+    Args:
+        scope (str): A SEARCH_SOURCES key
+        query (str): Search terms (natural language mode)
+        after (str): Cursor from a previous page's next_after
+        limit (int): Results per page, capped at MAX_RESULTS
+
+    Returns:
+        dict: results (rows with a relevance score) and next_after (None on
+              the last page)
+
+    Raises:
+        ValueError: If the scope or cursor is invalid
+    """
+    if scope not in SEARCH_SOURCES:
+        raise ValueError(f"unknown search scope {scope!r}")
+    query = (query or '').strip()
+    if not query:
+        return {'results': [], 'next_after': None}
+    source = SEARCH_SOURCES[scope]
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    relevance = (
+        f"ROUND(MATCH({', '.join(source['match'])}) AGAINST (%s IN NATURAL LANGUAGE MODE), "
+        f"{RELEVANCE_PRECISION})"
+    )
+    sql = f"""
+        SELECT {source['select']}, {relevance} as relevance
+        FROM {source['from']}
+        WHERE MATCH({', '.join(source['match'])}) AGAINST (%s IN NATURAL LANGUAGE MODE)
+    """
+    params = [query, query]
+    if after:
+        last_relevance, last_id = decode_cursor(scope, after)
+        sql += f" AND ({relevance} < %s OR ({relevance} = %s AND {source['id']} < %s))"
+        params += [query, last_relevance, query, last_relevance, last_id]
+    sql += f" ORDER BY relevance DESC, {source['id']} DESC LIMIT %s"
+    params.append(limit + 1)
+
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, tuple(params))
+            rows = cursor.fetchall()
+    finally:
+        release_db(conn)
+
+    next_after = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {'results': rows[:limit], 'next_after': next_after}
@@ -0,0 +1,221 @@
+"""
+JSON story bundles for moving Kobayashi stories between environments.
+
+A bundle holds one story and all of its nodes:
+
+    {
+      "format": "badgey-story", "version": 1,
+      "story": {"title": ..., "intro": ..., "code": ..., "author": ...},
+      "nodes": [{"id": ..., "title": ..., "description": ..., "choices": {...},
+                 "conditions": [...], "is_terminal": false,
+                 "ending_type": null, "ending_text": null}, ...]
+    }
+
+Imports validate the whole graph before touching the database and then
+write the story and its nodes in one transaction with multi-row INSERTs.
+Exports are generated in keyset batches so they can be streamed.
+"""
+
+import json
+import logging
+from datetime import datetime
+from models.db import get_db
+from models.kobayashi import get_nodes_for_story, get_story, invalidate_story_nodes
+from models.story_graph import decode_json_field, normalize_choices, normalize_conditions
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 'badgey-story'
+BUNDLE_VERSION = 1
+INSERT_BATCH_SIZE = 500  # nodes per multi-row INSERT
+EXPORT_BATCH_SIZE = 500  # nodes read per export query
+MAX_NODE_ID_LENGTH = 64
+MAX_CODE_LENGTH = 32  # stories.code and the generated story_code columns are VARCHAR(32)
+MAX_ERRORS = 20  # validation errors reported per bundle
+
+class BundleError(ValueError):
+    """Raised when a story bundle fails validation; carries every problem found."""
+
+    def __init__(self, errors):
+        self.errors = errors[:MAX_ERRORS]
+        super().__init__('; '.join(self.errors))
+
+def validate_bundle(bundle):
+    """Validate a decoded bundle and return its story and nodes in canonical form.
+
+    Checks the envelope, required fields, the story code (no '_', at most
+    MAX_CODE_LENGTH characters), duplicate node ids and that every choice
+    points at a node in the bundle.
+
+    Returns:
+        tuple: (story dict, list of node dicts)
+
+    Raises:
+        BundleError: Listing every problem found
+    """
+    errors = []
+    if not isinstance(bundle, dict) or bundle.get('format') != BUNDLE_FORMAT:
+        raise BundleError([f"not a {BUNDLE_FORMAT} bundle"])
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise BundleError([f"unsupported bundle version {bundle.get('version')!r}"])
+
+    story = bundle.get('story') or {}
+    if not isinstance(story, dict):
+        raise BundleError(["story must be an object"])
+    for field in ('title', 'code'):
+        if not isinstance(story.get(field), str) or not story[field].strip():
+            errors.append(f"story {field} is required")
+    code = story.get('code')
+    if isinstance(code, str) and code.strip():
+        # Run ids are '<code>_<user>_<n>' and split on the first '_'
+        if '_' in code:
+            errors.append("story code must not contain '_'")
+        if len(code) > MAX_CODE_LENGTH:
+            errors.append(f"story code must be at most {MAX_CODE_LENGTH} characters")
+
+    raw_nodes = bundle.get('nodes')
+    if not isinstance(raw_nodes, list) or not raw_nodes:
+        errors.append("nodes must be a non-empty list")
+        raw_nodes = []
+
+    nodes = []
+    seen = set()
+    for n, raw in enumerate(raw_nodes):
+        if not isinstance(raw, dict):
+            errors.append(f"node {n} must be an object")
+            continue
+        node_id = raw.get('id')
+        label = f"node {node_id!r}" if node_id else f"node {n}"
+        if not isinstance(node_id, str) or not node_id.strip() or len(node_id) > MAX_NODE_ID_LENGTH:
+            errors.append(f"{label}: id must be a string of 1-{MAX_NODE_ID_LENGTH} characters")
+            continue
+        if node_id in seen:
+            errors.append(f"{label}: duplicate id")
+            continue
+        seen.add(node_id)
+        if not raw.get('title'):
+            errors.append(f"{label}: title is required")
+        try:
+            choices = normalize_choices(decode_json_field(raw.get('choices'), {}))
+            conditions = normalize_conditions(decode_json_field(raw.get('conditions'), []))
+        except ValueError as e:
+            errors.append(f"{label}: {e}")
+            continue
+        nodes.append({
+            'id': node_id,
+            'title': raw.get('title'),
+            'description': raw.get('description'),
+            'choices': choices,
+            'conditions': conditions,
+            'is_terminal': bool(raw.get('is_terminal')),
+            'ending_type': raw.get('ending_type'),
+            'ending_text': raw.get('ending_text'),
+        })
+
+    for node in nodes:
+        for key, choice in node['choices'].items():
+            if choice['next'] is not None and choice['next'] not in seen:
+                errors.append(f"node {node['id']!r}: choice {key!r} points at missing node {choice['next']!r}")
+
+    if errors:
+        raise BundleError(errors)
+    return story, nodes
+
+def import_bundle(bundle, author):
+    """Create a new story from a bundle in one transaction.
+
+    Args:
+        bundle (dict): Decoded bundle
+        author (str): Author recorded on the new story
+
+    Returns:
+        dict: story_id and node_count of the imported story
+
+    Raises:
+        BundleError: If the bundle is invalid or clashes with existing data
+    """
+    story, nodes = validate_bundle(bundle)
+    node_ids = [node['id'] for node in nodes]
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            # Node ids are global primary keys, and run ids are built from the story code
+            errors = []
+            cursor.execute("SELECT id FROM stories WHERE code = %s", (story['code'],))
+            if cursor.fetchone():
+                errors.append(f"a story with code {story['code']!r} already exists")
+            for i in range(0, len(node_ids), INSERT_BATCH_SIZE):
+                batch = node_ids[i:i + INSERT_BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"SELECT id FROM story_nodes WHERE id IN ({placeholders})", tuple(batch))
+                errors.extend(f"node {row['id']!r} already exists" for row in cursor.fetchall())
+            if errors:
+                raise BundleError(errors)
+
+            cursor.execute(
+                'INSERT INTO stories (title, intro, code, author, created_at) VALUES (%s, %s, %s, %s, %s)',
+                (story['title'], story.get('intro'), story['code'], author, datetime.utcnow())
+            )
+            story_id = cursor.lastrowid
+            rows = [(
+                story_id, node['id'], node['title'], node['description'],
+                json.dumps(node['choices']), json.dumps(node['conditions']),
+                int(node['is_terminal']), node['ending_type'], node['ending_text'],
+            ) for node in nodes]
+            # pymysql folds executemany INSERT ... VALUES into one multi-row statement
+            for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                cursor.executemany(
+                    '''INSERT INTO story_nodes
+                    (story_id, id, title, description, choices, conditions, is_terminal, ending_type, ending_text)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
+                    rows[i:i + INSERT_BATCH_SIZE]
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    invalidate_story_nodes(story_id)
+    logger.info(f"Imported story {story_id} ({story['code']}) with {len(nodes)} nodes")
+    return {'story_id': story_id, 'node_count': len(nodes)}
+
+def iter_bundle(story_id):
+    """Yield a story's bundle as JSON text chunks, reading nodes in batches.
+
+    Returns None if the story does not exist.
+    """
+    story = get_story(story_id)
+    if not story:
+        return None
+
+    def generate():
+        header = {
+            'format': BUNDLE_FORMAT,
+            'version': BUNDLE_VERSION,
+            'story': {field: story.get(field) for field in ('title', 'intro', 'code', 'author')},
+        }
+        yield json.dumps(header)[:-1] + ', "nodes": ['
+        after_id = None
+        first = True
+        while True:
+            rows = get_nodes_for_story(story_id, limit=EXPORT_BATCH_SIZE, after_id=after_id)
+            if not rows:
+                break
+            chunk = []
+            for row in rows:
+                chunk.append(json.dumps({
+                    'id': row['id'],
+                    'title': row['title'],
+                    'description': row['description'],
+                    'choices': decode_json_field(row['choices'], {}),
+                    'conditions': decode_json_field(row['conditions'], []),
+                    'is_terminal': bool(row['is_terminal']),
+                    'ending_type': row['ending_type'],
+                    'ending_text': row['ending_text'],
+                }))
+            yield ('' if first else ',\n') + ',\n'.join(chunk)
+            first = False
+            after_id = rows[-1]['id']
+        yield ']}\n'
+
+    return generate()
@@ -0,0 +1,244 @@
+"""
+Exhaustive path explorer for Kobayashi stories.
+
+Walks a compiled story graph (models/story_graph.py) over states of
+(node, flags held). A choice is available when its flags_required are held
+and the flags after taking it (plus its flags_set) meet the target node's
+conditions. Every state is expanded once, so the work grows with the number
+of distinct states rather than the number of paths; path counts per ending
+come from a memoized pass over the resulting state graph. Paths that would
+revisit a state already on the current path (loops) are counted once, not
+followed.
+
+Expansion runs in the calling process. Page loads stop at
+REQUEST_MAX_STATES so a request stays well inside the worker timeout;
+`flask explore-story <id>` explores up to MAX_STATES and caches the full
+report. Reports are cached per story graph version.
+`python benchmarks/story_explorer.py` times synthetic stories.
+"""
+
+import json
+import logging
+import time
+from collections import Counter, deque
+from models.story_graph import GRAPH_TTL, get_story_graph
+from redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+MAX_STATES = 200000  # stop expanding (and flag the report truncated) beyond this
+REQUEST_MAX_STATES = 50000  # expansion limit when a page load builds the report
+SAMPLE_DEAD_END_FLAGS = 5  # flag sets listed per dead-end node
+
+# story_id -> report, used when Redis is unavailable
+_local_reports = {}
+
+def _expand(graph, roots, max_states=MAX_STATES):
+    """Breadth-first expansion of every state reachable from `roots`.
+
+    Returns:
+        tuple: (edges, broken, truncated) where edges maps each expanded
+               state to its [(choice key, next state)] and broken is a set of
+               (node id, choice key, missing target) links
+    """
+    nodes = graph['nodes']
+    edges = {}
+    broken = set()
+    queue = deque(roots)
+    while queue:
+        state = queue.popleft()
+        if state in edges:
+            continue
+        if len(edges) >= max_states:
+            return edges, broken, True
+        node_id, flags = state
+        node = nodes[node_id]
+        held = set(flags)
+        out = []
+        if not node['is_terminal']:
+            for key, choice in node['choices'].items():
+                if not held.issuperset(choice['flags_required']):
+                    continue
+                target = nodes.get(choice['next'])
+                if target is None:
+                    broken.add((node_id, key, choice['next']))
+                    continue
+                next_flags = held.union(choice['flags_set'])
+                if not next_flags.issuperset(target['conditions']):
+                    continue
+                next_state = (target['id'], tuple(sorted(next_flags)))
+                out.append((key, next_state))
+                if next_state not in edges:
+                    queue.append(next_state)
+        edges[state] = out
+    return edges, broken, False
+
+def _count_paths(graph, edges, start):
+    """Count paths from `start` to each ending, memoized per state.
+
+    Returns:
+        tuple: (Counter of ending node id -> paths, number of loop edges skipped)
+    """
+    nodes = graph['nodes']
+    counts = {}
+    on_path = {start}
+    stack = [(start, 0)]
+    loops = 0
+    while stack:
+        state, i = stack[-1]
+        out = edges.get(state, [])
+        if i < len(out):
+            stack[-1] = (state, i + 1)
+            next_state = out[i][1]
+            if next_state in on_path:
+                loops += 1
+            elif next_state not in counts:
+                on_path.add(next_state)
+                stack.append((next_state, 0))
+            continue
+        stack.pop()
+        on_path.discard(state)
+        total = Counter()
+        if nodes[state[0]]['is_terminal']:
+            total[state[0]] += 1
+        for _, next_state in out:
+            # States still on the path are loops and contribute nothing
+            if next_state in counts:
+                total.update(counts[next_state])
+        counts[state] = total
+    return counts[start], loops
+
+def _sample_paths(edges, start, endings):
+    """Shortest [{'node_id', 'choice'}] path from `start` to each ending node."""
+    parents = {start: None}
+    found = {}
+    queue = deque([start])
+    while queue and len(found) < len(endings):
+        state = queue.popleft()
+        if state[0] in endings and state[0] not in found:
+            found[state[0]] = state
+        for key, next_state in edges.get(state, []):
+            if next_state not in parents:
+                parents[next_state] = (state, key)
+                queue.append(next_state)
+
+    paths = {}
+    for node_id, state in found.items():
+        steps = [{'node_id': state[0], 'choice': None}]
+        while parents[state] is not None:
+            state, key = parents[state]
+            steps.append({'node_id': state[0], 'choice': key})
+        paths[node_id] = list(reversed(steps))
+    return paths
+
+def explore_graph(graph, max_states=MAX_STATES):
+    """Explore every reachable path of a compiled story graph.
+
+    Args:
+        graph (dict): Compiled graph from models.story_graph
+        max_states (int): Expansion limit
+
+    Returns:
+        dict: Report with path counts per ending, unreachable nodes, dead
+              ends, broken links and loop count
+    """
+    started = time.perf_counter()
+    nodes = graph['nodes']
+    report = {
+        'story_id': graph['story_id'],
+        'version': graph['version'],
+        'node_count': len(nodes),
+        'state_count': 0,
+        'truncated': False,
+        'total_paths': 0,
+        'loops': 0,
+        'endings': [],
+        'ending_types': {},
+        'unreachable': [],
+        'dead_ends': [],
+        'broken_links': [],
+        'elapsed_ms': 0.0,
+    }
+    if graph['start'] is None:
+        return report
+
+    start = (graph['start'], ())
+    edges, broken, truncated = _expand(graph, [start], max_states)
+
+    ending_counts, loops = _count_paths(graph, edges, start)
+    samples = _sample_paths(edges, start, set(ending_counts))
+    total_paths = sum(ending_counts.values())
+
+    ending_types = Counter()
+    for node_id, paths in ending_counts.items():
+        ending_types[nodes[node_id]['ending_type'] or 'unspecified'] += paths
+
+    dead_ends = {}
+    for state, out in edges.items():
+        if not out and not nodes[state[0]]['is_terminal']:
+            dead_ends.setdefault(state[0], []).append(list(state[1]))
+
+    reachable = {state[0] for state in edges}
+    report.update({
+        'state_count': len(edges),
+        'truncated': truncated,
+        'total_paths': total_paths,
+        'loops': loops,
+        'endings': [{
+            'node_id': node_id,
+            'title': nodes[node_id]['title'],
+            'ending_type': nodes[node_id]['ending_type'],
+            'paths': paths,
+            'share': round(paths / total_paths * 100, 1) if total_paths else 0,
+            'sample_path': samples.get(node_id, []),
+        } for node_id, paths in ending_counts.most_common()],
+        'ending_types': dict(ending_types.most_common()),
+        'unreachable': [{'node_id': node_id, 'title': nodes[node_id]['title']}
+                        for node_id in graph['order'] if node_id not in reachable],
+        'dead_ends': [{'node_id': node_id, 'title': nodes[node_id]['title'],
+                       'states': len(flag_sets), 'flag_sets': flag_sets[:SAMPLE_DEAD_END_FLAGS]}
+                      for node_id, flag_sets in sorted(dead_ends.items())],
+        'broken_links': [{'node_id': node_id, 'choice': key, 'next': target}
+                         for node_id, key, target in sorted(broken, key=str)],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+    return report
+
+def get_story_exploration(story_id, max_states=REQUEST_MAX_STATES, refresh=False):
+    """Return the exploration report for a story's current graph version.
+
+    Reports are cached in Redis per graph version, so they are recomputed
+    only after a node is created, edited or deleted.
+
+    Args:
+        story_id (int): Story to explore
+        max_states (int): Expansion limit when the report has to be built
+        refresh (bool): Rebuild even if a report is cached
+    """
+    graph = get_story_graph(story_id)
+    key = redis_key('kobayashi', 'explore', story_id, graph['version'])
+    client = get_redis()
+    if not refresh:
+        if client is not None:
+            try:
+                raw = client.get(key)
+                if raw:
+                    return json.loads(raw)
+            except Exception as e:
+                logger.error(f"Error reading story exploration from Redis: {e}")
+        else:
+            local = _local_reports.get(story_id)
+            if local and local['version'] == graph['version']:
+                return local
+
+    report = explore_graph(graph, max_states=max_states)
+    logger.info(f"Explored story {story_id} v{graph['version']}: {report['state_count']} states, "
+                f"{report['total_paths']} paths in {report['elapsed_ms']}ms")
+    if client is not None:
+        try:
+            client.setex(key, GRAPH_TTL, json.dumps(report))
+        except Exception as e:
+            logger.error(f"Error storing story exploration in Redis: {e}")
+    else:
+        _local_reports[story_id] = report
+    return report
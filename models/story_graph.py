@@ -0,0 +1,225 @@
+"""
+Compiled Kobayashi story graphs.
+
+A story's nodes are loaded once and compiled: nodes are indexed by id, the
+choices and conditions JSON is decoded, and flags are normalized to lists of
+names; the same normalization defines the canonical encoding create_node and
+update_node store. Compiled graphs are kept in process memory and in Redis
+under a per-story version stamp. create_node, update_node and delete_node
+bump the stamp, so every worker picks up the change on its next lookup while
+simulation steps in between are dict lookups with no SQL.
+
+Without Redis the stamp is local to the process, so other workers only see
+an edit once their copy is older than LOCAL_GRAPH_TTL.
+"""
+
+import json
+import logging
+import time
+from models.db import get_db
+from redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+GRAPH_TTL = 24 * 3600  # seconds a compiled graph is kept in Redis
+LOCAL_GRAPH_TTL = 60  # seconds a process trusts its copy when Redis is down
+
+# story_id -> {'version', 'loaded_at', 'graph'}
+_graphs = {}
+# story_id -> version, used when Redis is unavailable
+_local_versions = {}
+
+def robust_json_loads(val):
+    """Decode JSON, unwrapping values that were encoded more than once."""
+    tries = 0
+    while isinstance(val, str) and tries < 3:
+        try:
+            val = json.loads(val)
+        except Exception:
+            break
+        tries += 1
+    return val
+
+def decode_json_field(val, default):
+    """Decode a stored choices/conditions value.
+
+    Canonical rows take exactly one json.loads. Values that still decode to a
+    string were double-encoded by older writers (migration 7 repairs them)
+    and are unwrapped as a fallback.
+    """
+    if val is None or val == '':
+        return default
+    if not isinstance(val, str):
+        return val
+    try:
+        decoded = json.loads(val)
+    except ValueError:
+        return default
+    if isinstance(decoded, str):
+        decoded = robust_json_loads(decoded)
+    return decoded
+
+def _flag_names(val):
+    """Normalize a flag list: a comma-separated string, names or {"flag": name} dicts."""
+    if isinstance(val, str):
+        val = val.split(',')
+    if not isinstance(val, list):
+        return []
+    names = []
+    for item in val:
+        if isinstance(item, dict):
+            item = item.get('flag')
+        if isinstance(item, str) and item.strip() and item.strip() not in names:
+            names.append(item.strip())
+    return names
+
+def normalize_choices(choices):
+    """Validate node choices and return them in canonical form.
+
+    Canonical choices map each key to an object with text, next (None when
+    empty), and flags_required/flags_set as lists of flag names. Any other
+    keys on a choice are kept.
+
+    Raises:
+        ValueError: If choices is not an object of non-empty keys to objects
+    """
+    if choices is None:
+        return {}
+    if not isinstance(choices, dict):
+        raise ValueError("choices must be an object keyed by choice key")
+    normalized = {}
+    for key, choice in choices.items():
+        if not isinstance(key, str) or not key.strip():
+            raise ValueError("choice keys must be non-empty strings")
+        if not isinstance(choice, dict):
+            raise ValueError(f"choice {key!r} must be an object")
+        next_id = choice.get('next')
+        if next_id is not None and not isinstance(next_id, str):
+            raise ValueError(f"choice {key!r} has a non-string next node")
+        normalized[key.strip()] = dict(
+            choice,
+            text=str(choice.get('text') or ''),
+            next=(next_id.strip() or None) if next_id else None,
+            flags_required=_flag_names(choice.get('flags_required', [])),
+            flags_set=_flag_names(choice.get('flags_set', [])),
+        )
+    return normalized
+
+def normalize_conditions(conditions):
+    """Validate node conditions and return them as [{"flag": name}].
+
+    Raises:
+        ValueError: If conditions is not a list of flag names or {"flag": name} objects
+    """
+    if conditions is None:
+        return []
+    if not isinstance(conditions, list):
+        raise ValueError("conditions must be a list")
+    for item in conditions:
+        flag = item.get('flag') if isinstance(item, dict) else item
+        if not isinstance(flag, str):
+            raise ValueError("each condition must be a flag name or {\"flag\": name}")
+    return [{'flag': name} for name in _flag_names(conditions)]
+
+def compile_node(row):
+    """Compile one story_nodes row into a node dict with decoded choices and conditions."""
+    try:
+        choices = normalize_choices(decode_json_field(row.get('choices'), {}))
+    except ValueError as e:
+        logger.warning(f"Ignoring invalid choices on story node {row['id']}: {e}")
+        choices = {}
+    return {
+        'id': row['id'],
+        'title': row.get('title'),
+        'description': row.get('description'),
+        'choices': choices,
+        'conditions': _flag_names(decode_json_field(row.get('conditions'), [])),
+        'is_terminal': bool(row.get('is_terminal')),
+        'ending_type': row.get('ending_type'),
+        'ending_text': row.get('ending_text'),
+    }
+
+def compile_graph(story_id, rows, version=0):
+    """Compile a story's node rows (in id order) into a graph.
+
+    Returns:
+        dict: story_id, version, start (first node id or None), order (node
+              ids in id order) and nodes (node id -> compiled node)
+    """
+    nodes = {}
+    order = []
+    for row in rows:
+        node = compile_node(row)
+        nodes[node['id']] = node
+        order.append(node['id'])
+    return {
+        'story_id': story_id,
+        'version': version,
+        'start': order[0] if order else None,
+        'order': order,
+        'nodes': nodes,
+    }
+
+def _version_key(story_id):
+    return redis_key('kobayashi', 'graph_version', story_id)
+
+def _graph_key(story_id, version):
+    return redis_key('kobayashi', 'graph', story_id, version)
+
+def _current_version(client, story_id):
+    if client is not None:
+        try:
+            return int(client.get(_version_key(story_id)) or 0)
+        except Exception as e:
+            logger.error(f"Error reading story graph version from Redis: {e}")
+    return _local_versions.get(story_id, 0)
+
+def _load_rows(story_id):
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT * FROM story_nodes WHERE story_id = %s ORDER BY id', (story_id,))
+        return cursor.fetchall()
+
+def get_story_graph(story_id):
+    """Return the compiled graph for a story, compiling it on first use.
+
+    Lookups cost one Redis GET for the version stamp; the graph itself comes
+    from process memory, then Redis, and only then from MySQL.
+    """
+    client = get_redis()
+    version = _current_version(client, story_id)
+    entry = _graphs.get(story_id)
+    if entry and entry['version'] == version and (
+            client is not None or time.time() - entry['loaded_at'] < LOCAL_GRAPH_TTL):
+        return entry['graph']
+
+    graph = None
+    if client is not None:
+        try:
+            raw = client.get(_graph_key(story_id, version))
+            if raw:
+                graph = json.loads(raw)
+        except Exception as e:
+            logger.error(f"Error reading story graph from Redis: {e}")
+
+    if graph is None:
+        graph = compile_graph(story_id, _load_rows(story_id), version)
+        if client is not None:
+            try:
+                client.setex(_graph_key(story_id, version), GRAPH_TTL, json.dumps(graph))
+            except Exception as e:
+                logger.error(f"Error storing story graph in Redis: {e}")
+
+    _graphs[story_id] = {'version': version, 'loaded_at': time.time(), 'graph': graph}
+    return graph
+
+def invalidate_story_graph(story_id):
+    """Bump a story's graph version so every process recompiles it."""
+    _graphs.pop(story_id, None)
+    _local_versions[story_id] = _local_versions.get(story_id, 0) + 1
+    client = get_redis()
+    if client is not None:
+        try:
+            client.incr(_version_key(story_id))
+        except Exception as e:
+            logger.error(f"Error bumping story graph version in Redis: {e}")
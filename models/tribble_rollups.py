@@ -0,0 +1,260 @@
+"""
+Hourly, daily and weekly rollups of tribble drop outcomes per event.
+
+dashboard_tribble_rollups holds total, claimed, escaped and borg outcome
+counts per (resolution, bucket start, event). Drops are updated in place when
+claimed or escaped, so the rollups are not folded in from an id watermark:
+each refresh recomputes the hourly buckets from the last rolled-up hour minus
+LATE_WINDOW up to now (an index range scan on captured_at), then re-derives
+the daily and weekly buckets those hours fall in from the hourly rows. Every
+bucket is overwritten rather than incremented, so refreshes are idempotent.
+
+tribble_drops has no update time, so this assumes a drop is claimed, escapes
+or is defeated within LATE_WINDOW of its captured_at. An outcome recorded
+later than that is not picked up until `flask refresh-tribble-rollups
+--rebuild` recomputes every bucket.
+
+A refresh that only has the recompute window left to do first reads a cheap
+fingerprint of it (row and outcome counts); when that matches the last
+refresh, nothing changed and no bucket is rewritten, so page loads only
+write when drops have actually changed.
+
+The activity chart reads the finest resolution that keeps a window within
+MAX_POINTS buckets. Until the first backfill has reached the current hour it
+aggregates tribble_drops directly at that resolution instead.
+"""
+
+import logging
+import zlib
+from datetime import datetime, timedelta
+from models.db import checkout_db, get_db, release_db
+from models.watermarks import get_watermark, set_watermark
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'tribble_rollups'  # last_id holds hours since EPOCH rolled up
+FINGERPRINT_NAME = 'tribble_rollups_fingerprint'  # CRC32 of the last recompute window's counts
+LOCK_NAME = 'badgey_dashboard_tribble_rollups'
+EPOCH = datetime(2000, 1, 1)
+LATE_WINDOW = timedelta(hours=24)  # recent hours recomputed to catch late claims and escapes
+CHUNK = timedelta(days=7)  # hours rolled up per transaction
+REQUEST_MAX_CHUNKS = 2  # catch-up work allowed inside a page load
+MAX_POINTS = 200  # buckets the chart may show
+
+# resolution -> bucket size in hours, finest first
+RESOLUTIONS = (('hour', 1), ('day', 24), ('week', 168))
+
+# Numeric bucket expressions (weeks start on Monday); {col} is a DATETIME column
+BUCKET_SQL = {
+    'hour': "TIMESTAMPADD(HOUR, TIMESTAMPDIFF(HOUR, '2000-01-01', {col}), '2000-01-01')",
+    'day': "CAST(DATE({col}) AS DATETIME)",
+    'week': "CAST(DATE_SUB(DATE({col}), INTERVAL WEEKDAY({col}) DAY) AS DATETIME)",
+}
+
+OUTCOME_SQL = """
+    COUNT(*) as total,
+    SUM(CASE WHEN claimed_by IS NOT NULL AND is_escaped = 0 THEN 1 ELSE 0 END) as claimed,
+    SUM(CASE WHEN is_escaped = 1 THEN 1 ELSE 0 END) as `escaped`,
+    SUM(CASE WHEN is_borg = 1 AND claimed_by IS NOT NULL AND is_escaped = 0 AND was_defeated = 0 THEN 1 ELSE 0 END) as borg_caught,
+    SUM(CASE WHEN is_borg = 1 AND is_escaped = 1 THEN 1 ELSE 0 END) as borg_escaped,
+    SUM(CASE WHEN is_borg = 1 AND was_defeated = 1 THEN 1 ELSE 0 END) as borg_defeated
+"""
+
+COUNT_COLUMNS = ('total', 'claimed', 'escaped', 'borg_caught', 'borg_escaped', 'borg_defeated')
+
+def _floor(value, resolution):
+    """Start of the bucket containing a datetime."""
+    if resolution == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = datetime.combine(value.date(), datetime.min.time())
+    if resolution == 'day':
+        return day
+    return day - timedelta(days=day.weekday())
+
+def _ceil(value, resolution):
+    """Start of the first bucket at or after a datetime."""
+    start = _floor(value, resolution)
+    if start == value:
+        return start
+    return start + timedelta(hours=dict(RESOLUTIONS)[resolution])
+
+def _rollup_hours(cursor, start, end):
+    cursor.execute("""
+        DELETE FROM dashboard_tribble_rollups
+        WHERE resolution = 'hour' AND bucket_start >= %s AND bucket_start < %s
+    """, (start, end))
+    cursor.execute(f"""
+        INSERT INTO dashboard_tribble_rollups
+            (resolution, bucket_start, event_id, {', '.join(COUNT_COLUMNS)})
+        SELECT 'hour', {BUCKET_SQL['hour'].format(col='captured_at')}, COALESCE(event_id, 0), {OUTCOME_SQL}
+        FROM tribble_drops
+        WHERE captured_at >= %s AND captured_at < %s
+        GROUP BY 2, 3
+    """, (start, end))
+
+def _rollup_coarse(cursor, resolution, start, end):
+    """Recompute the day or week buckets overlapping [start, end) from the hourly rows."""
+    start, end = _floor(start, resolution), _ceil(end, resolution)
+    cursor.execute("""
+        DELETE FROM dashboard_tribble_rollups
+        WHERE resolution = %s AND bucket_start >= %s AND bucket_start < %s
+    """, (resolution, start, end))
+    sums = ', '.join(f'SUM({column})' for column in COUNT_COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO dashboard_tribble_rollups
+            (resolution, bucket_start, event_id, {', '.join(COUNT_COLUMNS)})
+        SELECT %s, {BUCKET_SQL[resolution].format(col='bucket_start')}, event_id, {sums}
+        FROM dashboard_tribble_rollups
+        WHERE resolution = 'hour' AND bucket_start >= %s AND bucket_start < %s
+        GROUP BY 2, 3
+    """, (resolution, start, end))
+
+def _fingerprint(cursor, start, end):
+    """CRC32 of the window and its drop and outcome counts; changes whenever a drop in it does."""
+    cursor.execute("""
+        SELECT COUNT(*) as total, COUNT(claimed_by) as claimed,
+               SUM(is_escaped) as `escaped`, SUM(was_defeated) as defeated
+        FROM tribble_drops
+        WHERE captured_at >= %s AND captured_at < %s
+    """, (start, end))
+    row = cursor.fetchone()
+    values = [start, end] + [int(row[column] or 0) for column in ('total', 'claimed', 'escaped', 'defeated')]
+    return zlib.crc32('|'.join(str(value) for value in values).encode())
+
+def _rolled_up_until(cursor):
+    """Return the end of the rolled-up hours, or None before the first refresh."""
+    hours = get_watermark(cursor, WATERMARK_NAME)
+    return EPOCH + timedelta(hours=hours) if hours else None
+
+def refresh_rollups(max_chunks=None, rebuild=False):
+    """Roll tribble drops up to the current hour.
+
+    Args:
+        max_chunks (int): Stop after this many CHUNK-sized spans (None for no limit)
+        rebuild (bool): Recompute every bucket from the first drop
+
+    Returns:
+        int: Spans rolled up (0 when nothing changed), or -1 if another
+             refresh holds the lock
+    """
+    conn = checkout_db()
+    chunks = 0
+    locked = False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, 0) as locked", (LOCK_NAME,))
+            row = cursor.fetchone()
+            locked = bool(row and row['locked'])
+            if not locked:
+                return -1
+
+            cursor.execute("SELECT NOW() as now")
+            end = _floor(cursor.fetchone()['now'], 'hour') + timedelta(hours=1)
+            start = None if rebuild else _rolled_up_until(cursor)
+            if start is None:
+                cursor.execute("SELECT MIN(captured_at) as first FROM tribble_drops")
+                first = cursor.fetchone()['first']
+                if first is None:
+                    return 0
+                start = _floor(first, 'hour')
+            else:
+                start -= LATE_WINDOW
+
+            fingerprint = None
+            if end - start <= CHUNK:
+                fingerprint = _fingerprint(cursor, start, end)
+                if not rebuild and fingerprint == get_watermark(cursor, FINGERPRINT_NAME):
+                    return 0
+
+            while start < end and (max_chunks is None or chunks < max_chunks):
+                chunk_end = min(start + CHUNK, end)
+                _rollup_hours(cursor, start, chunk_end)
+                _rollup_coarse(cursor, 'day', start, chunk_end)
+                _rollup_coarse(cursor, 'week', start, chunk_end)
+                set_watermark(cursor, WATERMARK_NAME, (chunk_end - EPOCH) // timedelta(hours=1))
+                if chunk_end == end and fingerprint is not None:
+                    set_watermark(cursor, FINGERPRINT_NAME, fingerprint)
+                conn.commit()
+                chunks += 1
+                start = chunk_end
+        return chunks
+    except Exception as e:
+        logger.error(f"Error refreshing tribble rollups: {e}")
+        conn.rollback()
+        raise
+    finally:
+        if locked:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            except Exception:
+                pass
+        release_db(conn)
+
+def pick_resolution(hours):
+    """Return the finest resolution that shows a window of hours in at most MAX_POINTS buckets."""
+    for resolution, size in RESOLUTIONS:
+        if hours / size <= MAX_POINTS:
+            return resolution
+    return RESOLUTIONS[-1][0]
+
+def get_tribble_activity(hours, event_id=None):
+    """Return tribble outcomes over the last hours, bucketed for charting.
+
+    Args:
+        hours (int): Window length; capped at MAX_POINTS weeks
+        event_id (int): Only count drops of this event
+
+    Returns:
+        dict: resolution ('hour', 'day' or 'week') and points, a list of
+              {'time_period', 'total', 'claimed', 'escaped', 'borg_caught',
+              'borg_escaped', 'borg_defeated'} in time order
+    """
+    hours = max(1, min(hours, MAX_POINTS * dict(RESOLUTIONS)['week']))
+    resolution = pick_resolution(hours)
+    try:
+        refresh_rollups(max_chunks=REQUEST_MAX_CHUNKS)
+    except Exception as e:
+        logger.error(f"Error refreshing tribble rollups before read: {e}")
+
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT NOW() as now")
+            now = cursor.fetchone()['now']
+            start = _floor(now - timedelta(hours=hours), resolution)
+            rolled_up_until = _rolled_up_until(cursor)
+            params = [start]
+            if rolled_up_until and rolled_up_until >= _floor(now, 'hour'):
+                sums = ', '.join(f'SUM({column}) as `{column}`' for column in COUNT_COLUMNS)
+                sql = f"""
+                    SELECT bucket_start, {sums}
+                    FROM dashboard_tribble_rollups
+                    WHERE resolution = %s AND bucket_start >= %s
+                """
+                params.insert(0, resolution)
+                if event_id:
+                    sql += " AND event_id = %s"
+                    params.append(event_id)
+            else:
+                # Backfill still running: aggregate the drops directly
+                sql = f"""
+                    SELECT {BUCKET_SQL[resolution].format(col='captured_at')} as bucket_start, {OUTCOME_SQL}
+                    FROM tribble_drops
+                    WHERE captured_at >= %s
+                """
+                if event_id:
+                    sql += " AND event_id = %s"
+                    params.append(event_id)
+            sql += " GROUP BY bucket_start ORDER BY bucket_start"
+            cursor.execute(sql, tuple(params))
+            rows = cursor.fetchall()
+    finally:
+        release_db(conn)
+
+    points = []
+    for row in rows:
+        point = {'time_period': row['bucket_start'].strftime('%Y-%m-%d %H:%M:%S')}
+        point.update((column, int(row[column] or 0)) for column in COUNT_COLUMNS)
+        points.append(point)
+    return {'resolution': resolution, 'points': points}
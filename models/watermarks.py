@@ -0,0 +1,21 @@
+"""
+Named progress markers for incrementally maintained dashboard tables.
+
+dashboard_watermarks (migration 8) holds one BIGINT per name: the choice
+transition matrix stores the last folded player_choices id, the tribble
+rollups the number of hours since their epoch already rolled up. Callers
+write the watermark in the same transaction as the rows it covers.
+"""
+
+def get_watermark(cursor, name):
+    """Return the value stored for a named watermark (0 if never set)."""
+    cursor.execute("SELECT last_id FROM dashboard_watermarks WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    return row['last_id'] if row else 0
+
+def set_watermark(cursor, name, last_id):
+    """Store a named watermark; committing is left to the caller."""
+    cursor.execute("""
+        INSERT INTO dashboard_watermarks (name, last_id) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)
+    """, (name, last_id))
@@ -0,0 +1,190 @@
+"""
+Prometheus metrics exported on /metrics.
+
+Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) makes
+prometheus_client write every worker's values to memory-mapped files in that
+directory. Whichever worker serves the scrape aggregates all of them, so the
+numbers cover the whole server rather than one process.
+
+Gauges are updated where the state changes, not at scrape time, because the
+scraping worker cannot see the other workers' pools.
+"""
+
+import hmac
+import os
+import re
+from flask import Response, abort, current_app, g, has_app_context, request
+from flask_caching import Cache
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+from monitoring.tracing import span
+
+REQUEST_LATENCY = Histogram(
+    'badgey_request_duration_seconds',
+    'Request latency by endpoint',
+    ['endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+REQUESTS = Counter(
+    'badgey_requests_total',
+    'Requests by endpoint and status code',
+    ['endpoint', 'method', 'status']
+)
+REQUEST_QUERIES = Histogram(
+    'badgey_request_sql_queries',
+    'SQL statements issued per request',
+    ['endpoint'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200)
+)
+
+DB_POOL_IDLE = Gauge(
+    'badgey_db_pool_idle_connections',
+    'Idle connections held in the pymysql pool',
+    multiprocess_mode='livesum'
+)
+DB_POOL_IN_USE = Gauge(
+    'badgey_db_pool_in_use_connections',
+    'pymysql connections handed out by get_db and not yet released',
+    multiprocess_mode='livesum'
+)
+DB_POOL_WAIT = Histogram(
+    'badgey_db_pool_wait_seconds',
+    'Time spent in get_db acquiring a connection (lock wait plus connect on a miss)',
+    ['result'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+ENGINE_POOL_IN_USE = Gauge(
+    'badgey_sqlalchemy_pool_in_use_connections',
+    'Session engine connections currently checked out',
+    multiprocess_mode='livesum'
+)
+ENGINE_POOL_OPEN = Gauge(
+    'badgey_sqlalchemy_pool_open_connections',
+    'Session engine connections currently open',
+    multiprocess_mode='livesum'
+)
+
+CACHE_LOOKUPS = Counter(
+    'badgey_cache_lookups_total',
+    'Flask-Caching lookups by key namespace and result',
+    ['namespace', 'result']
+)
+SESSION_LOADS = Counter(
+    'badgey_session_loads_total',
+    'Session loads by source (redis, mysql or new)',
+    ['source']
+)
+GZIP_BYTES_SAVED = Counter(
+    'badgey_gzip_bytes_saved_total',
+    'Bytes saved by response gzip compression'
+)
+
+# Trailing numeric ids: quiz_view_12_3 -> quiz_view
+_key_ids = re.compile(r'(_\d+)+$')
+
+def cache_namespace(key):
+    """Map a cache key to a bounded-cardinality namespace."""
+    return _key_ids.sub('', str(key)) or 'other'
+
+def record_cache_lookup(key, hit):
+    CACHE_LOOKUPS.labels(cache_namespace(key), 'hit' if hit else 'miss').inc()
+    # Per-request tally for the admin performance report
+    if has_app_context():
+        hits, misses = g.get('_cache_lookups', (0, 0))
+        g._cache_lookups = (hits + 1, misses) if hit else (hits, misses + 1)
+
+def record_session_load(source):
+    SESSION_LOADS.labels(source).inc()
+
+def record_gzip_saving(original_size, compressed_size):
+    if original_size > compressed_size:
+        GZIP_BYTES_SAVED.inc(original_size - compressed_size)
+
+def record_pool_checkout(wait_seconds, reused, idle_count):
+    DB_POOL_WAIT.labels('reused' if reused else 'new').observe(wait_seconds)
+    DB_POOL_IN_USE.inc()
+    DB_POOL_IDLE.set(idle_count)
+
+def record_pool_release(idle_count):
+    DB_POOL_IN_USE.dec()
+    DB_POOL_IDLE.set(idle_count)
+
+class InstrumentedCache(Cache):
+    """Flask-Caching extension that counts hits and misses per key namespace
+    and times each call as a tracing span."""
+
+    def get(self, key, *args, **kwargs):
+        with span('cache.get', key):
+            value = super().get(key, *args, **kwargs)
+        record_cache_lookup(key, value is not None)
+        return value
+
+    def set(self, key, *args, **kwargs):
+        with span('cache.set', key):
+            return super().set(key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        with span('cache.delete', key):
+            return super().delete(key, *args, **kwargs)
+
+def install_engine_pool_metrics(engine):
+    """Track checked-out and open connections of a SQLAlchemy engine pool."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        ENGINE_POOL_OPEN.inc()
+
+    @event.listens_for(engine, 'close')
+    def _close(dbapi_connection, connection_record):
+        ENGINE_POOL_OPEN.dec()
+
+    @event.listens_for(engine, 'checkout')
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        ENGINE_POOL_IN_USE.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def _checkin(dbapi_connection, connection_record):
+        ENGINE_POOL_IN_USE.dec()
+
+def _observe_request(response):
+    start = g.get('_request_start')
+    if start is None:
+        return response
+
+    from time import perf_counter
+    from monitoring.queries import get_query_stats
+
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_LATENCY.labels(endpoint, request.method).observe(perf_counter() - start)
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    stats = get_query_stats()
+    if stats is not None:
+        REQUEST_QUERIES.labels(endpoint).observe(stats.count)
+    return response
+
+def metrics_view():
+    """Expose metrics in the Prometheus text format.
+
+    When METRICS_TOKEN is configured the scraper must send it as a bearer token.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied, f'Bearer {token}'):
+            abort(403)
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+def init_app(app):
+    """Register the /metrics endpoint and the request latency hook."""
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.after_request(_observe_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
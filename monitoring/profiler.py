@@ -0,0 +1,159 @@
+"""
+On-demand sampling profiler for single requests.
+
+An admin adds `?_profile=1` to a URL (or sends an `X-Profile: 1` header).
+A background thread then samples the request thread's stack every
+SAMPLE_INTERVAL seconds until the response is ready. Samples are saved in
+the folded-stack format ("frame;frame;frame count" per line) that
+flamegraph.pl, speedscope and inferno read directly.
+
+When the flag is absent the only cost is one header and one query-string
+lookup per request; the user is not even loaded for the authorization check.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from flask import g, request
+from flask_login import current_user
+from redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005  # seconds
+MAX_DURATION = 60  # stop sampling runaway requests after this many seconds
+PROFILES_KEPT = 50
+PROFILE_TTL = 24 * 60 * 60  # seconds
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_local_profiles = deque(maxlen=PROFILES_KEPT)
+
+def _frame_label(frame):
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    else:
+        # Library frames: keep the path readable, e.g. flask/app.py
+        filename = os.path.join(*filename.split(os.sep)[-2:])
+    return f"{code.co_name} ({filename})".replace(';', ':')
+
+class SamplingProfiler:
+    """Periodically capture the stack of one thread."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self.started_at = None
+        self.duration = 0.0
+
+    def _run(self):
+        deadline = time.time() + MAX_DURATION
+        while not self._stop.wait(self.interval) and time.time() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.time() - self.started_at
+        return self.samples
+
+    def folded(self):
+        """Return samples in folded-stack format."""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+def _profile_requested():
+    return request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1'
+
+def _start_profiling():
+    if not _profile_requested():
+        return
+    # Same check as decorators.admin_required, without the redirect
+    if not (current_user.is_authenticated and current_user.has_role('admin')):
+        return
+    profiler = SamplingProfiler(threading.get_ident())
+    profiler.start()
+    g._profiler = profiler
+
+def _finish_profiling(response):
+    profiler = g.pop('_profiler', None)
+    if profiler is None:
+        return response
+    profiler.stop()
+    meta = {
+        'id': uuid.uuid4().hex[:12],
+        'created_at': time.time(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(profiler.duration * 1000, 1),
+        'samples': sum(profiler.samples.values()),
+        'user': getattr(current_user, 'username', None),
+    }
+    save_profile(meta, profiler.folded())
+    response.headers['X-Profile-Id'] = meta['id']
+    return response
+
+def save_profile(meta, folded):
+    """Store a profile, keeping only the most recent PROFILES_KEPT."""
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.setex(redis_key('perf', 'profile', meta['id']), PROFILE_TTL, folded)
+            pipe.lpush(redis_key('perf', 'profiles'), json.dumps(meta))
+            pipe.ltrim(redis_key('perf', 'profiles'), 0, PROFILES_KEPT - 1)
+            pipe.execute()
+            return
+        except Exception as e:
+            logger.error(f"Error saving profile to Redis: {e}")
+    _local_profiles.appendleft((meta, folded))
+
+def list_profiles():
+    """Return metadata for recent profiles, newest first."""
+    client = get_redis()
+    if client is not None:
+        try:
+            return [json.loads(raw) for raw in client.lrange(redis_key('perf', 'profiles'), 0, PROFILES_KEPT - 1)]
+        except Exception as e:
+            logger.error(f"Error listing profiles from Redis: {e}")
+    return [meta for meta, _ in _local_profiles]
+
+def get_profile(profile_id):
+    """Return the folded stacks for a profile, or None if it has expired."""
+    client = get_redis()
+    if client is not None:
+        try:
+            folded = client.get(redis_key('perf', 'profile', profile_id))
+            if folded is not None:
+                return folded.decode('utf-8')
+        except Exception as e:
+            logger.error(f"Error loading profile from Redis: {e}")
+    for meta, folded in _local_profiles:
+        if meta['id'] == profile_id:
+            return folded
+    return None
+
+def init_app(app):
+    """Register the hooks that start and stop per-request profiling."""
+    app.before_request(_start_profiling)
+    app.after_request(_finish_profiling)
@@ -0,0 +1,125 @@
+"""
+Per-request SQL statistics.
+
+Both database paths feed the same collector: the pymysql cursor class in
+models/db.py and the SQLAlchemy engine used for sessions (see
+install_engine_instrumentation). Statistics live on flask.g, so they are
+scoped to a single request and cost nothing to clean up.
+"""
+
+import logging
+import re
+import time
+from flask import g, has_app_context, request, current_app
+from flask_login import current_user
+from monitoring.tracing import add_span
+
+logger = logging.getLogger(__name__)
+
+# How many of the slowest statements to keep per request
+SLOWEST_KEPT = 5
+STATEMENT_MAX_LENGTH = 200
+
+_whitespace = re.compile(r'\s+')
+
+def normalize_statement(statement):
+    """Collapse whitespace and truncate a statement for logging.
+
+    Only the statement template is kept, never the bound parameters.
+    """
+    if isinstance(statement, bytes):
+        statement = statement.decode('utf-8', 'replace')
+    statement = _whitespace.sub(' ', str(statement)).strip()
+    if len(statement) > STATEMENT_MAX_LENGTH:
+        statement = statement[:STATEMENT_MAX_LENGTH - 3] + '...'
+    return statement
+
+class QueryStats:
+    """Statement count, total time and slowest statements for one request."""
+
+    __slots__ = ('count', 'total_ms', 'slowest')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = []  # (duration_ms, statement), slowest first
+
+    def record(self, statement, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        if len(self.slowest) < SLOWEST_KEPT or duration_ms > self.slowest[-1][0]:
+            self.slowest.append((duration_ms, normalize_statement(statement)))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_KEPT:]
+
+def get_query_stats():
+    """Return the current request's QueryStats, or None outside an app context."""
+    if not has_app_context():
+        return None
+    stats = g.get('_query_stats')
+    if stats is None:
+        stats = g._query_stats = QueryStats()
+    return stats
+
+def record_query(statement, duration_ms):
+    """Record one executed statement against the current request."""
+    stats = get_query_stats()
+    if stats is not None:
+        stats.record(statement, duration_ms)
+        add_span('sql', time.perf_counter() - duration_ms / 1000, duration_ms, normalize_statement(statement))
+
+def install_engine_instrumentation(engine):
+    """Time every statement executed through a SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_query_start')
+        if starts:
+            record_query(statement, (time.perf_counter() - starts.pop()) * 1000)
+
+def _is_admin():
+    try:
+        return current_user.is_authenticated and current_user.has_role('admin')
+    except Exception:
+        return False
+
+def _start_request_timer():
+    g._request_start = time.perf_counter()
+
+def _report_request(response):
+    """Add Server-Timing for admins and log requests that exceed budgets."""
+    stats = get_query_stats()
+    if stats is None:
+        return response
+
+    start = g.get('_request_start')
+    elapsed_ms = (time.perf_counter() - start) * 1000 if start else 0.0
+
+    if _is_admin():
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries", '
+            f'app;dur={elapsed_ms:.1f}'
+        )
+
+    count_budget = current_app.config['SQL_QUERY_COUNT_BUDGET']
+    time_budget = current_app.config['SQL_QUERY_TIME_BUDGET_MS']
+    if stats.count > count_budget or stats.total_ms > time_budget:
+        slowest = '; '.join(f"{ms:.1f}ms {sql}" for ms, sql in stats.slowest)
+        logger.warning(
+            f"SQL budget exceeded on {request.method} {request.path} "
+            f"(endpoint={request.endpoint}): {stats.count} queries, "
+            f"{stats.total_ms:.1f}ms in DB, {elapsed_ms:.1f}ms total. Slowest: {slowest}"
+        )
+    return response
+
+def init_app(app):
+    """Register the request hooks that report per-request SQL statistics."""
+    app.config.setdefault('SQL_QUERY_COUNT_BUDGET', 30)
+    app.config.setdefault('SQL_QUERY_TIME_BUDGET_MS', 500)
+    app.before_request(_start_request_timer)
+    app.after_request(_report_request)
@@ -0,0 +1,186 @@
+"""
+Rolling slow-request report for the admin system page.
+
+Every request appends a compact record (endpoint, latency, SQL count and
+time, cache hits and misses, slowest statements) to a capped Redis list that
+all workers share. When Redis is unreachable each worker falls back to its
+own in-memory ring buffer. Building the report reads at most
+REQUEST_LOG_SIZE records and the result is memoized for REPORT_TTL seconds,
+so refreshing the admin page stays cheap.
+
+Because the log is capped, a busy server's longer windows can reach back
+less far than their label; the report records the span the records in a
+window actually cover and flags windows cut short by the cap.
+"""
+
+import json
+import logging
+import math
+import time
+from collections import deque
+from flask import g, request
+from redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LOG_SIZE = 2000
+REPORT_TTL = 30  # seconds
+SLOW_STATEMENTS_KEPT = 3
+
+# Rolling windows offered on the system page, in seconds
+WINDOWS = {
+    '5m': 5 * 60,
+    '1h': 60 * 60,
+    '24h': 24 * 60 * 60,
+}
+
+# Paths that would only add noise to the report
+IGNORED_PREFIXES = ('/static/', '/assets/', '/metrics', '/health')
+
+_local_log = deque(maxlen=REQUEST_LOG_SIZE)
+_report_cache = {}
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+def _log_key():
+    return redis_key('perf', 'requests')
+
+def _record_request(response):
+    start = g.get('_request_start')
+    if start is None or request.path.startswith(IGNORED_PREFIXES):
+        return response
+
+    from monitoring.queries import get_query_stats
+    stats = get_query_stats()
+    hits, misses = g.get('_cache_lookups', (0, 0))
+    record = {
+        'ts': time.time(),
+        'endpoint': request.endpoint or 'unmatched',
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'ms': round((time.perf_counter() - start) * 1000, 2),
+        'queries': stats.count if stats else 0,
+        'db_ms': round(stats.total_ms, 2) if stats else 0.0,
+        'cache_hits': hits,
+        'cache_misses': misses,
+        'trace_id': g.get('trace_id'),
+        'slow_sql': [[round(ms, 2), sql] for ms, sql in stats.slowest[:SLOW_STATEMENTS_KEPT]] if stats else [],
+    }
+
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.lpush(_log_key(), json.dumps(record))
+            pipe.ltrim(_log_key(), 0, REQUEST_LOG_SIZE - 1)
+            pipe.execute()
+            return response
+        except Exception as e:
+            logger.error(f"Error recording request in Redis: {e}")
+    _local_log.appendleft(record)
+    return response
+
+def load_records():
+    """Return recent request records, newest first."""
+    client = get_redis()
+    if client is not None:
+        try:
+            return [json.loads(raw) for raw in client.lrange(_log_key(), 0, REQUEST_LOG_SIZE - 1)]
+        except Exception as e:
+            logger.error(f"Error reading request log from Redis: {e}")
+    return list(_local_log)
+
+def build_report(window='1h'):
+    """Summarize requests in a rolling window.
+
+    Args:
+        window (str): One of the WINDOWS keys
+
+    Returns:
+        dict: Overall latency percentiles, per-route stats, slowest requests
+        and top slow SQL statements
+    """
+    if window not in WINDOWS:
+        window = '1h'
+
+    cached = _report_cache.get(window)
+    if cached and cached['generated_at'] > time.time() - REPORT_TTL:
+        return cached
+
+    now = time.time()
+    cutoff = now - WINDOWS[window]
+    all_records = load_records()
+    records = [r for r in all_records if r['ts'] >= cutoff]
+    # A full log whose oldest record is inside the window has dropped older requests
+    truncated = len(all_records) >= REQUEST_LOG_SIZE and all_records[-1]['ts'] > cutoff
+    covered_seconds = now - min(r['ts'] for r in records) if records else 0
+
+    routes = {}
+    statements = {}
+    for r in records:
+        route = routes.setdefault(r['endpoint'], {
+            'endpoint': r['endpoint'], 'durations': [], 'queries': 0,
+            'db_ms': 0.0, 'cache_hits': 0, 'cache_misses': 0, 'errors': 0
+        })
+        route['durations'].append(r['ms'])
+        route['queries'] += r['queries']
+        route['db_ms'] += r['db_ms']
+        route['cache_hits'] += r['cache_hits']
+        route['cache_misses'] += r['cache_misses']
+        if r['status'] >= 500:
+            route['errors'] += 1
+
+        for ms, sql in r.get('slow_sql', []):
+            stmt = statements.setdefault(sql, {'statement': sql, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stmt['count'] += 1
+            stmt['total_ms'] += ms
+            stmt['max_ms'] = max(stmt['max_ms'], ms)
+
+    route_rows = []
+    for route in routes.values():
+        durations = sorted(route.pop('durations'))
+        count = len(durations)
+        lookups = route['cache_hits'] + route['cache_misses']
+        route.update({
+            'count': count,
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'p99': percentile(durations, 99),
+            'max': durations[-1],
+            'avg_queries': round(route['queries'] / count, 1),
+            'avg_db_ms': round(route['db_ms'] / count, 1),
+            'cache_hit_rate': round(route['cache_hits'] * 100 / lookups, 1) if lookups else None,
+        })
+        route_rows.append(route)
+    route_rows.sort(key=lambda row: row['p95'], reverse=True)
+
+    all_durations = sorted(r['ms'] for r in records)
+    total_hits = sum(r['cache_hits'] for r in records)
+    total_lookups = total_hits + sum(r['cache_misses'] for r in records)
+
+    report = {
+        'window': window,
+        'generated_at': time.time(),
+        'request_count': len(records),
+        'covered_seconds': round(covered_seconds),
+        'truncated': truncated,
+        'p50': percentile(all_durations, 50),
+        'p95': percentile(all_durations, 95),
+        'p99': percentile(all_durations, 99),
+        'cache_hit_rate': round(total_hits * 100 / total_lookups, 1) if total_lookups else None,
+        'routes': route_rows[:15],
+        'slowest_requests': sorted(records, key=lambda r: r['ms'], reverse=True)[:10],
+        'slow_statements': sorted(statements.values(), key=lambda s: s['total_ms'], reverse=True)[:10],
+    }
+    _report_cache[window] = report
+    return report
+
+def init_app(app):
+    """Register the hook that feeds the request log."""
+    app.after_request(_record_request)
@@ -0,0 +1,193 @@
+"""
+Lightweight per-request tracing.
+
+Each request gets a server-generated trace id, which keys its stored trace
+and its request report record. The X-Request-ID response header echoes a
+well-formed incoming X-Request-ID for correlation (or the trace id when the
+client sent none); a client-supplied id is stored alongside the trace but
+never used as a key, so clients cannot overwrite or spoof stored traces. Timed spans are collected
+on flask.g around the phases that make up a request:
+
+    session.open / session.save   custom_session.CustomSqlAlchemySessionInterface
+    load_user                     app.load_user
+    sql                           every statement (models/db.py cursor and the session engine)
+    cache.get / cache.set / ...   monitoring.metrics.InstrumentedCache
+    view                          from the last before_request hook to the first after_request hook
+    render <template>             Jinja rendering, via Flask's template signals
+    gzip                          app.apply_gzip_compression
+
+Requests slower than TRACE_SLOW_MS are kept in a bounded buffer (Redis, or a
+per-worker ring buffer as fallback) for the admin waterfall view.
+"""
+
+import json
+import logging
+import re
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from flask import before_render_template, g, has_request_context, request, request_finished, template_rendered
+from redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+MAX_SPANS = 300  # per request; SQL-heavy pages are truncated rather than unbounded
+TRACES_KEPT = 100
+TRACE_TTL = 24 * 60 * 60  # seconds
+ENVIRON_START_KEY = 'badgey.request_start'
+
+_valid_request_id = re.compile(r'^[A-Za-z0-9\-_.]{8,64}$')
+_local_traces = deque(maxlen=TRACES_KEPT)
+
+class RequestStartMiddleware:
+    """WSGI middleware that stamps the request start before Flask opens the session."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        environ[ENVIRON_START_KEY] = time.perf_counter()
+        return self.wsgi_app(environ, start_response)
+
+def _trace_start():
+    return request.environ.get(ENVIRON_START_KEY) or g.setdefault('_trace_start', time.perf_counter())
+
+def get_trace_id():
+    """Return the current request's server-generated trace id, creating it if needed."""
+    if not has_request_context():
+        return None
+    trace_id = g.get('trace_id')
+    if trace_id is None:
+        trace_id = g.trace_id = uuid.uuid4().hex
+    return trace_id
+
+def get_request_id():
+    """Return the correlation id echoed to the client: a well-formed incoming
+    X-Request-ID, otherwise the trace id."""
+    if not has_request_context():
+        return None
+    incoming = request.headers.get('X-Request-ID', '')
+    return incoming if _valid_request_id.match(incoming) else get_trace_id()
+
+def add_span(name, start, duration_ms, detail=None):
+    """Record a finished span that started at perf_counter() value `start`."""
+    if not has_request_context():
+        return
+    spans = g.get('_spans')
+    if spans is None:
+        spans = g._spans = []
+    if len(spans) >= MAX_SPANS:
+        g._spans_dropped = g.get('_spans_dropped', 0) + 1
+        return
+    spans.append({
+        'name': name,
+        'start_ms': round((start - _trace_start()) * 1000, 2),
+        'ms': round(duration_ms, 2),
+        'detail': detail,
+    })
+
+@contextmanager
+def span(name, detail=None):
+    """Time a block of code as a span of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, start, (time.perf_counter() - start) * 1000, detail)
+
+def _begin_view():
+    get_trace_id()
+    g._view_start = time.perf_counter()
+
+def _end_view(response):
+    start = g.pop('_view_start', None)
+    if start is not None:
+        add_span('view', start, (time.perf_counter() - start) * 1000, request.endpoint)
+    request_id = get_request_id()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('_render_starts', []).append(time.perf_counter())
+
+def _after_render(sender, template, context, **extra):
+    starts = g.get('_render_starts')
+    if starts:
+        start = starts.pop()
+        add_span('render', start, (time.perf_counter() - start) * 1000, template.name)
+
+def _finish_trace(sender, response, **extra):
+    """Store the trace once the session has been saved and the response is final."""
+    total_ms = (time.perf_counter() - _trace_start()) * 1000
+    if total_ms < sender.config['TRACE_SLOW_MS'] or request.path.startswith(('/static/', '/metrics')):
+        return
+    trace = {
+        'id': get_trace_id(),
+        'request_id': get_request_id(),
+        'created_at': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'ms': round(total_ms, 2),
+        'spans_dropped': g.get('_spans_dropped', 0),
+        'spans': sorted(g.get('_spans', []), key=lambda s: s['start_ms']),
+    }
+    save_trace(trace)
+
+def save_trace(trace):
+    """Store a trace, keeping only the most recent TRACES_KEPT."""
+    meta = {k: v for k, v in trace.items() if k != 'spans'}
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.setex(redis_key('perf', 'trace', trace['id']), TRACE_TTL, json.dumps(trace))
+            pipe.lpush(redis_key('perf', 'traces'), json.dumps(meta))
+            pipe.ltrim(redis_key('perf', 'traces'), 0, TRACES_KEPT - 1)
+            pipe.execute()
+            return
+        except Exception as e:
+            logger.error(f"Error saving trace to Redis: {e}")
+    _local_traces.appendleft(trace)
+
+def list_traces():
+    """Return metadata for recent slow-request traces, newest first."""
+    client = get_redis()
+    if client is not None:
+        try:
+            return [json.loads(raw) for raw in client.lrange(redis_key('perf', 'traces'), 0, TRACES_KEPT - 1)]
+        except Exception as e:
+            logger.error(f"Error listing traces from Redis: {e}")
+    return [{k: v for k, v in t.items() if k != 'spans'} for t in _local_traces]
+
+def get_trace(trace_id):
+    """Return a stored trace with its spans, or None if it has expired."""
+    client = get_redis()
+    if client is not None:
+        try:
+            raw = client.get(redis_key('perf', 'trace', trace_id))
+            if raw is not None:
+                return json.loads(raw)
+        except Exception as e:
+            logger.error(f"Error loading trace from Redis: {e}")
+    for trace in _local_traces:
+        if trace['id'] == trace_id:
+            return trace
+    return None
+
+def init_app(app):
+    """Install the request-start middleware, view hooks and template signals.
+
+    Call this after every other before_request/after_request registration so
+    the 'view' span brackets the view function as tightly as possible.
+    """
+    app.config.setdefault('TRACE_SLOW_MS', 250)
+    app.wsgi_app = RequestStartMiddleware(app.wsgi_app)
+    app.before_request(_begin_view)
+    app.after_request(_end_view)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    request_finished.connect(_finish_trace, app)
@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+import redis
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# One client per process, created lazily from the app's cache settings
+_client = None
+_client_lock = threading.Lock()
+_retry_after = 0.0
+RETRY_INTERVAL = 30  # seconds to wait before retrying an unreachable Redis
+
+def get_redis():
+    """Get the shared Redis client, or None if Redis is unavailable.
+
+    Failures are remembered for RETRY_INTERVAL seconds so callers that fall
+    back to local storage do not pay a connect timeout on every request.
+    """
+    global _client, _retry_after
+    if _client is not None:
+        return _client
+    if time.time() < _retry_after:
+        return None
+
+    with _client_lock:
+        if _client is not None:
+            return _client
+        host = current_app.config.get('CACHE_REDIS_HOST')
+        if not host:
+            return None
+        try:
+            client = redis.Redis(
+                host=host,
+                port=current_app.config.get('CACHE_REDIS_PORT', 6379),
+                password=current_app.config.get('CACHE_REDIS_PASSWORD') or None,
+                db=current_app.config.get('CACHE_REDIS_DB', 0),
+                socket_timeout=1,
+                socket_connect_timeout=1
+            )
+            client.ping()
+            _client = client
+            return _client
+        except Exception as e:
+            logger.error(f"Redis connection failed: {e}")
+            _retry_after = time.time() + RETRY_INTERVAL
+            return None
+
+def redis_key(*parts):
+    """Build a namespaced key that matches the cache's KEY_PREFIX."""
+    prefix = current_app.config.get('CACHE_KEY_PREFIX', '')
+    return prefix + ':'.join(str(p) for p in parts)
+
+def reset_redis_after_fork():
+    """Forget the client inherited from a parent process."""
+    global _client, _client_lock, _retry_after
+    _client = None
+    _client_lock = threading.Lock()
+    _retry_after = 0.0
@@ -2,7 +2,7 @@ import logging
 import json
 from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, jsonify, send_file
 from flask_login import login_required, current_user
-from models.db import get_db
+from models.db import get_db, release_db
 from models.user import User
 from decorators import admin_required
 import os
@@ -213,7 +213,7 @@ def delete_user():
         flash(f'Error deleting user: {e}', 'error')
         logger.error(f"Error deleting user: {e}")
     finally:
-        conn.close()
+        release_db(conn)
     
     return redirect(url_for('admin.users'))
 
@@ -221,8 +221,62 @@ def delete_user():
 @login_required
 @admin_required
 def system():
-    """System settings"""
-    return render_template('admin/system.html')
+    """System settings and application performance report"""
+    from monitoring.report import build_report, REQUEST_LOG_SIZE, WINDOWS
+    window = request.args.get('window', '1h')
+    try:
+        perf_report = build_report(window)
+    except Exception as e:
+        logger.error(f"Error building performance report: {e}")
+        perf_report = None
+    return render_template(
+        'admin/system.html',
+        perf_report=perf_report,
+        perf_windows=list(WINDOWS),
+        request_log_size=REQUEST_LOG_SIZE
+    )
+
+@admin_bp.route('/profiles')
+@login_required
+@admin_required
+def profiles():
+    """List recent request profiles"""
+    from monitoring.profiler import list_profiles
+    return render_template('admin/profiles.html', profiles=list_profiles())
+
+@admin_bp.route('/profiles/<profile_id>')
+@login_required
+@admin_required
+def download_profile(profile_id):
+    """Download a profile in folded-stack format"""
+    from monitoring.profiler import get_profile
+    folded = get_profile(profile_id)
+    if folded is None:
+        flash("Profile not found or expired.", "danger")
+        return redirect(url_for('admin.profiles'))
+    response = current_app.response_class(folded, mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename=profile_{profile_id}.folded'
+    return response
+
+@admin_bp.route('/traces')
+@login_required
+@admin_required
+def traces():
+    """List recent slow-request traces"""
+    from monitoring.tracing import list_traces
+    return render_template('admin/traces.html', traces=list_traces())
+
+@admin_bp.route('/traces/<trace_id>')
+@login_required
+@admin_required
+def trace_detail(trace_id):
+    """Show the span waterfall for one traced request"""
+    from monitoring.tracing import get_trace
+    trace = get_trace(trace_id)
+    if trace is None:
+        flash("Trace not found or expired.", "danger")
+        return redirect(url_for('admin.traces'))
+    return render_template('admin/trace_detail.html', trace=trace)
 
 @admin_bp.route('/create_backup')
 @login_required
@@ -447,7 +501,7 @@ def create_admin():
                     flash(f'Error updating user: {e}', 'error')
                 finally:
                     cursor.close()
-                    conn.close()
+                    release_db(conn)
             else:
                 # Create new admin user
                 try:
@@ -489,7 +543,7 @@ def api_user_roles():
             
             return jsonify(users)
     finally:
-        conn.close()
+        release_db(conn)
 
 @admin_bp.route('/api/update_user_roles', methods=['POST'])
 @login_required
@@ -4,9 +4,10 @@ from flask import Blueprint, flash, render_template, jsonify, request
 from flask_login import login_required, current_user
 from decorators import role_required
 import json
-from db_utils import get_db_connection
 from datetime import datetime, timedelta
 from models.db import get_db
+from models.distinct_counters import daily_distinct_users, distinct_users
+from models.tribble_rollups import get_tribble_activity
 
 logger = logging.getLogger(__name__)
 
@@ -327,6 +328,53 @@ def api_quiz_completions():
         logger.error(f"Error retrieving quiz completion data: {e}")
         return jsonify({'error': str(e)}), 500
 
+@analytics_bp.route('/search')
+@login_required
+@role_required(['analytics_viewer', 'admin'])
+def search():
+    """Full-text search over custom actions, story nodes, quizzes and questions"""
+    from models.search import SEARCH_SOURCES, search as run_search
+    query = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'actions')
+    if scope not in SEARCH_SOURCES:
+        scope = 'actions'
+    page = {'results': [], 'next_after': None}
+    try:
+        page = run_search(scope, query, after=request.args.get('after') or None)
+    except ValueError as e:
+        flash(str(e), 'warning')
+    except Exception as e:
+        logger.error(f"Error searching {scope} for {query!r}: {e}")
+        flash('Search failed. Please try again.', 'danger')
+    return render_template(
+        'analytics/search.html',
+        query=query,
+        scope=scope,
+        sources=SEARCH_SOURCES,
+        results=page['results'],
+        next_after=page['next_after']
+    )
+
+@analytics_bp.route('/api/search')
+@login_required
+@role_required(['analytics_viewer', 'admin'])
+def api_search():
+    """API endpoint for full-text search; page with the returned next_after"""
+    from models.search import search as run_search
+    try:
+        page = run_search(
+            request.args.get('scope', 'actions'),
+            request.args.get('q', ''),
+            after=request.args.get('after') or None,
+            limit=request.args.get('limit', 20, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in search API: {e}")
+        return jsonify({'error': 'Search failed'}), 500
+    return jsonify(page)
+
 @analytics_bp.route('/tribbles')
 @analytics_bp.route('/tribbles/<int:duration>')
 @analytics_bp.route('/tribbles/<int:duration>/<int:event_id>')
@@ -356,6 +404,7 @@ def tribbles(duration=48, event_id=None):
     }
     rarity_distribution = [0, 0, 0, 0]  # Common, Uncommon, Rare, Epic
     activity_data = []  # For activity chart
+    activity_resolution = 'hour'
 
     try:
         with conn.cursor() as cursor:
@@ -441,14 +490,8 @@ def tribbles(duration=48, event_id=None):
                     stats['current_event']['claimed'] = event_stats['claimed'] or 0
                     stats['current_event']['escaped'] = event_stats['escape_count'] or 0
             
-            # Count unique participants
-            cursor.execute("""
-                SELECT COUNT(DISTINCT user_id) as participant_count
-                FROM tribble_scores
-            """)
-            participant_count = cursor.fetchone()
-            if participant_count:
-                stats['participant_count'] = participant_count['participant_count'] or 0
+            # Count unique participants (HyperLogLog estimate)
+            stats['participant_count'] = distinct_users('tribble_participants')
             
             # Get rarity distribution
             cursor.execute("""
@@ -549,29 +592,10 @@ def tribbles(duration=48, event_id=None):
                     'score': score
                 })
             
-            # Get activity data with hourly precision for the specified duration
-            cursor.execute("""
-                SELECT 
-                    DATE_FORMAT(captured_at, '%%Y-%%m-%%d %%H:00:00') as time_period,
-                    COUNT(*) as total,
-                    SUM(CASE WHEN claimed_by IS NOT NULL AND is_escaped = 0 THEN 1 ELSE 0 END) as claimed,
-                    SUM(CASE WHEN is_escaped = 1 THEN 1 ELSE 0 END) as `escaped`
-                FROM tribble_drops
-                WHERE captured_at IS NOT NULL
-                AND captured_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
-                GROUP BY time_period
-                ORDER BY time_period ASC
-            """, (duration,))
-            activity_results = cursor.fetchall()
-            
-            # Process the activity data
-            for result in activity_results:
-                activity_data.append({
-                    'time_period': result['time_period'],
-                    'total': result['total'],
-                    'claimed': result['claimed'] or 0,
-                    'escaped': result['escaped'] or 0
-                })
+            # Activity chart from the rollups, at a resolution that bounds the point count
+            activity = get_tribble_activity(duration, event_id)
+            activity_data = activity['points']
+            activity_resolution = activity['resolution']
                 
     except Exception as e:
         logger.error(f"Error fetching tribble hunt analytics: {e}", exc_info=True)
@@ -587,6 +611,7 @@ def tribbles(duration=48, event_id=None):
         event_id=event_id,
         rarity_distribution=rarity_distribution,
         activity_data=activity_data,
+        activity_resolution=activity_resolution,
         all_events=all_events,
         current_event_id=event_id
     )
@@ -610,9 +635,8 @@ def get_summary_metrics():
             cursor.execute("SELECT COUNT(*) as count FROM user_scores")
             total_attempts = cursor.fetchone()['count']
             
-            # Total users
-            cursor.execute("SELECT COUNT(DISTINCT user_id) as count FROM user_scores")
-            total_users = cursor.fetchone()['count']
+            # Total users (HyperLogLog estimate)
+            total_users = distinct_users('quiz_users')
             
             # Average score
             cursor.execute("""
@@ -637,13 +661,20 @@ def get_summary_metrics():
             avg_score = result['avg_score_percentage'] or 0
             
             # Quiz attempts today
+            # (half-open ranges instead of DATE(completion_date) so the index is usable)
             today = datetime.now().date()
-            cursor.execute("SELECT COUNT(*) as count FROM user_scores WHERE DATE(completion_date) = %s", (today,))
+            cursor.execute(
+                "SELECT COUNT(*) as count FROM user_scores WHERE completion_date >= %s AND completion_date < %s",
+                (today, today + timedelta(days=1))
+            )
             attempts_today = cursor.fetchone()['count']
             
             # Calculate daily trend (% increase/decrease from yesterday)
             yesterday = today - timedelta(days=1)
-            cursor.execute("SELECT COUNT(*) as count FROM user_scores WHERE DATE(completion_date) = %s", (yesterday,))
+            cursor.execute(
+                "SELECT COUNT(*) as count FROM user_scores WHERE completion_date >= %s AND completion_date < %s",
+                (yesterday, today)
+            )
             attempts_yesterday = cursor.fetchone()['count']
             
             if attempts_yesterday > 0:
@@ -844,45 +875,16 @@ def get_quiz_activity(days=30):
 
 def get_user_activity(days=30):
     """Get user activity over time"""
-    conn = get_db()
-    
     try:
-        with conn.cursor() as cursor:
-            # Calculate date range
-            end_date = datetime.now().date()
-            start_date = end_date - timedelta(days=days-1)
-            
-            # Query unique users by date
-            query = """
-            SELECT DATE(completion_date) as date, COUNT(DISTINCT user_id) as count
-            FROM user_scores
-            WHERE completion_date >= %s AND completion_date < %s
-            GROUP BY DATE(completion_date)
-            ORDER BY date
-            """
-            cursor.execute(query, (start_date, end_date + timedelta(days=1)))
-            activity_data = cursor.fetchall()
-            
-            # Create a lookup dictionary
-            date_range = []
-            current_date = start_date
-            while current_date <= end_date:
-                date_range.append(current_date)
-                current_date += timedelta(days=1)
-            
-            # Convert to dictionary for easier lookup
-            activity_by_date = {entry['date'].isoformat(): entry['count'] for entry in activity_data}
-            
-            # Format for chart
-            result = []
-            for date in date_range:
-                date_str = date.isoformat()
-                result.append({
-                    'date': date_str,
-                    'count': activity_by_date.get(date_str, 0)
-                })
-            
-            return result
+        # Calculate date range
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days-1)
+        
+        # Unique users by date from the per-day HyperLogLogs
+        activity_by_date = daily_distinct_users('quiz_users', start_date, end_date)
+        
+        # Format for chart
+        return [{'date': date_str, 'count': count} for date_str, count in activity_by_date.items()]
     except Exception as e:
         logger.error(f"Error getting user activity: {e}")
-        return [] 
\ No newline at end of file
+        return []
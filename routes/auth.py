@@ -6,7 +6,6 @@ import time
 import random
 from flask import Blueprint, request, redirect, url_for, session, flash, render_template, current_app, make_response
 from flask_login import login_user, logout_user, login_required, current_user
-from requests_oauthlib import OAuth2Session
 from models.user import User
 
 # Set environment variable to allow OAuth2 over HTTP (for development only)
@@ -33,6 +32,7 @@ def token_updater(token):
 
 def make_discord_session(token=None, state=None, scope=None):
     """Create a Discord OAuth2Session."""
+    from requests_oauthlib import OAuth2Session
     client_id = current_app.config['DISCORD_CLIENT_ID']
     # Get redirect URI from app config
     redirect_uri = current_app.config['DISCORD_REDIRECT_URI']
@@ -1,9 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+import json
+from flask import Blueprint, Response, jsonify, render_template, redirect, stream_with_context, url_for, request, flash
 from flask_login import login_required, current_user
 from models.kobayashi import (
     get_all_stories, get_story, create_story, update_story, delete_story,
-    get_nodes_for_story, get_node, create_node, update_node, delete_node
+    get_nodes_for_story, count_nodes_for_story, get_node, create_node, update_node, delete_node
 )
+from models.story_graph import compile_node, decode_json_field, get_story_graph
 
 kobayashi_bp = Blueprint('kobayashi', __name__, url_prefix='/kobayashi')
 
@@ -53,6 +55,56 @@ def delete_story_route(story_id):
     flash('Story deleted.', 'success')
     return redirect(url_for('kobayashi.stories'))
 
+# --- Story bundles ---
+@kobayashi_bp.route('/stories/<int:story_id>/export')
+@login_required
+def export_story(story_id):
+    from models.story_bundle import iter_bundle
+    chunks = iter_bundle(story_id)
+    if chunks is None:
+        flash('Story not found.', 'danger')
+        return redirect(url_for('kobayashi.stories'))
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/json',
+        headers={'Content-Disposition': f'attachment; filename=story-{story_id}.json'}
+    )
+
+@kobayashi_bp.route('/stories/import', methods=['GET', 'POST'])
+@login_required
+def import_story():
+    if request.method == 'POST':
+        from models.story_bundle import BundleError, import_bundle
+        # Accept a raw JSON body (scripts) or an uploaded bundle file (the form)
+        errors = []
+        bundle = None
+        if request.is_json:
+            bundle = request.get_json(silent=True)
+        elif request.files.get('bundle'):
+            try:
+                bundle = json.load(request.files['bundle'])
+            except ValueError as e:
+                errors.append(f'Bundle is not valid JSON: {e}')
+        if bundle is None and not errors:
+            errors.append('No bundle provided')
+        if not errors:
+            author = getattr(current_user, 'username', 'Unknown')
+            try:
+                result = import_bundle(bundle, author)
+            except BundleError as e:
+                errors = e.errors
+        if request.is_json:
+            if errors:
+                return jsonify({'error': 'Invalid bundle', 'errors': errors}), 400
+            return jsonify({'success': True, **result})
+        if errors:
+            for error in errors:
+                flash(error, 'danger')
+            return render_template('kobayashi/story_import.html')
+        flash(f"Story imported with {result['node_count']} nodes.", 'success')
+        return redirect(url_for('kobayashi.nodes', story_id=result['story_id']))
+    return render_template('kobayashi/story_import.html')
+
 # --- Node CRUD ---
 @kobayashi_bp.route('/stories/<int:story_id>/nodes')
 @login_required
@@ -61,27 +113,19 @@ def nodes(story_id):
     if not story:
         flash('Story not found.', 'danger')
         return redirect(url_for('kobayashi.stories'))
-    import json
-    nodes = get_nodes_for_story(story_id)
-    # Parse choices JSON for each node
-    for node in nodes:
-        if 'choices' in node and node['choices']:
-            try:
-                node['choices_dict'] = json.loads(node['choices'])
-            except Exception:
-                node['choices_dict'] = {}
-        else:
-            node['choices_dict'] = {}
     # Pagination logic
     try:
-        page = int(request.args.get('page', 1))
+        page = max(int(request.args.get('page', 1)), 1)
     except Exception:
         page = 1
     per_page = 15
-    total = len(nodes)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_nodes = nodes[start:end]
+    # Next links carry the last id shown so the following page is a keyset seek
+    after_id = request.args.get('after') or None
+    total = count_nodes_for_story(story_id)
+    paginated_nodes = get_nodes_for_story(story_id, limit=per_page, offset=(page - 1) * per_page, after_id=after_id)
+    # Parse choices only for the nodes being rendered
+    for node in paginated_nodes:
+        node['choices_dict'] = compile_node(node)['choices']
     class Pagination:
         def __init__(self, page, per_page, total):
             self.page = page
@@ -92,6 +136,7 @@ def nodes(story_id):
             self.has_next = page < self.pages
             self.prev_num = page - 1
             self.next_num = page + 1
+            self.next_after = paginated_nodes[-1]['id'] if paginated_nodes else None
     pagination = Pagination(page, per_page, total)
     return render_template('kobayashi/nodes.html', story=story, nodes=paginated_nodes, pagination=pagination)
 
@@ -132,7 +177,11 @@ def create_node_route(story_id):
             flash('Node ID and Title are required.', 'danger')
             return render_template('kobayashi/node_form.html', story=story, node=node_data)
         print(node_data)
-        create_node(story_id, node_data)
+        try:
+            create_node(story_id, node_data)
+        except ValueError as e:
+            flash(f'Invalid node data: {e}', 'danger')
+            return render_template('kobayashi/node_form.html', story=story, node=node_data)
         flash('Node created.', 'success')
         return redirect(url_for('kobayashi.nodes', story_id=story_id))
     return render_template('kobayashi/node_form.html', story=story, node=None)
@@ -151,24 +200,13 @@ def edit_node_route(node_id):
     node_data = None
     try:
         node_data = json.loads(node['content']) if node and 'content' in node else node
-        # Helper to robustly decode JSON (handles double-encoded strings)
-        def robust_json_loads(val):
-            import json
-            tries = 0
-            while isinstance(val, str) and tries < 3:
-                try:
-                    val = json.loads(val)
-                except Exception:
-                    break
-                tries += 1
-            return val
         # Ensure choices and conditions are present and correct type (robust)
         if 'choices' in node_data:
-            node_data['choices'] = robust_json_loads(node_data['choices'])
+            node_data['choices'] = decode_json_field(node_data['choices'], {})
         if 'choices' not in node_data or not isinstance(node_data['choices'], dict):
             node_data['choices'] = {}
         if 'conditions' in node_data:
-            node_data['conditions'] = robust_json_loads(node_data['conditions'])
+            node_data['conditions'] = decode_json_field(node_data['conditions'], [])
         if 'conditions' not in node_data or not isinstance(node_data['conditions'], list):
             node_data['conditions'] = []
     except Exception:
@@ -213,7 +251,11 @@ def edit_node_route(node_id):
     print("DEBUG: node_data['choices'] =", node_data.get('choices'))
     if request.method == 'POST':
         from models.kobayashi import update_node
-        update_node(node_id, node_data)
+        try:
+            update_node(node_id, node_data)
+        except ValueError as e:
+            flash(f'Invalid node data: {e}', 'danger')
+            return render_template('kobayashi/node_form.html', story=story, node=node_data)
         flash('Node updated.', 'success')
         return redirect(url_for('kobayashi.nodes', story_id=story['id']))
     return render_template('kobayashi/node_form.html', story=story, node=node_data)
@@ -234,106 +276,120 @@ def delete_node_route(node_id):
 @kobayashi_bp.route('/simulate/<int:story_id>', methods=['GET', 'POST'])
 @login_required
 def simulate(story_id):
-    import json
     story = get_story(story_id)
-    nodes = get_nodes_for_story(story_id)
+    graph = get_story_graph(story_id)
+    nodes = graph['nodes']
     simulation_history = []
     # Track flags set during simulation
     flags_set = []
     # Find the current node id and flags from form or start at first
-    current_node_id = None
-    if 'current_node_id' in (getattr(request, 'form', {}) or {}):
-        current_node_id = request.form.get('current_node_id')
-    if 'flags_set' in (getattr(request, 'form', {}) or {}):
+    current_node_id = request.form.get('current_node_id') or graph['start']
+    if 'flags_set' in request.form:
         flags_set = json.loads(request.form.get('flags_set', '[]'))
-    if not current_node_id:
-        current_node = nodes[0] if nodes else None
-    else:
-        current_node = next((n for n in nodes if n['id'] == current_node_id), nodes[0] if nodes else None)
-    # Parse choices
-    if current_node:
-        choices_raw = current_node.get('choices', '{}')
-        for _ in range(2):
-            if isinstance(choices_raw, str):
-                try:
-                    choices_raw = json.loads(choices_raw)
-                except Exception:
-                    break
-        if isinstance(choices_raw, dict):
-            current_node['choices'] = choices_raw
-        else:
-            current_node['choices'] = {}
+    current_node = nodes.get(current_node_id) or nodes.get(graph['start'])
     # POST: advance to next node if choice made
     if request.method == 'POST' and current_node:
-        choice_key = request.form.get('choice')
-        choice = current_node['choices'].get(choice_key)
+        choice = current_node['choices'].get(request.form.get('choice'))
         if choice:
             # Add any flags set by this choice
-            flags_to_add = choice.get('flags_set', [])
-            for flag in flags_to_add:
+            for flag in choice['flags_set']:
                 if flag not in flags_set:
                     flags_set.append(flag)
-            next_node_id = choice.get('next')
-            # Find next node
-            next_node = next((n for n in nodes if n['id'] == next_node_id), None)
-            if next_node:
-                current_node = next_node
-                # Parse choices for new node
-                choices_raw = current_node.get('choices', '{}')
-                for _ in range(2):
-                    if isinstance(choices_raw, str):
-                        try:
-                            choices_raw = json.loads(choices_raw)
-                        except Exception:
-                            break
-                if isinstance(choices_raw, dict):
-                    current_node['choices'] = choices_raw
-                else:
-                    current_node['choices'] = {}
-    # Ensure endingtype and endingtext are available for terminal nodes
-    endingtype = None
-    endingtext = None
-    if current_node and current_node.get('is_terminal'):
-        endingtype = current_node.get('ending_type') or current_node.get('endingtype')
-        endingtext = current_node.get('ending_text') or current_node.get('endingtext')
-        current_node['endingtype'] = endingtype
-        current_node['endingtext'] = endingtext
+            current_node = nodes.get(choice['next'], current_node)
+    if current_node:
+        # The compiled node is shared; hand the template its own copy
+        current_node = dict(current_node)
+        # Ensure endingtype and endingtext are available for terminal nodes
+        if current_node['is_terminal']:
+            current_node['endingtype'] = current_node['ending_type']
+            current_node['endingtext'] = current_node['ending_text']
     return render_template(
         'kobayashi/simulate.html',
         story=story,
-        nodes=nodes,
         current_node=current_node,
         simulation_history=simulation_history,
         flags_set=flags_set
     )
 
+@kobayashi_bp.route('/stories/<int:story_id>/explore')
+@login_required
+def explore(story_id):
+    story = get_story(story_id)
+    if not story:
+        flash('Story not found.', 'danger')
+        return redirect(url_for('kobayashi.stories'))
+    from models.story_explorer import get_story_exploration
+    report = get_story_exploration(story_id)
+    return render_template('kobayashi/explore.html', story=story, report=report)
+
+@kobayashi_bp.route('/stories/<int:story_id>/funnel')
+@login_required
+def funnel(story_id):
+    story = get_story(story_id)
+    if not story:
+        flash('Story not found.', 'danger')
+        return redirect(url_for('kobayashi.stories'))
+    from models.choice_transitions import REQUEST_MAX_BATCHES, get_story_funnel, refresh_transitions
+    try:
+        refresh_transitions(max_batches=REQUEST_MAX_BATCHES)
+    except Exception as e:
+        flash(f'Could not refresh choice transitions: {e}', 'warning')
+    return render_template('kobayashi/funnel.html', story=story, funnel=get_story_funnel(story_id))
+
+# --- Run inspection ---
+@kobayashi_bp.route('/runs/<run_id>')
+@login_required
+def run_timeline(run_id):
+    from models.run_timeline import iter_run_timeline
+    story, events = iter_run_timeline(run_id)
+    events = list(events)
+    if not events:
+        flash('No activity recorded for that run.', 'warning')
+        return redirect(url_for('kobayashi.analytics'))
+    summary = {
+        'choices': sum(1 for e in events if e['type'] == 'choice'),
+        'custom_actions': sum(1 for e in events if e['type'] == 'custom_action'),
+        'points': sum(e['points'] or 0 for e in events if e['type'] == 'points'),
+        'user_id': events[0]['user_id'],
+        'started': events[0]['timestamp'],
+        'finished': events[-1]['timestamp'],
+    }
+    return render_template('kobayashi/run_timeline.html', run_id=run_id, story=story, events=events, summary=summary)
+
+@kobayashi_bp.route('/runs/<run_id>/timeline')
+@login_required
+def run_timeline_events(run_id):
+    """Stream a run's events as newline-delimited JSON, oldest first."""
+    from models.run_timeline import iter_run_timeline
+    _, events = iter_run_timeline(run_id)
+
+    def generate():
+        for event in events:
+            yield json.dumps(event, default=lambda v: v.isoformat() if hasattr(v, 'isoformat') else str(v)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # --- Analytics ---
 @kobayashi_bp.route('/analytics')
 @login_required
 def analytics():
-    from models.kobayashi_analytics import (
-        get_story_run_stats,
-        get_choice_distribution,
-        get_user_participation,
-        get_analytics_summary,
-        get_custom_actions
-    )
+    from models.kobayashi_analytics import get_custom_actions
+    from models.kobayashi_snapshot import get_analytics_snapshot
     
     # Get page and filter parameters
     page = request.args.get('page', 1, type=int)
     run_id = request.args.get('run_id', None)
     
-    # Get analytics data from the database
-    story_stats = get_story_run_stats()
-    choice_stats = get_choice_distribution()
-    user_participation = get_user_participation()
-    summary = get_analytics_summary()
+    # Aggregates come from the precomputed snapshot; only custom actions are live
+    snapshot = get_analytics_snapshot()
     custom_actions = get_custom_actions(page=page, per_page=10, run_id=run_id)
     
     return render_template('kobayashi/analytics.html', 
-                           story_stats=story_stats,
-                           choice_stats=choice_stats,
-                           user_participation=user_participation,
-                           summary=summary,
+                           story_stats=snapshot['story_stats'],
+                           choice_stats=snapshot['choice_stats'],
+                           user_participation=snapshot['user_participation'],
+                           summary=snapshot['summary'],
+                           snapshot_built_at=snapshot['built_at'],
+                           snapshot_stale=snapshot['stale'],
                            custom_actions=custom_actions,
                            run_id=run_id)
@@ -0,0 +1,118 @@
+"""
+Tests for the incremental choice transition fold.
+
+The fold only talks to MySQL through a cursor, so these tests drive
+models.choice_transitions._fold_batch with an in-memory stand-in for
+player_choices, dashboard_counted_choices and dashboard_choice_transitions.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+from collections import Counter
+
+from models import choice_transitions
+from models.choice_transitions import END_OF_RUN, _fold_batch
+
+class FakeCursor:
+    """Answers the statements _fold_batch issues from in-memory tables."""
+
+    def __init__(self):
+        self.choices = []  # visible player_choices rows
+        self.counted = set()
+        self.transitions = Counter()
+        self._result = []
+
+    def add_choice(self, id, run_id, node_id, choice, story_code='KOB'):
+        self.choices.append({'id': id, 'run_id': run_id, 'story_code': story_code,
+                             'node_id': node_id, 'choice': choice})
+
+    def execute(self, sql, params=()):
+        if 'LEFT JOIN dashboard_counted_choices' in sql:
+            low, limit = params
+            rows = sorted((row for row in self.choices if row['id'] > low and row['id'] not in self.counted),
+                          key=lambda row: row['id'])
+            self._result = [dict(row) for row in rows[:limit]]
+        elif 'ROW_NUMBER()' in sql:
+            cutoffs = dict(zip(params[::2], params[1::2]))
+            latest = {}
+            for row in sorted(self.choices, key=lambda row: row['id']):
+                if row['run_id'] in cutoffs and row['id'] < cutoffs[row['run_id']]:
+                    latest[row['run_id']] = row
+            self._result = [{'run_id': run_id, 'node_id': row['node_id'], 'choice': row['choice']}
+                            for run_id, row in latest.items()]
+        elif sql.startswith('DELETE FROM dashboard_counted_choices'):
+            self.counted = {id for id in self.counted if id > params[0]}
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def executemany(self, sql, rows):
+        if 'dashboard_choice_transitions' in sql:
+            for story_code, node_id, choice, next_node_id, count in rows:
+                self.transitions[(story_code, node_id, choice, next_node_id)] += count
+        elif 'dashboard_counted_choices' in sql:
+            self.counted.update(id for (id,) in rows)
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def fetchall(self):
+        return self._result
+
+    def fold_all(self, watermark):
+        while True:
+            watermark, count = _fold_batch(self, watermark)
+            if not count:
+                return watermark
+
+    def matrix(self):
+        return {key: count for key, count in self.transitions.items() if count}
+
+class FoldBatchTests(unittest.TestCase):
+
+    def test_runs_in_id_order(self):
+        cursor = FakeCursor()
+        cursor.add_choice(1, 'KOB_a_1', 'n1', 'x')
+        cursor.add_choice(2, 'KOB_a_1', 'n2', 'y')
+        self.assertEqual(cursor.fold_all(0), 2)
+        self.assertEqual(cursor.matrix(), {
+            ('KOB', 'n1', 'x', 'n2'): 1,
+            ('KOB', 'n2', 'y', END_OF_RUN): 1,
+        })
+
+    def test_late_row_before_counted_rows_of_another_run(self):
+        cursor = FakeCursor()
+        cursor.add_choice(1, 'KOB_a_1', 'n1', 'x')
+        cursor.add_choice(2, 'KOB_b_1', 'n1', 'y')
+        # id 3 (run a) is still uncommitted when id 4 (run b) is folded
+        cursor.add_choice(4, 'KOB_b_1', 'n2', 'z')
+        watermark = cursor.fold_all(0)
+        self.assertEqual(watermark, 4)
+
+        cursor.add_choice(3, 'KOB_a_1', 'n2', 'w')
+        cursor.add_choice(5, 'KOB_b_1', 'n3', 'v')
+        # One batch now holds the late id 3 followed by run b's id 5, whose
+        # previous choice (id 4) is counted but above the batch's first id
+        self.assertEqual(cursor.fold_all(watermark), 5)
+        self.assertEqual(cursor.matrix(), {
+            ('KOB', 'n1', 'x', 'n2'): 1,
+            ('KOB', 'n2', 'w', END_OF_RUN): 1,
+            ('KOB', 'n1', 'y', 'n2'): 1,
+            ('KOB', 'n2', 'z', 'n3'): 1,
+            ('KOB', 'n3', 'v', END_OF_RUN): 1,
+        })
+
+    def test_rows_below_the_rescan_window_are_not_refolded(self):
+        cursor = FakeCursor()
+        cursor.add_choice(1, 'KOB_a_1', 'n1', 'x')
+        watermark = cursor.fold_all(0)
+        cursor.add_choice(choice_transitions.RESCAN_WINDOW + 2, 'KOB_a_1', 'n2', 'y')
+        cursor.fold_all(watermark)
+        self.assertNotIn(1, cursor.counted)
+        self.assertEqual(cursor.fold_all(choice_transitions.RESCAN_WINDOW + 2), choice_transitions.RESCAN_WINDOW + 2)
+        self.assertEqual(cursor.matrix(), {
+            ('KOB', 'n1', 'x', 'n2'): 1,
+            ('KOB', 'n2', 'y', END_OF_RUN): 1,
+        })
+
+if __name__ == '__main__':
+    unittest.main()